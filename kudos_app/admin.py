@@ -1,5 +1,54 @@
+from django.conf import settings
 from django.contrib import admin
-from .models import Organization, User, Kudo
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.shortcuts import redirect
+from django.utils import timezone
+from django.utils.functional import cached_property
+from django.utils.http import urlencode
+from . import search
+from .models import Organization, User, Kudo, WeeklyActivity, WeeklyQuota
+
+
+class CappedCountPaginator(Paginator):
+    """
+    Counts at most ``KUDOS_ADMIN_COUNT_LIMIT`` rows.
+
+    An exact COUNT(*) reads the whole table (or the whole filtered range);
+    ``SELECT COUNT(*) FROM (... LIMIT n)`` stops after n rows. Past the limit
+    the changelist reports the limit and stops offering further pages.
+    """
+
+    @cached_property
+    def count(self):
+        limit = getattr(settings, 'KUDOS_ADMIN_COUNT_LIMIT', 10000)
+        return self.object_list.order_by()[:limit].count()
+
+
+class ScalableModelAdmin(admin.ModelAdmin):
+    """Changelist defaults for tables too large to count or to render with a query per row"""
+    paginator = CappedCountPaginator
+    # Otherwise every changelist also runs an unfiltered COUNT(*) for the "N total" link
+    show_full_result_count = False
+
+
+class OrganizationListFilter(admin.SimpleListFilter):
+    """
+    Filter kudos by the sender's organization.
+
+    Filters on ``sender_id IN (organization's users)`` so SQLite can seek the
+    (sender, created_at) index instead of joining every kudo to its sender.
+    """
+    title = 'sender organization'
+    parameter_name = 'organization'
+
+    def lookups(self, request, model_admin):
+        return Organization.objects.order_by('name').values_list('id', 'name')
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(sender__in=User.objects.filter(organization_id=self.value()).values('id'))
+        return queryset
 
 
 @admin.register(Organization)
@@ -9,14 +58,60 @@ class OrganizationAdmin(admin.ModelAdmin):
 
 
 @admin.register(User)
-class UserAdmin(admin.ModelAdmin):
-    list_display = ['username', 'email', 'organization', 'created_at']
-    list_filter = ['organization', 'created_at']
+class UserAdmin(ScalableModelAdmin):
+    list_display = ['username', 'email', 'organization', 'is_active', 'created_at']
+    list_filter = ['is_active', 'organization', 'created_at']
+    list_select_related = ['organization']
+    autocomplete_fields = ['organization']
     search_fields = ['username', 'email']
 
 
 @admin.register(Kudo)
-class KudoAdmin(admin.ModelAdmin):
+class KudoAdmin(ScalableModelAdmin):
     list_display = ['sender', 'receiver', 'message', 'created_at']
-    list_filter = ['created_at', 'sender__organization']
-    search_fields = ['sender__username', 'receiver__username', 'message']
+    list_filter = ['created_at', OrganizationListFilter]
+    list_select_related = ['sender__organization', 'receiver__organization']
+    raw_id_fields = ['sender', 'receiver']
+    date_hierarchy = 'created_at'
+    search_fields = ['sender__username', 'receiver__username']
+    search_help_text = 'Sender or receiver username, or words in the message'
+
+    def changelist_view(self, request, extra_context=None):
+        # Open on the current month so the first page, its count and the date drill-down
+        # all read one range of the created_at index instead of the whole table
+        if request.method == 'GET' and not request.GET:
+            today = timezone.localdate()
+            query = {'created_at__year': today.year, 'created_at__month': today.month}
+            return redirect(f'{request.path}?{urlencode(query)}')
+        return super().changelist_view(request, extra_context)
+
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        # Match usernames in a subquery rather than LIKE across two joins, so each side
+        # can seek its (sender|receiver, created_at) index. The message is matched
+        # through the FTS index, not with LIKE '%term%'.
+        users = User.objects.filter(username__icontains=search_term).values('id')
+        matches = Q(sender__in=users) | Q(receiver__in=users)
+        if search.fts_query(search_term):
+            matches |= Q(id__in=search.message_match(search_term))
+        return queryset.filter(matches), False
+
+
+@admin.register(WeeklyQuota)
+class WeeklyQuotaAdmin(ScalableModelAdmin):
+    list_display = ['user', 'week_start', 'used']
+    list_filter = ['week_start']
+    list_select_related = ['user__organization']
+    raw_id_fields = ['user']
+    search_fields = ['user__username']
+
+
+@admin.register(WeeklyActivity)
+class WeeklyActivityAdmin(ScalableModelAdmin):
+    list_display = ['user', 'organization', 'week_start', 'sent', 'received']
+    list_filter = ['week_start']
+    list_select_related = ['user__organization', 'organization']
+    raw_id_fields = ['user', 'organization']
+    search_fields = ['user__username']
@@ -0,0 +1,47 @@
+"""
+Cold storage for old kudos.
+
+``archive_kudos`` moves kudos older than the retention window from ``Kudo``
+into ``ArchivedKudo`` on the same database (each shard archives its own
+organizations). The hot table and its indexes then only cover recent kudos,
+which is all the quota ledger, search and the first pages of the received
+list read. Batches are moved in id order, each in its own transaction, so a
+run can be interrupted and restarted.
+
+Every archived kudo is older than every hot kudo. The received list relies on
+that: it reads the hot table and only queries the archive once a page runs
+past the oldest hot kudo.
+"""
+from django.db import transaction
+from .models import ArchivedKudo, Kudo
+
+
+ARCHIVE_FIELDS = ('id', 'sender_id', 'receiver_id', 'message', 'created_at')
+
+# The quota ledger and the current week's leaderboard read this week's kudos,
+# so the retention window may not reach into it
+MIN_RETENTION_DAYS = 7
+
+
+def archive_kudos(kudo_ids, using='default'):
+    """Move the given kudos to the archive in one transaction; returns how many moved"""
+    with transaction.atomic(using=using):
+        rows = list(Kudo.objects.using(using).filter(id__in=kudo_ids).values(*ARCHIVE_FIELDS))
+        ArchivedKudo.objects.using(using).bulk_create([ArchivedKudo(**row) for row in rows])
+        Kudo.objects.using(using).filter(id__in=[row['id'] for row in rows]).delete()
+    return len(rows)
+
+
+def archive_before(cutoff, using='default', batch_size=1000):
+    """Archive kudos created before ``cutoff`` in batches, yielding the running total after each"""
+    # Keyset on the primary key: ids are unique, so each batch resumes right after the
+    # last id moved with no created_at ties to break
+    kudos = Kudo.objects.using(using).filter(created_at__lt=cutoff).order_by('id')
+    moved = after = 0
+    while True:
+        batch = list(kudos.filter(id__gt=after).values_list('id', flat=True)[:batch_size])
+        if not batch:
+            return
+        moved += archive_kudos(batch, using)
+        after = batch[-1]
+        yield moved
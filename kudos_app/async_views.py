@@ -0,0 +1,229 @@
+"""
+Native async versions of the read endpoints, for deployments served through
+``kudos_backend/asgi.py``.
+
+These are plain Django async views rather than DRF views (DRF views are
+synchronous and would hold an executor thread for the whole request). They
+reuse the same serializers, paginators and caches, and use the async ORM. The
+async ORM runs every query on Django's single thread-sensitive executor, so
+the queries of one request still run one after another. What ASGI saves is a
+thread per waiting request, not query latency. Responses are rendered
+with the same renderer as the DRF views so they match the synchronous endpoints byte for
+byte. They are mounted under ``/api/async/`` and replace the synchronous read
+views on the main routes when ``KUDOS_ASYNC_READS`` is enabled.
+
+``kudos_stream`` (the Server-Sent Events feed at ``/api/kudos/stream/``) only
+exists here: it holds its connection open, which needs the ASGI server.
+"""
+import asyncio
+import functools
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, HttpResponseNotAllowed, StreamingHttpResponse
+from rest_framework import status
+from rest_framework.request import Request
+from . import directory, events, sharding
+from .identity import aget_user, aresolve_request_user, parse_user_id
+from .models import Organization, User, Kudo, ArchivedKudo, WeeklyQuota
+from .pagination import KudoCursorPagination, UserCursorPagination
+from .renderers import OrJSONRenderer
+from .serializers import (
+    OrganizationSerializer, UserSerializer, kudo_values, serialize_kudo_rows, user_simple_values
+)
+
+
+EMPTY_PAGE = {'next': None, 'previous': None, 'results': []}
+
+STREAM_KEEPALIVE = getattr(settings, 'KUDOS_STREAM_KEEPALIVE', 15)
+STREAM_MAX_AGE = getattr(settings, 'KUDOS_STREAM_MAX_AGE', 300)
+STREAM_RETRY_MS = 3000
+
+
+def json_response(data, status_code=status.HTTP_200_OK, headers=None):
+    if data is None:
+        return HttpResponse(status=status_code, headers=headers)
+    return HttpResponse(OrJSONRenderer().render(data), status=status_code,
+                        content_type='application/json', headers=headers)
+
+
+def async_get_only(view):
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return HttpResponseNotAllowed(['GET'])
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+async def paginated_data(paginator, rows, request, serialize=list):
+    """Paginate a ``.values()`` queryset; ``serialize`` turns the page's rows into response items"""
+    page = await paginator.apaginate_queryset(rows, Request(request))
+    return paginator.get_paginated_response(serialize(page)).data
+
+
+@async_get_only
+async def current_user(request):
+    """Get current user information including remaining kudos"""
+    if not request.headers.get('X-User-ID'):
+        return json_response({'error': 'X-User-ID header required'}, status.HTTP_400_BAD_REQUEST)
+
+    user_id = parse_user_id(request.headers.get('X-User-ID'))
+    if user_id is None:
+        return json_response({'error': 'Invalid user ID'}, status.HTTP_404_NOT_FOUND)
+
+    user = await aget_user(user_id)
+    if user is None or not user.is_active:
+        return json_response({'error': 'Invalid user ID'}, status.HTTP_404_NOT_FOUND)
+    # The quota ledger lives on the organization's shard
+    shard = await sharding.adb_for_organization(user.organization_id)
+    remaining_kudos = await WeeklyQuota.aremaining_for(user_id, using=shard)
+
+    serializer = UserSerializer(user, context={'remaining_kudos': remaining_kudos})
+    return json_response(serializer.data)
+
+
+@async_get_only
+async def user_list(request):
+    """List all users in the same organization as the current user"""
+    _, user = await aresolve_request_user(request)
+    if user is None:
+        return json_response(EMPTY_PAGE)
+
+    async def build():
+        queryset = User.objects.filter(organization_id=user.organization_id, is_active=True).exclude(id=user.id)
+        return status.HTTP_200_OK, await paginated_data(UserCursorPagination(), user_simple_values(queryset), request)
+
+    status_code, data, headers = await directory.acached_snapshot(request, user.organization_id, build, vary=user.id)
+    return json_response(data, status_code, headers)
+
+
+@async_get_only
+async def kudos_received(request):
+    """List all kudos received by the current user"""
+    _, user = await aresolve_request_user(request)
+    if user is None:
+        return json_response(EMPTY_PAGE)
+
+    shard = await sharding.adb_for_organization(user.organization_id)
+    # Archived kudos are only read once the page runs past the hot ones
+    querysets = [kudo_values(model.objects.using(shard).filter(receiver=user)) for model in (Kudo, ArchivedKudo)]
+    paginator = KudoCursorPagination()
+    page = await paginator.apaginate_querysets(querysets, Request(request))
+    return json_response(paginator.get_paginated_response(serialize_kudo_rows(page)).data)
+
+
+@async_get_only
+async def organizations_list(request):
+    async def build():
+        organizations = [organization async for organization in Organization.objects.all()]
+        return status.HTTP_200_OK, OrganizationSerializer(organizations, many=True).data
+
+    status_code, data, headers = await directory.acached_snapshot(request, directory.ORGANIZATIONS_SCOPE, build)
+    return json_response(data, status_code, headers)
+
+
+@async_get_only
+async def users_by_organization(request, org_id):
+    async def build():
+        queryset = user_simple_values(User.objects.filter(organization_id=org_id, is_active=True))
+        if not await Organization.objects.filter(id=org_id).aexists():
+            return status.HTTP_404_NOT_FOUND, {'error': 'Organization not found'}
+        return status.HTTP_200_OK, await paginated_data(UserCursorPagination(), queryset, request)
+
+    status_code, data, headers = await directory.acached_snapshot(request, org_id, build)
+    return json_response(data, status_code, headers)
+
+
+class KudoStream:
+    """
+    Async iterable of SSE frames for one connection: first the kudos after
+    ``position`` (when resuming), then live kudos as they are published.
+    Waiting for new kudos runs no queries. Django calls ``close()`` when the
+    response finishes, which drops the subscription.
+    """
+
+    def __init__(self, user_id, position, using='default'):
+        self.user_id = user_id
+        self.position = position
+        self.using = using
+        # Subscribe before the catch-up query so nothing committed in between is lost
+        self.subscription = events.broker.subscribe(user_id)
+
+    def __aiter__(self):
+        return self.frames()
+
+    def close(self):
+        events.broker.unsubscribe(self.subscription)
+
+    async def frames(self):
+        try:
+            # Also flushes the response headers so the client knows it is connected
+            yield f'retry: {STREAM_RETRY_MS}\n\n'.encode('ascii')
+            if self.position is not None:
+                async for frame in self.catch_up():
+                    yield frame
+
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + STREAM_MAX_AGE
+            # An overflowed mailbox ends the stream; the client resumes from its Last-Event-ID
+            while not self.subscription.overflowed:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    event = await self.subscription.get(min(STREAM_KEEPALIVE, remaining))
+                except asyncio.TimeoutError:
+                    yield b': keepalive\n\n'
+                    continue
+                # Skip kudos already sent during the catch-up
+                if self.position is not None and event.position <= self.position:
+                    continue
+                self.position = event.position
+                yield events.encode_event(event)
+        finally:
+            self.close()
+
+    async def catch_up(self):
+        """Replay missed kudos from the database in keyset batches, oldest first"""
+        paginator = KudoCursorPagination()
+        while True:
+            batch = Kudo.objects.using(self.using).filter(receiver_id=self.user_id).filter(
+                paginator.get_seek_filter(('created_at', 'id'), self.position)
+            ).select_related('sender', 'receiver').order_by('created_at', 'id')[:paginator.max_page_size]
+            fetched = 0
+            async for kudo in batch:
+                event = events.make_event(kudo)
+                self.position = event.position
+                fetched += 1
+                yield events.encode_event(event)
+            if fetched < paginator.max_page_size:
+                return
+
+
+@async_get_only
+async def kudos_stream(request):
+    """Server-Sent Events stream of kudos received by the current user"""
+    if not isinstance(request, ASGIRequest):
+        return json_response({'error': 'The kudo stream is only served under ASGI'}, status.HTTP_501_NOT_IMPLEMENTED)
+
+    # EventSource cannot send custom headers, so the stream also accepts ?user_id= and ?last_event_id=
+    raw_user_id = request.headers.get('X-User-ID') or request.GET.get('user_id')
+    if not raw_user_id:
+        return json_response({'error': 'X-User-ID header required'}, status.HTTP_400_BAD_REQUEST)
+
+    user_id = parse_user_id(raw_user_id)
+    user = await aget_user(user_id) if user_id is not None else None
+    if user is None or not user.is_active:
+        return json_response({'error': 'Invalid user ID'}, status.HTTP_404_NOT_FOUND)
+
+    last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    position = events.parse_event_id(last_event_id) if last_event_id else None
+    if last_event_id and position is None:
+        return json_response({'error': 'Invalid Last-Event-ID'}, status.HTTP_400_BAD_REQUEST)
+
+    shard = await sharding.adb_for_organization(user.organization_id)
+    response = StreamingHttpResponse(KudoStream(user.id, position, shard), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop reverse proxies from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
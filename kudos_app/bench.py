@@ -0,0 +1,512 @@
+"""
+Endpoint benchmark harness shared by the ``bench`` management command and the
+budget tests.
+
+``run_benchmark`` replays a seeded mix of reads and writes against every API
+route through the Django test client, and records latency, status and SQL
+query count for each request. ``check_against_baseline`` compares the summary
+with the committed budgets in ``bench_baseline.json``.
+``run_concurrency_benchmark`` compares read throughput under WSGI (sync views
+on a thread per in-flight request) with ASGI (async views on one event loop).
+``run_write_burst_benchmark`` runs readers alongside a burst of kudo writes
+and counts "database is locked" failures.
+``run_kudo_burst_benchmark`` measures throughput and latency of a burst of
+kudo creations; the command runs it with and without group commit.
+``run_throttle_benchmark`` measures what the throttling middleware adds to
+each request.
+``run_serialization_benchmark`` measures rows per second for the list
+payloads: ModelSerializer + ``JSONRenderer`` against the ``.values()`` fast
+path + ``OrJSONRenderer``.
+"""
+import asyncio
+import json
+import logging
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from django.core.signals import got_request_exception
+from django.db import OperationalError, connection
+from django.test import AsyncClient, Client, RequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import resolve, reverse
+from rest_framework.renderers import JSONRenderer
+from .metrics import percentile
+from .models import Kudo, User, WeeklyQuota, WEEKLY_KUDOS_LIMIT, get_week_start
+from .renderers import OrJSONRenderer
+from .serializers import (
+    KudoSerializer, UserSimpleSerializer, kudo_values, serialize_kudo_rows, user_simple_values
+)
+from .throttling import ThrottleMiddleware, buckets
+
+
+DEFAULT_BASELINE_PATH = Path(__file__).resolve().parent / 'bench_baseline.json'
+
+# Read endpoints that also have native async views under /api/async/
+ASYNC_READ_ENDPOINTS = [
+    'current-user',
+    'user-list',
+    'organizations-list',
+    'users-by-organization',
+    'kudos-received',
+]
+READ_ENDPOINTS = ASYNC_READ_ENDPOINTS + [
+    'organization-leaderboard',
+    'bootstrap',
+]
+ORG_SCOPED_ENDPOINTS = {'users-by-organization', 'organization-leaderboard'}
+WRITE_ENDPOINTS = [
+    'kudo-create',
+    'kudo-batch-create',
+]
+
+
+def build_request(name, rng, user_id, org_id, colleagues):
+    """Return ``(method, path, body)`` for one request to the named route"""
+    if name in ORG_SCOPED_ENDPOINTS:
+        return 'GET', reverse(name, kwargs={'org_id': org_id}), None
+    if name == 'kudo-create':
+        body = {'receiver': rng.choice(colleagues), 'message': 'Benchmark kudo'}
+        return 'POST', reverse(name), body
+    if name == 'kudo-batch-create':
+        body = [{'receiver': rng.choice(colleagues), 'message': 'Benchmark kudo'} for _ in range(2)]
+        return 'POST', reverse(name), body
+    return 'GET', reverse(name), None
+
+
+def load_members():
+    """Return ``(members by org, [(user_id, org_id), ...])`` for orgs that have someone to send kudos to"""
+    members = defaultdict(list)
+    for user_id, org_id in User.objects.order_by('id').values_list('id', 'organization_id'):
+        members[org_id].append(user_id)
+    users = [(user_id, org_id) for org_id, ids in members.items() if len(ids) > 1 for user_id in ids]
+    if not users:
+        raise ValueError('The benchmark needs at least one organization with two users')
+    return members, users
+
+
+def run_benchmark(requests=1000, write_ratio=0.1, seed=0):
+    """Drive a seeded read/write mix through the API and return the summarized results"""
+    rng = random.Random(seed)
+    members, users = load_members()
+
+    client = Client()
+    samples = defaultdict(list)
+    # Rejected writes (e.g. exhausted quota) are expected; keep django.request from logging each one
+    request_logger = logging.getLogger('django.request')
+    previous_level = request_logger.level
+    request_logger.setLevel(logging.ERROR)
+    try:
+        started = time.perf_counter()
+        for _ in range(requests):
+            _replay_one(client, rng, users, members, write_ratio, samples)
+        wall_seconds = time.perf_counter() - started
+    finally:
+        request_logger.setLevel(previous_level)
+
+    return summarize(samples, wall_seconds)
+
+
+def _replay_one(client, rng, users, members, write_ratio, samples):
+    user_id, org_id = rng.choice(users)
+    colleagues = [other for other in members[org_id] if other != user_id]
+    name = rng.choice(WRITE_ENDPOINTS if rng.random() < write_ratio else READ_ENDPOINTS)
+    method, path, body = build_request(name, rng, user_id, org_id, colleagues)
+
+    with CaptureQueriesContext(connection) as queries:
+        request_started = time.perf_counter()
+        response = client.generic(
+            method, path,
+            data=json.dumps(body) if body is not None else '',
+            content_type='application/json',
+            HTTP_X_USER_ID=str(user_id),
+        )
+        elapsed = time.perf_counter() - request_started
+    samples[name].append((elapsed, len(queries), response.status_code))
+
+
+def run_concurrency_benchmark(mode, requests=1000, concurrency=50, seed=0):
+    """
+    Replay read requests with ``concurrency`` of them in flight at once.
+
+    ``mode='wsgi'`` drives the DRF views from one thread per in-flight request,
+    the way a threaded WSGI server would; ``mode='asgi'`` drives the async views
+    under ``/api/async/`` from tasks on a single event loop.
+    """
+    members, users = load_members()
+    plans = []
+    for worker in range(concurrency):
+        rng = random.Random(seed * 1000 + worker)
+        plan = []
+        for _ in range(requests // concurrency + (worker < requests % concurrency)):
+            user_id, org_id = rng.choice(users)
+            name = rng.choice(ASYNC_READ_ENDPOINTS)
+            _, path, _ = build_request(name, rng, user_id, org_id, [])
+            if mode == 'asgi':
+                path = path.replace('/api/', '/api/async/', 1)
+            plan.append((name, path, user_id))
+        plans.append(plan)
+
+    samples = defaultdict(list)
+    lock = threading.Lock()
+
+    def record(name, elapsed, status_code):
+        with lock:
+            samples[name].append((elapsed, 0, status_code))
+
+    started = time.perf_counter()
+    if mode == 'wsgi':
+        def worker(plan):
+            client = Client()
+            try:
+                for name, path, user_id in plan:
+                    request_started = time.perf_counter()
+                    response = client.get(path, HTTP_X_USER_ID=str(user_id))
+                    record(name, time.perf_counter() - request_started, response.status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(plan,)) for plan in plans]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    elif mode == 'asgi':
+        async def worker(plan):
+            client = AsyncClient()
+            for name, path, user_id in plan:
+                request_started = time.perf_counter()
+                response = await client.get(path, headers={'X-User-ID': str(user_id)})
+                record(name, time.perf_counter() - request_started, response.status_code)
+
+        async def main():
+            await asyncio.gather(*(worker(plan) for plan in plans))
+
+        asyncio.run(main())
+    else:
+        raise ValueError(f'Unknown mode {mode!r}; expected "wsgi" or "asgi"')
+
+    return summarize(samples, time.perf_counter() - started)
+
+
+def run_write_burst_benchmark(readers=8, writers=4, writes_per_writer=25, seed=0):
+    """
+    Run ``readers`` threads replaying read endpoints for as long as ``writers``
+    threads take to post their kudos, one connection per thread as under a
+    threaded server. Returns read/write throughput plus lock and server errors.
+    """
+    members, users = load_members()
+    counts = defaultdict(int)
+    lock = threading.Lock()
+    writers_done = threading.Event()
+
+    def count(key):
+        with lock:
+            counts[key] += 1
+
+    def send(client, method, path, user_id, body=None):
+        response = client.generic(
+            method, path,
+            data=json.dumps(body) if body is not None else '',
+            content_type='application/json',
+            HTTP_X_USER_ID=str(user_id),
+        )
+        if response.status_code >= 500:
+            count('server_errors')
+
+    # Test clients store any thread's exception, so attribute errors from the signal itself
+    def record_exception(sender, request=None, **kwargs):
+        error = sys.exc_info()[1]
+        if isinstance(error, OperationalError) and 'locked' in str(error):
+            count('lock_errors')
+
+    def reader(index):
+        rng = random.Random(seed * 1000 + index)
+        client = Client(raise_request_exception=False)
+        try:
+            while not writers_done.is_set():
+                user_id, org_id = rng.choice(users)
+                _, path, _ = build_request(rng.choice(READ_ENDPOINTS), rng, user_id, org_id, [])
+                send(client, 'GET', path, user_id)
+                count('reads')
+        finally:
+            connection.close()
+
+    def writer(index):
+        rng = random.Random(seed * 1000 + readers + index)
+        client = Client(raise_request_exception=False)
+        try:
+            for _ in range(writes_per_writer):
+                user_id, org_id = rng.choice(users)
+                colleagues = [other for other in members[org_id] if other != user_id]
+                _, path, body = build_request('kudo-create', rng, user_id, org_id, colleagues)
+                send(client, 'POST', path, user_id, body)
+                count('writes')
+        finally:
+            connection.close()
+
+    request_logger = logging.getLogger('django.request')
+    previous_level = request_logger.level
+    request_logger.setLevel(logging.CRITICAL)
+    got_request_exception.connect(record_exception)
+    try:
+        reader_threads = [threading.Thread(target=reader, args=(index,)) for index in range(readers)]
+        writer_threads = [threading.Thread(target=writer, args=(index,)) for index in range(writers)]
+        started = time.perf_counter()
+        for thread in reader_threads + writer_threads:
+            thread.start()
+        for thread in writer_threads:
+            thread.join()
+        write_seconds = time.perf_counter() - started
+        writers_done.set()
+        for thread in reader_threads:
+            thread.join()
+        wall_seconds = time.perf_counter() - started
+    finally:
+        got_request_exception.disconnect(record_exception)
+        request_logger.setLevel(previous_level)
+
+    return {
+        'reads': counts['reads'],
+        'writes': counts['writes'],
+        'read_rps': round(counts['reads'] / wall_seconds, 1) if wall_seconds else 0.0,
+        'write_rps': round(counts['writes'] / write_seconds, 1) if write_seconds else 0.0,
+        'lock_errors': counts['lock_errors'],
+        'server_errors': counts['server_errors'],
+        'wall_seconds': round(wall_seconds, 3),
+    }
+
+
+def run_kudo_burst_benchmark(writers=32, seed=0):
+    """
+    Have ``writers`` threads post kudos at once until every user has used up
+    this week's quota. Each writer owns its own senders, so every post is
+    admitted. Returns throughput, latency percentiles and failure counts.
+    """
+    members, users = load_members()
+    used = dict(WeeklyQuota.objects.filter(week_start=get_week_start()).values_list('user_id', 'used'))
+    rng = random.Random(seed)
+    jobs = [[] for _ in range(writers)]
+    for index, (user_id, org_id) in enumerate(users):
+        colleagues = [other for other in members[org_id] if other != user_id]
+        for _ in range(WEEKLY_KUDOS_LIMIT - used.get(user_id, 0)):
+            jobs[index % writers].append((user_id, {'receiver': rng.choice(colleagues), 'message': 'Burst kudo'}))
+
+    latencies = []
+    statuses = defaultdict(int)
+    lock = threading.Lock()
+
+    def writer(index):
+        client = Client(raise_request_exception=False)
+        try:
+            for user_id, body in jobs[index]:
+                started = time.perf_counter()
+                response = client.post(reverse('kudo-create'), data=json.dumps(body),
+                                       content_type='application/json', HTTP_X_USER_ID=str(user_id))
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies.append(elapsed * 1000)
+                    statuses[response.status_code] += 1
+        finally:
+            connection.close()
+
+    request_logger = logging.getLogger('django.request')
+    previous_level = request_logger.level
+    request_logger.setLevel(logging.CRITICAL)
+    try:
+        threads = [threading.Thread(target=writer, args=(index,)) for index in range(writers)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall_seconds = time.perf_counter() - started
+    finally:
+        request_logger.setLevel(previous_level)
+
+    latencies.sort()
+    created = statuses[201]
+    return {
+        'requests': len(latencies),
+        'created': created,
+        'rejected': sum(count for code, count in statuses.items() if 400 <= code < 500),
+        'server_errors': sum(count for code, count in statuses.items() if code >= 500),
+        'created_per_second': round(created / wall_seconds, 1) if wall_seconds else 0.0,
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'wall_seconds': round(wall_seconds, 3),
+    }
+
+
+def run_throttle_benchmark(requests=2000, seed=0):
+    """
+    Measure what ``ThrottleMiddleware`` adds to each request, with budgets too large to reject anything.
+
+    Times the bucket check on its own, then replays the same read requests
+    through two clients, one with the middleware and one without, alternating
+    between them so both see the same data and cache state.
+    """
+    members, users = load_members()
+    rng = random.Random(seed)
+    plan = []
+    for _ in range(requests):
+        user_id, org_id = rng.choice(users)
+        name = rng.choice(READ_ENDPOINTS)
+        plan.append((user_id, build_request(name, rng, user_id, org_id, members[org_id])[1]))
+
+    unlimited = {scope: {'user': (1e9, 1e9), 'organization': (1e9, 1e9)} for scope in ('read', 'create')}
+    clients = {}
+    for mode, enabled in (('off', False), ('on', True)):
+        with override_settings(KUDOS_THROTTLE=enabled, KUDOS_THROTTLE_RATES=unlimited):
+            clients[mode] = Client()
+            # The handler loads its middleware on the first request
+            clients[mode].get(plan[0][1], HTTP_X_USER_ID=str(plan[0][0]))
+
+    latencies = {mode: [] for mode in clients}
+    for index, (user_id, path) in enumerate(plan):
+        # Take turns going first, so neither mode always meets a cold cache
+        for mode in (('off', 'on') if index % 2 else ('on', 'off')):
+            client = clients[mode]
+            started = time.perf_counter()
+            client.get(path, HTTP_X_USER_ID=str(user_id))
+            latencies[mode].append((time.perf_counter() - started) * 1000)
+
+    with override_settings(KUDOS_THROTTLE=True, KUDOS_THROTTLE_RATES=unlimited):
+        middleware = ThrottleMiddleware(lambda request: None)
+    factory = RequestFactory()
+    checks = []
+    for user_id, path in plan:
+        request = factory.get(path, HTTP_X_USER_ID=str(user_id))
+        request.resolver_match = resolve(path)
+        checks.append(request)
+    started = time.perf_counter()
+    for request in checks:
+        middleware.process_view(request, request.resolver_match.func, (), {})
+    check_seconds = time.perf_counter() - started
+    buckets.clear()
+
+    results = {'check_us': round(check_seconds / len(checks) * 1e6, 2)}
+    for mode, values in latencies.items():
+        values.sort()
+        results[mode] = {
+            'p50_ms': round(percentile(values, 50), 3),
+            'p95_ms': round(percentile(values, 95), 3),
+            'mean_ms': round(sum(values) / len(values), 3),
+        }
+    return results
+
+
+def run_serialization_benchmark(rows=5000, repeat=5):
+    """
+    Time fetching and rendering up to ``rows`` kudos and users three ways and
+    return rows/second (best of ``repeat``) per list and mode.
+    """
+    def kudos():
+        return Kudo.objects.order_by('-created_at', '-id')[:rows]
+
+    def users():
+        return User.objects.order_by('username', 'id')[:rows]
+
+    cases = {
+        'kudos': {
+            'serializer': lambda: JSONRenderer().render(
+                KudoSerializer(kudos().select_related('sender', 'receiver'), many=True).data
+            ),
+            'values': lambda: JSONRenderer().render(serialize_kudo_rows(kudo_values(kudos()))),
+            'values+orjson': lambda: OrJSONRenderer().render(serialize_kudo_rows(kudo_values(kudos()))),
+        },
+        'users': {
+            'serializer': lambda: JSONRenderer().render(
+                UserSimpleSerializer(users().select_related('organization'), many=True).data
+            ),
+            'values': lambda: JSONRenderer().render(list(user_simple_values(users()))),
+            'values+orjson': lambda: OrJSONRenderer().render(list(user_simple_values(users()))),
+        },
+    }
+    row_counts = {'kudos': kudos().count(), 'users': users().count()}
+
+    results = {}
+    for name, modes in cases.items():
+        results[name] = {}
+        for mode, render in modes.items():
+            best = min(_time_once(render) for _ in range(repeat))
+            results[name][mode] = {
+                'rows': row_counts[name],
+                'seconds': round(best, 4),
+                'rows_per_second': round(row_counts[name] / best) if best else 0,
+            }
+        baseline = results[name]['serializer']['seconds']
+        for mode_results in results[name].values():
+            mode_results['speedup'] = round(baseline / mode_results['seconds'], 2) if mode_results['seconds'] else 0.0
+    return results
+
+
+def _time_once(render):
+    started = time.perf_counter()
+    render()
+    return time.perf_counter() - started
+
+
+def summarize(samples, wall_seconds):
+    endpoints = {}
+    for name, rows in sorted(samples.items()):
+        latencies = sorted(elapsed * 1000 for elapsed, _, _ in rows)
+        query_counts = [count for _, count, _ in rows]
+        endpoints[name] = {
+            'requests': len(rows),
+            'p50_ms': round(percentile(latencies, 50), 3),
+            'p95_ms': round(percentile(latencies, 95), 3),
+            'p99_ms': round(percentile(latencies, 99), 3),
+            'throughput_rps': round(len(rows) / (sum(latencies) / 1000), 1) if sum(latencies) else 0.0,
+            'mean_queries': round(sum(query_counts) / len(query_counts), 2),
+            'max_queries': max(query_counts),
+            'client_errors': sum(1 for _, _, code in rows if 400 <= code < 500),
+            'server_errors': sum(1 for _, _, code in rows if code >= 500),
+        }
+
+    total_requests = sum(len(rows) for rows in samples.values())
+    return {
+        'endpoints': endpoints,
+        'total': {
+            'requests': total_requests,
+            'wall_seconds': round(wall_seconds, 3),
+            'throughput_rps': round(total_requests / wall_seconds, 1) if wall_seconds else 0.0,
+        },
+    }
+
+
+def load_baseline(path=DEFAULT_BASELINE_PATH):
+    with open(path) as baseline_file:
+        return json.load(baseline_file)
+
+
+def check_against_baseline(results, baseline, check_latency=True):
+    """Return a list of human-readable budget violations (empty when within budget)"""
+    violations = []
+    for name, budget in sorted(baseline.get('endpoints', {}).items()):
+        measured = results['endpoints'].get(name)
+        if measured is None:
+            continue
+        if measured['server_errors']:
+            violations.append(f"{name}: {measured['server_errors']} server errors")
+        if measured['max_queries'] > budget['max_queries']:
+            violations.append(f"{name}: {measured['max_queries']} queries > budget {budget['max_queries']}")
+        if check_latency and measured['p95_ms'] > budget['p95_ms']:
+            violations.append(f"{name}: p95 {measured['p95_ms']}ms > budget {budget['p95_ms']}ms")
+    return violations
+
+
+def make_baseline(results, latency_headroom=3.0):
+    """Derive budgets from a run: exact query counts, p95 latency with headroom for noisy machines"""
+    return {
+        'endpoints': {
+            name: {
+                'max_queries': measured['max_queries'],
+                'p95_ms': round(max(measured['p95_ms'] * latency_headroom, 1.0), 1),
+            }
+            for name, measured in results['endpoints'].items()
+        }
+    }
@@ -0,0 +1,121 @@
+"""
+Versioned cache for the organization directory endpoints.
+
+Every organization has a version number in the cache, and so does the list of
+organizations. ``User``/``Organization`` save and delete signals bump it (see
+``signals.py``). Serialized responses are stored under a strong ETag built from
+that version, so an ``If-None-Match`` revalidation can be answered with a 304
+after one cache read and no ORM work. Snapshots also expire after
+``KUDOS_DIRECTORY_CACHE_TTL`` as a backstop for changes the signals cannot
+see (e.g. queryset ``update()`` calls).
+"""
+import hashlib
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+
+ORGANIZATIONS_SCOPE = 'organizations'
+CACHE_TTL = getattr(settings, 'KUDOS_DIRECTORY_CACHE_TTL', 300)
+
+
+def _version_key(scope):
+    return f'kudos:directory:version:{scope}'
+
+
+def get_version(scope):
+    """Return the current version for ``scope`` (an organization id or ORGANIZATIONS_SCOPE)"""
+    # Seed from the clock so a flushed cache never reissues an ETag a client already holds
+    return cache.get_or_set(_version_key(scope), time.time_ns, timeout=None)
+
+
+def bump_version(scope):
+    try:
+        cache.incr(_version_key(scope))
+    except ValueError:
+        cache.set(_version_key(scope), time.time_ns(), timeout=None)
+
+
+def make_etag(scope, version, request, vary=''):
+    """Strong ETag for one rendering of ``scope``: version plus everything else the body depends on"""
+    digest = hashlib.sha1(
+        f'{request.get_host()}|{request.get_full_path()}|{vary}'.encode('utf-8')
+    ).hexdigest()[:16]
+    return f'"{scope}-{version}-{digest}"'
+
+
+def _not_modified(request, etag):
+    if_none_match = request.headers.get('If-None-Match')
+    return bool(if_none_match) and (etag in parse_etags(if_none_match) or if_none_match.strip() == '*')
+
+
+def _headers(etag):
+    return {'ETag': etag, 'Cache-Control': 'private, no-cache', 'Vary': 'X-User-ID'}
+
+
+def cached_response(request, scope, build, vary=''):
+    """
+    Serve ``build()``'s response data from the versioned snapshot cache.
+
+    ``build`` returns a ``Response``; only 200 responses are cached. ``vary``
+    distinguishes renderings that differ for reasons outside the URL, such as
+    the requesting user.
+    """
+    etag = make_etag(scope, get_version(scope), request, vary)
+    if _not_modified(request, etag):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers=_headers(etag))
+
+    snapshot_key = f'kudos:directory:snapshot:{etag}'
+    data = cache.get(snapshot_key)
+    if data is None:
+        response = build()
+        if response.status_code != status.HTTP_200_OK:
+            return response
+        data = response.data
+        cache.set(snapshot_key, data, CACHE_TTL)
+
+    return Response(data, headers=_headers(etag))
+
+
+def cached_data(scope, name, build):
+    """
+    ``build()``'s result, cached under ``scope``'s current version.
+
+    For data that is a part of a response, rather than the whole response (e.g. the
+    directory inside ``/bootstrap/``). The next version bump moves it to a new key.
+    """
+    key = f'kudos:directory:data:{scope}:{get_version(scope)}:{name}'
+    data = cache.get(key)
+    if data is None:
+        data = build()
+        cache.set(key, data, CACHE_TTL)
+    return data
+
+
+async def acached_snapshot(request, scope, build, vary=''):
+    """
+    Async counterpart of ``cached_response`` for plain Django async views.
+
+    ``build`` is a coroutine function returning ``(status_code, data)``. Returns
+    ``(status_code, data, headers)``; data is None for a 304.
+    """
+    version = await cache.aget(_version_key(scope))
+    if version is None:
+        version = await sync_to_async(get_version)(scope)
+    etag = make_etag(scope, version, request, vary)
+    if _not_modified(request, etag):
+        return status.HTTP_304_NOT_MODIFIED, None, _headers(etag)
+
+    snapshot_key = f'kudos:directory:snapshot:{etag}'
+    data = await cache.aget(snapshot_key)
+    if data is None:
+        status_code, data = await build()
+        if status_code != status.HTTP_200_OK:
+            return status_code, data, {}
+        await cache.aset(snapshot_key, data, CACHE_TTL)
+
+    return status.HTTP_200_OK, data, _headers(etag)
@@ -0,0 +1,120 @@
+"""
+In-process pub/sub for newly created kudos, feeding the ``/kudos/stream/``
+Server-Sent Events endpoint.
+
+Stream connections subscribe by receiver id and wait on an ``asyncio.Queue``,
+so an idle connection costs no queries. Writers publish from whatever thread
+committed the kudo; delivery hops onto each subscriber's event loop with
+``call_soon_threadsafe``. Fan-out is per process: with several ASGI workers a
+client only sees kudos written by the worker it is connected to until it
+reconnects and resumes from ``Last-Event-ID``.
+"""
+import asyncio
+import threading
+from collections import defaultdict, namedtuple
+from datetime import datetime
+from django.conf import settings
+from .renderers import OrJSONRenderer
+from .serializers import KudoSerializer
+
+
+# position is the (created_at, id) keyset used to order and resume the stream
+KudoEvent = namedtuple('KudoEvent', ['position', 'payload'])
+
+
+def event_position(kudo):
+    return kudo.created_at, kudo.id
+
+
+def format_event_id(position):
+    created_at, kudo_id = position
+    return f'{created_at.isoformat()},{kudo_id}'
+
+
+def parse_event_id(raw):
+    """Parse a ``Last-Event-ID`` value back into a position, or None if it is malformed"""
+    try:
+        created_at, kudo_id = (raw or '').rsplit(',', 1)
+        # Accept the 'Z' suffix the API uses for created_at
+        created_at = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
+        kudo_id = int(kudo_id)
+    except ValueError:
+        return None
+    if created_at.tzinfo is None:
+        return None
+    return created_at, kudo_id
+
+
+def make_event(kudo):
+    """Serialize once per kudo; every subscriber of the receiver gets the same bytes"""
+    return KudoEvent(event_position(kudo), OrJSONRenderer().render(KudoSerializer(kudo).data))
+
+
+def encode_event(event):
+    return (
+        f'id: {format_event_id(event.position)}\nevent: kudo\ndata: '.encode('utf-8')
+        + event.payload + b'\n\n'
+    )
+
+
+class Subscription:
+    """One stream connection's mailbox; marked overflowed instead of blocking writers when full"""
+
+    def __init__(self, receiver_id, loop, maxsize):
+        self.receiver_id = receiver_id
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize)
+        self.overflowed = False
+
+    def deliver(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # The stream closes and the client resumes from Last-Event-ID via the database
+            self.overflowed = True
+
+    async def get(self, timeout):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+
+class KudoBroker:
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._subscriptions = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, receiver_id, loop=None):
+        subscription = Subscription(receiver_id, loop or asyncio.get_running_loop(), self.queue_size)
+        with self._lock:
+            self._subscriptions[receiver_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.receiver_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.receiver_id]
+
+    def has_subscribers(self, receiver_id):
+        return receiver_id in self._subscriptions
+
+    def publish(self, receiver_id, event):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(receiver_id, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+            except RuntimeError:
+                # The subscriber's loop has shut down
+                self.unsubscribe(subscription)
+
+    def publish_kudos(self, kudos):
+        """Publish kudos to their receivers, skipping serialization for receivers nobody is listening to"""
+        for kudo in kudos:
+            if self.has_subscribers(kudo.receiver_id):
+                self.publish(kudo.receiver_id, make_event(kudo))
+
+
+broker = KudoBroker(getattr(settings, 'KUDOS_STREAM_QUEUE_SIZE', 100))
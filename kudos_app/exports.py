@@ -0,0 +1,88 @@
+"""
+Streaming exports of an organization's kudos as NDJSON or CSV.
+
+Rows are read with ``.values()`` (sender and receiver usernames joined in SQL)
+and ``QuerySet.iterator(chunk_size=...)``, then encoded one at a time, so memory
+stays flat however many kudos match. There is deliberately no ORDER BY: SQLite
+walks the (sender, created_at) index and can emit the first row straight away,
+instead of sorting the whole result first. Rows therefore come grouped by
+sender, oldest first within each sender. Archived kudos (kudos_app/archive.py)
+follow the hot ones.
+"""
+import csv
+import json
+from datetime import datetime, time, timedelta
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from .models import ArchivedKudo, Kudo
+
+
+CHUNK_SIZE = 2000
+FIELDS = ['id', 'created_at', 'sender_username', 'receiver_username', 'message']
+
+
+def parse_date_range(start=None, end=None):
+    """
+    Turn inclusive ``YYYY-MM-DD`` strings into a half-open aware datetime range.
+
+    Either bound may be omitted. Raises ValueError for malformed dates.
+    """
+    bounds = []
+    for value, days in ((start, 0), (end, 1)):
+        if not value:
+            bounds.append(None)
+            continue
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f'Invalid date {value!r}; expected YYYY-MM-DD')
+        bounds.append(timezone.make_aware(datetime.combine(day + timedelta(days=days), time.min)))
+    return tuple(bounds)
+
+
+def export_rows(organization_id, start=None, end=None, chunk_size=CHUNK_SIZE, using='default'):
+    """Iterate over plain dicts for every kudo (hot, then archived) sent within the organization in ``[start, end)``"""
+    for model in (Kudo, ArchivedKudo):
+        queryset = model.objects.using(using).filter(sender__organization_id=organization_id)
+        if start is not None:
+            queryset = queryset.filter(created_at__gte=start)
+        if end is not None:
+            queryset = queryset.filter(created_at__lt=end)
+
+        yield from queryset.order_by().values(
+            'id',
+            'created_at',
+            'message',
+            sender_username=F('sender__username'),
+            receiver_username=F('receiver__username'),
+        ).iterator(chunk_size=chunk_size)
+
+
+def iter_ndjson(rows):
+    for row in rows:
+        yield json.dumps(
+            {field: row[field].isoformat() if field == 'created_at' else row[field] for field in FIELDS},
+            ensure_ascii=False
+        ) + '\n'
+
+
+class _Echo:
+    """File-like object whose write() just returns the line, so csv.writer can feed a generator"""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(FIELDS)
+    for row in rows:
+        yield writer.writerow([
+            row['created_at'].isoformat() if field == 'created_at' else row[field] for field in FIELDS
+        ])
+
+
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', iter_ndjson),
+    'csv': ('text/csv', iter_csv),
+}
@@ -0,0 +1,234 @@
+"""
+Recognition-graph analytics for one organization, computed with NumPy.
+
+``load_graph`` streams the ``(sender, receiver)`` pairs of the organization's
+kudos in a date window, hot and archived, in chunks of raw SQL rows. Member ids become row
+numbers with ``searchsorted``. Each kudo becomes one int64 key,
+``sender_row * members + receiver_row``. Whenever ``COMPACT_EVERY`` raw keys
+have piled up they are folded into sorted unique keys with counts. Memory is
+therefore bounded by the number of distinct pairs plus one chunk, however
+many kudos there are. The result is a ``RecognitionGraph``: a CSR adjacency
+matrix (``indptr``, ``indices``, ``weights``) over the members.
+
+``RecognitionGraph.stats`` derives every metric with vectorized operations:
+degrees, reciprocity, members nobody recognized, recognition "islands"
+(connected components, by label propagation) and connectors (members who
+exchange kudos with the most distinct colleagues).
+
+``organization_stats`` caches the result per organization and window (see
+``KUDOS_GRAPH_STATS_TTL``). NumPy is optional: without it ``np`` is None and
+the endpoint answers 503.
+"""
+from datetime import timedelta
+from itertools import chain
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from .models import ArchivedKudo, Kudo, User, get_week_bounds, get_week_start
+
+try:
+    import numpy as np
+except ImportError:  # Optional: graph analytics are unavailable without NumPy
+    np = None
+
+
+CHUNK_SIZE = 50000
+COMPACT_EVERY = 2000000
+# Scan the whole kudo table instead of seeking per member once the organization holds 1/SCAN_SHARE of the users
+SCAN_SHARE = 5
+MAX_LIMIT = 50
+# Windows that ended before this week no longer change
+CLOSED_WINDOW_TTL = 24 * 3600
+
+
+class RecognitionGraph:
+    """Who recognized whom within one organization, as a CSR adjacency matrix over its members"""
+
+    def __init__(self, member_ids, keys, counts):
+        size = len(member_ids)
+        self.member_ids = member_ids
+        self.keys = keys  # sorted sender_row * size + receiver_row
+        self.indices = keys % size  # receiver rows, grouped by sender row
+        self.weights = counts
+        self.indptr = np.zeros(size + 1, dtype=np.int64)
+        np.cumsum(np.bincount(keys // size, minlength=size), out=self.indptr[1:])
+
+    @property
+    def size(self):
+        return len(self.member_ids)
+
+    def sender_rows(self):
+        return np.repeat(np.arange(self.size), np.diff(self.indptr))
+
+    def components(self, senders):
+        """Component label of every member (min member row), treating edges as undirected"""
+        labels = np.arange(self.size)
+        while True:
+            lowest = np.minimum(labels[senders], labels[self.indices])
+            updated = labels.copy()
+            np.minimum.at(updated, senders, lowest)
+            np.minimum.at(updated, self.indices, lowest)
+            updated = updated[updated]  # Pointer jumping: follow each label to its own label
+            if np.array_equal(updated, labels):
+                return labels
+            labels = updated
+
+    def stats(self, limit=MAX_LIMIT):
+        """Metrics with members as row numbers; ``limit`` caps every list"""
+        size = self.size
+        senders = self.sender_rows()
+        sent = np.bincount(senders, weights=self.weights, minlength=size).astype(np.int64)
+        received = np.bincount(self.indices, weights=self.weights, minlength=size).astype(np.int64)
+        pairs = len(self.keys)
+
+        # A pair is mutual when its reverse key is present too
+        reverse = np.sort(self.indices * size + senders)  # Sorted lookups walk the keys in order
+        found = np.searchsorted(self.keys, reverse).clip(max=max(pairs - 1, 0))
+        mutual = int(np.count_nonzero(self.keys[found] == reverse)) if pairs else 0
+
+        # Distinct colleagues each member exchanged kudos with, in either direction
+        undirected = np.sort(np.minimum(senders, self.indices) * size + np.maximum(senders, self.indices))
+        undirected = undirected[_first_of_runs(undirected)] if undirected.size else undirected
+        colleagues = np.bincount(undirected // size, minlength=size) + np.bincount(undirected % size, minlength=size)
+
+        active = (sent + received) > 0
+        labels = self.components(senders)[active]
+        island_sizes = np.bincount(labels)[np.unique(labels)] if labels.size else np.zeros(0, dtype=np.int64)
+
+        isolated = np.flatnonzero(received == 0)
+        top_pairs = np.argsort(-self.weights, kind='stable')[:limit]
+        # Most distinct colleagues first, then most kudos, then lowest row
+        connectors = np.lexsort((np.arange(size), -(sent + received), -colleagues))[:limit]
+        connectors = connectors[colleagues[connectors] > 0]
+
+        return {
+            'members': size,
+            'kudos': int(self.weights.sum()),
+            'pairs': pairs,
+            'reciprocity': round(mutual / pairs, 4) if pairs else 0.0,
+            'senders': int(np.count_nonzero(sent)),
+            'receivers': int(np.count_nonzero(received)),
+            'isolated': {'count': len(isolated), 'rows': isolated[:limit].tolist()},
+            'islands': {'count': len(island_sizes), 'largest': int(island_sizes.max()) if island_sizes.size else 0},
+            'top_pairs': [
+                (int(senders[edge]), int(self.indices[edge]), int(self.weights[edge])) for edge in top_pairs
+            ],
+            'connectors': [
+                (int(row), int(colleagues[row]), int(sent[row]), int(received[row])) for row in connectors
+            ],
+        }
+
+
+def load_graph(organization_id, start, end, using='default', chunk_size=CHUNK_SIZE):
+    """
+    Build the ``RecognitionGraph`` of kudos received by the organization's members in ``[start, end)``.
+
+    Deactivated users are not members, and kudos they sent or received are
+    left out, so they never show up as members nobody recognized.
+    """
+    users = User.objects.using(using)
+    member_ids = np.fromiter(
+        users.filter(organization_id=organization_id, is_active=True).order_by('id').values_list('id', flat=True),
+        dtype=np.int64
+    )
+    size = len(member_ids)
+    if not size:
+        # Every member is deactivated: no kudos can be placed in the matrix
+        return RecognitionGraph(member_ids, np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+    # Seeking the receiver index once per member reads each kudo row in random order. Past a
+    # certain share of the table, one sequential pass over all of it is several times faster.
+    scan = size * SCAN_SHARE >= users.count()
+
+    keys = np.zeros(0, dtype=np.int64)
+    counts = np.zeros(0, dtype=np.int64)
+    pending = []
+    pending_rows = 0
+    for model in (Kudo, ArchivedKudo):
+        for chunk in stream_pairs(model, organization_id, start, end, using, scan, chunk_size):
+            positions = np.searchsorted(member_ids, chunk).clip(max=max(size - 1, 0))
+            # Drop kudos to or from deactivated users, and from senders outside the organization
+            # (none are created, but rows may be moved)
+            inside = (member_ids[positions] == chunk).all(axis=1)
+            pending.append(positions[inside, 0] * size + positions[inside, 1])
+            pending_rows += len(chunk)
+            if pending_rows >= COMPACT_EVERY:
+                keys, counts = _compact(keys, counts, pending)
+                pending, pending_rows = [], 0
+
+    keys, counts = _compact(keys, counts, pending)
+    return RecognitionGraph(member_ids, keys, counts)
+
+
+def stream_pairs(model, organization_id, start, end, using, scan, chunk_size):
+    """Yield ``(sender_id, receiver_id)`` int64 arrays of up to ``chunk_size`` rows for ``model``'s kudos"""
+    connection = connections[using]
+    sql = f"""
+        SELECT sender_id, receiver_id
+        FROM {model._meta.db_table}{' NOT INDEXED' if scan else ''}
+        WHERE receiver_id IN (SELECT id FROM {User._meta.db_table} WHERE organization_id = %s)
+          AND created_at >= %s AND created_at < %s
+    """
+    params = [
+        organization_id,
+        connection.ops.adapt_datetimefield_value(start),
+        connection.ops.adapt_datetimefield_value(end),
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield np.fromiter(chain.from_iterable(rows), dtype=np.int64, count=2 * len(rows)).reshape(-1, 2)
+
+
+def _compact(keys, counts, pending):
+    """Fold raw keys into sorted unique keys with counts"""
+    if not pending:
+        return keys, counts
+    merged = np.concatenate([keys] + pending)
+    weights = np.concatenate([counts] + [np.ones(len(part), dtype=np.int64) for part in pending])
+    order = np.argsort(merged)
+    merged, weights = merged[order], weights[order]
+    if not merged.size:
+        return merged, weights
+    starts = np.flatnonzero(_first_of_runs(merged))
+    return merged[starts], np.add.reduceat(weights, starts)
+
+
+def _first_of_runs(values):
+    """True where a sorted array's value differs from the previous one; sorting beats ``np.unique``'s hashing here"""
+    return np.concatenate(([True], values[1:] != values[:-1]))
+
+
+def organization_stats(organization_id, week_start, weeks, using='default'):
+    """
+    Graph metrics for the ``weeks`` weeks ending with the week of ``week_start``, with member ids.
+
+    Cached per organization and window. Windows that include the current week
+    expire after ``KUDOS_GRAPH_STATS_TTL`` seconds; closed ones after a day.
+    """
+    cache_key = f'kudos:graph:{organization_id}:{week_start.isoformat()}:{weeks}'
+    stats = cache.get(cache_key)
+    if stats is not None:
+        return stats
+
+    _, end = get_week_bounds(week_start)
+    start = end - timedelta(weeks=weeks)
+    graph = load_graph(organization_id, start, end, using=using)
+    stats = graph.stats()
+
+    ids = graph.member_ids
+    stats['isolated']['users'] = ids[stats['isolated'].pop('rows')].tolist()
+    stats['top_pairs'] = [
+        {'sender': int(ids[sender]), 'receiver': int(ids[receiver]), 'kudos': kudos}
+        for sender, receiver, kudos in stats['top_pairs']
+    ]
+    stats['connectors'] = [
+        {'user': int(ids[row]), 'colleagues': colleagues, 'sent': sent, 'received': received}
+        for row, colleagues, sent, received in stats['connectors']
+    ]
+
+    closed = week_start < get_week_start()
+    cache.set(cache_key, stats, CLOSED_WINDOW_TTL if closed else getattr(settings, 'KUDOS_GRAPH_STATS_TTL', 300))
+    return stats
@@ -0,0 +1,189 @@
+"""
+Group commit for kudo creation, enabled with ``KUDOS_GROUP_COMMIT``.
+
+Under a burst of ``POST /api/kudos/`` every request normally runs its own
+write transaction, so requests queue for SQLite's single write lock and each
+pays for its own commit. With group commit the request thread still
+validates the kudo, then hands it to one writer thread and waits. The writer
+gathers kudos for up to ``KUDOS_GROUP_COMMIT_DELAY_MS`` milliseconds or
+``KUDOS_GROUP_COMMIT_MAX_BATCH`` kudos and writes each database's share in one
+transaction: a few statements for the quota ledger however many senders are
+involved, one bulk insert and one leaderboard update per organization. Every
+waiting request then gets its own outcome: its saved kudo, a quota rejection,
+or the error that failed the batch.
+
+A request never waits on the writer indefinitely. If its kudo is still
+queued after ``KUDOS_GROUP_COMMIT_TIMEOUT`` seconds (the writer is stuck or
+its thread died) it takes the kudo back and commits it itself. If the writer
+already started on it, the request gives the batch one more timeout while
+the thread is alive, then gives up with ``WriteTimeout``.
+
+The queue is per process; each worker process runs its own writer.
+"""
+import queue
+import threading
+import time
+from collections import Counter, defaultdict
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from . import events
+from .models import Kudo, WeeklyActivity, WeeklyQuota
+
+
+class QuotaExceeded(Exception):
+    """The sender had no kudos left by the time the batch was written"""
+
+
+class WriterUnavailable(Exception):
+    """The writer never started on the kudo, which was taken back unwritten"""
+
+
+class WriteTimeout(Exception):
+    """The writer started on the kudo but did not finish in time; it may still be saved"""
+
+
+class PendingKudo:
+    """A queued kudo and the request waiting for it"""
+
+    def __init__(self, kudo):
+        self.kudo = kudo
+        self.error = None
+        self.done = threading.Event()
+        self._claimed = False
+        self._lock = threading.Lock()
+
+    def claim(self):
+        """Take the kudo, for writing it (writer) or taking it back (request); only the first caller gets it"""
+        with self._lock:
+            if self._claimed:
+                return False
+            self._claimed = True
+            return True
+
+
+def is_enabled():
+    return getattr(settings, 'KUDOS_GROUP_COMMIT', False)
+
+
+class GroupCommitWriter:
+    def __init__(self, delay=0.002, max_batch=100, timeout=10):
+        self.delay = delay
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, kudo):
+        """
+        Queue an unsaved kudo and block until its batch commits; returns the saved kudo.
+
+        Raises ``WriterUnavailable`` if the writer did not pick the kudo up
+        within ``timeout`` (nothing was written) and ``WriteTimeout`` if it
+        did but has not finished a timeout later.
+        """
+        pending = PendingKudo(kudo)
+        thread = self._ensure_running()
+        self._queue.put(pending)
+        if not pending.done.wait(self.timeout):
+            if pending.claim():
+                raise WriterUnavailable()
+            if not (thread.is_alive() and pending.done.wait(self.timeout)):
+                raise WriteTimeout()
+        if pending.error is not None:
+            raise pending.error
+        return kudo
+
+    def _ensure_running(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='kudos-group-commit', daemon=True)
+                self._thread.start()
+            return self._thread
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.delay
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            # Same connection housekeeping as a request: drop broken or expired connections
+            close_old_connections()
+            self.write(batch)
+
+    def write(self, batch):
+        """Write a batch and resolve every pending kudo in it; never raises"""
+        # Requests that timed out have taken theirs back
+        batch = [pending for pending in batch if pending.claim()]
+        by_database = defaultdict(list)
+        try:
+            for pending in batch:
+                by_database[pending.kudo.sender.shard].append(pending)
+        except Exception as error:
+            # The shard directory could not be read
+            self.resolve(batch, error)
+            return
+
+        for using, pendings in by_database.items():
+            try:
+                created = write_kudos(pendings, using)
+            except Exception as error:
+                self.resolve(pendings, error)
+            else:
+                self.resolve(pendings)
+                events.broker.publish_kudos(created)
+
+    def resolve(self, pendings, error=None):
+        for pending in pendings:
+            if error is not None:
+                pending.error = error
+            pending.done.set()
+
+
+def write_kudos(pendings, using):
+    """
+    Insert the pending kudos in one transaction on ``using``; returns the created kudos.
+
+    Each sender's kudos are admitted in queue order up to their remaining
+    weekly quota. The rest get ``QuotaExceeded``.
+    """
+    by_sender = defaultdict(list)
+    for pending in pendings:
+        by_sender[pending.kudo.sender_id].append(pending)
+
+    with transaction.atomic(using=using):
+        taken = WeeklyQuota.reserve_many({sender_id: len(queued) for sender_id, queued in by_sender.items()},
+                                         using=using)
+        accepted = []
+        for sender_id, queued in by_sender.items():
+            accepted += queued[:taken[sender_id]]
+            for pending in queued[taken[sender_id]:]:
+                pending.error = QuotaExceeded()
+
+        created = [pending.kudo for pending in accepted]
+        Kudo.objects.using(using).bulk_create(created)
+
+        by_organization = defaultdict(list)
+        for kudo in created:
+            by_organization[kudo.sender.organization_id].append(kudo)
+        for organization_id, kudos in by_organization.items():
+            WeeklyActivity.record(
+                organization_id,
+                sent=Counter(kudo.sender_id for kudo in kudos),
+                received=Counter(kudo.receiver_id for kudo in kudos),
+                using=using
+            )
+    return created
+
+
+writer = GroupCommitWriter(
+    delay=getattr(settings, 'KUDOS_GROUP_COMMIT_DELAY_MS', 2) / 1000,
+    max_batch=getattr(settings, 'KUDOS_GROUP_COMMIT_MAX_BATCH', 100),
+    timeout=getattr(settings, 'KUDOS_GROUP_COMMIT_TIMEOUT', 10),
+)
@@ -0,0 +1,171 @@
+"""
+Resolve the ``X-User-ID`` header to a ``User`` (with its organization) without
+a database round trip on the hot path.
+
+Lookups go through a small per-process LRU with a TTL, then Django's cache
+framework, and only then the database. ``post_save``/``post_delete`` signals on
+``User`` and ``Organization`` (see ``signals.py``) evict stale entries; the TTL
+bounds how long other processes can keep serving an evicted entry.
+
+Ids with no user are remembered in Django's cache for ``MISS_TTL`` seconds,
+so a client cycling through unknown ids (which the throttle looks up before
+it can charge anyone) does not reach the database on every request.
+"""
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import cache
+from .models import User
+
+
+CACHE_KEY_PREFIX = 'kudos:identity:'
+CACHE_TTL = getattr(settings, 'KUDOS_IDENTITY_CACHE_TTL', 60)
+MISS_TTL = getattr(settings, 'KUDOS_IDENTITY_MISS_TTL', 5)
+
+# Cached in place of a user for ids that have none
+_MISSING = False
+
+
+class LRUCache:
+    """Thread-safe, bounded LRU mapping whose entries expire after ``ttl`` seconds"""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_where(self, predicate):
+        with self._lock:
+            for key in [key for key, (value, _) in self._data.items() if predicate(value)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_local_cache = LRUCache(
+    maxsize=getattr(settings, 'KUDOS_IDENTITY_CACHE_SIZE', 1024),
+    ttl=CACHE_TTL,
+)
+
+
+def parse_user_id(raw_user_id):
+    """Return the header value as an int, or None if it is missing or malformed"""
+    try:
+        return int(raw_user_id)
+    except (TypeError, ValueError):
+        return None
+
+
+def get_user(user_id):
+    """
+    Return the ``User`` with ``organization`` preloaded, or None if it does not exist.
+
+    The instance may be shared between requests, so treat it as read-only.
+    """
+    user = _local_cache.get(user_id)
+    if user is not None:
+        return user
+
+    cache_key = f'{CACHE_KEY_PREFIX}{user_id}'
+    user = cache.get(cache_key)
+    if user is _MISSING:
+        return None
+    if user is None:
+        user = User.objects.select_related('organization').filter(id=user_id).first()
+        if user is None:
+            cache.set(cache_key, _MISSING, MISS_TTL)
+            return None
+        cache.set(cache_key, user, CACHE_TTL)
+
+    _local_cache.set(user_id, user)
+    return user
+
+
+async def aget_user(user_id):
+    """Async counterpart of ``get_user`` using the async cache and ORM APIs"""
+    user = _local_cache.get(user_id)
+    if user is not None:
+        return user
+
+    cache_key = f'{CACHE_KEY_PREFIX}{user_id}'
+    user = await cache.aget(cache_key)
+    if user is _MISSING:
+        return None
+    if user is None:
+        user = await User.objects.select_related('organization').filter(id=user_id).afirst()
+        if user is None:
+            await cache.aset(cache_key, _MISSING, MISS_TTL)
+            return None
+        await cache.aset(cache_key, user, CACHE_TTL)
+
+    _local_cache.set(user_id, user)
+    return user
+
+
+def resolve_request_user(request):
+    """Return ``(user_id, user)`` for the request's ``X-User-ID`` header, or ``(None, None)``"""
+    user_id = parse_user_id(request.headers.get('X-User-ID'))
+    if user_id is None:
+        return None, None
+
+    user = get_user(user_id)
+    if user is None or not user.is_active:
+        return None, None
+    return user_id, user
+
+
+async def aresolve_request_user(request):
+    user_id = parse_user_id(request.headers.get('X-User-ID'))
+    if user_id is None:
+        return None, None
+
+    user = await aget_user(user_id)
+    if user is None or not user.is_active:
+        return None, None
+    return user_id, user
+
+
+def invalidate_user(user_id):
+    _local_cache.delete(user_id)
+    cache.delete(f'{CACHE_KEY_PREFIX}{user_id}')
+
+
+def invalidate_users(user_ids):
+    """``invalidate_user`` for many users with one cache round trip (bulk writes send no signals)"""
+    for user_id in user_ids:
+        _local_cache.delete(user_id)
+    cache.delete_many([f'{CACHE_KEY_PREFIX}{user_id}' for user_id in user_ids])
+
+
+def invalidate_organization(organization_id):
+    """Evict every cached user belonging to the organization"""
+    _local_cache.delete_where(lambda user: user.organization_id == organization_id)
+    user_ids = User.objects.filter(organization_id=organization_id).values_list('id', flat=True)
+    cache.delete_many([f'{CACHE_KEY_PREFIX}{user_id}' for user_id in user_ids])
@@ -0,0 +1,230 @@
+"""
+Bulk sync of the user directory from a CSV or NDJSON file (``manage.py import_directory``).
+
+Each row names a user: ``username``, ``email`` and ``organization`` (a name;
+``default_organization`` fills in rows without one). Rows are streamed and
+applied ``chunk_size`` at a time. A chunk costs one query for organization
+names not seen before, one ``username IN (...)`` query against the existing
+users, and then a ``bulk_create`` of new users plus a ``bulk_update`` of
+changed ones, in a single transaction. Memory stays proportional to the
+chunk, not the file.
+
+Bulk writes send no ``post_save`` signals (see ``signals.py``), so each chunk
+does their work itself. It evicts written users from the identity cache (new
+ones may be cached there as unknown ids), bumps the directory version of
+every organization it touched, and replicates new organizations and users to
+their shards.
+
+With ``track_seen`` the ids of the users in the file are collected in a
+temporary table. ``deactivate_missing`` then clears ``User.is_active`` for
+active members of the file's organizations who are not in it. Users are
+never deleted, so their kudos stay.
+"""
+import csv
+import json
+import time
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import connections, transaction
+from django.db.models.expressions import RawSQL
+from . import directory, identity, sharding
+from .models import Organization, User
+
+
+FORMATS = ('csv', 'ndjson')
+CHUNK_SIZE = 5000
+# Invalid rows reported one by one; any beyond this are only counted
+MAX_ERRORS = 20
+SEEN_TABLE = 'kudos_import_seen'
+USERNAME_LENGTH = User._meta.get_field('username').max_length
+ORGANIZATION_NAME_LENGTH = Organization._meta.get_field('name').max_length
+
+
+def detect_format(path):
+    """``'csv'`` or ``'ndjson'`` from the file extension, or None"""
+    if path.endswith('.csv'):
+        return 'csv'
+    if path.endswith(('.ndjson', '.jsonl')):
+        return 'ndjson'
+    return None
+
+
+def read_rows(stream, format):
+    """Yield ``(line number, row)`` for each record; ``row`` is a dict, or None when the line does not parse"""
+    if format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+
+    for line_number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield line_number, row if isinstance(row, dict) else None
+
+
+class DirectoryImport:
+    """
+    One sync run. Counters are attributes; ``run`` and ``deactivate_missing`` yield after every chunk.
+
+    Use it as a context manager so the temporary table behind ``track_seen`` is dropped.
+    """
+
+    def __init__(self, default_organization=None, track_seen=False, chunk_size=CHUNK_SIZE):
+        self.default_organization = default_organization
+        self.track_seen = track_seen
+        self.chunk_size = chunk_size
+        self.organization_ids = {}  # Name -> id of every organization named in the file
+        self.rows = self.created = self.updated = self.unchanged = self.skipped = self.deactivated = 0
+        self.organizations_created = 0
+        self.errors = []
+        self.started = time.perf_counter()
+
+    def __enter__(self):
+        if self.track_seen:
+            with connections[sharding.DIRECTORY_DATABASE].cursor() as cursor:
+                cursor.execute(f'CREATE TEMPORARY TABLE {SEEN_TABLE} (id BIGINT PRIMARY KEY)')
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.track_seen:
+            with connections[sharding.DIRECTORY_DATABASE].cursor() as cursor:
+                cursor.execute(f'DROP TABLE {SEEN_TABLE}')
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def rate(self):
+        """Rows per second since the run started"""
+        return self.rows / max(self.elapsed, 1e-9)
+
+    def run(self, rows):
+        """Sync ``(line number, row)`` pairs from ``read_rows``"""
+        chunk = []
+        for line_number, row in rows:
+            self.rows += 1
+            user = self.clean(line_number, row)
+            if user is not None:
+                chunk.append(user)
+            if len(chunk) >= self.chunk_size:
+                self.apply(chunk)
+                chunk = []
+                yield self
+        if chunk:
+            self.apply(chunk)
+            yield self
+
+    def clean(self, line_number, row):
+        """``(username, email, organization name)``, or None after recording why the row is skipped"""
+        if row is None:
+            return self.skip(line_number, 'not a valid record')
+
+        username = str(row.get('username') or '').strip()
+        email = str(row.get('email') or '').strip()
+        organization = str(row.get('organization') or '').strip() or self.default_organization
+        if not username or len(username) > USERNAME_LENGTH:
+            return self.skip(line_number, f'username must be 1 to {USERNAME_LENGTH} characters')
+        if not organization:
+            return self.skip(line_number, 'no organization (add an organization column or pass --organization)')
+        if len(organization) > ORGANIZATION_NAME_LENGTH:
+            return self.skip(line_number, f'organization name longer than {ORGANIZATION_NAME_LENGTH} characters')
+        try:
+            validate_email(email)
+        except ValidationError:
+            return self.skip(line_number, f'invalid email {email!r}')
+        return username, email, organization
+
+    def skip(self, line_number, reason):
+        self.skipped += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append(f'line {line_number}: {reason}')
+        return None
+
+    def resolve_organizations(self, names):
+        """Map organization names to ids, creating the missing organizations"""
+        missing = names - self.organization_ids.keys()
+        if not missing:
+            return
+        organizations = Organization.objects.using(sharding.DIRECTORY_DATABASE)
+        self.organization_ids.update(organizations.filter(name__in=missing).values_list('name', 'id'))
+        new = [Organization(name=name) for name in sorted(missing - self.organization_ids.keys())]
+        if not new:
+            return
+
+        organizations.bulk_create(new)
+        sharding.place_organizations([organization.pk for organization in new])
+        if sharding.is_sharded():
+            sharding.replicate(new)
+        directory.bump_version(directory.ORGANIZATIONS_SCOPE)
+        self.organization_ids.update((organization.name, organization.pk) for organization in new)
+        self.organizations_created += len(new)
+
+    def apply(self, chunk):
+        """Insert new users and update changed ones in one transaction; a repeated username's last row wins"""
+        rows = {username: (email, organization) for username, email, organization in chunk}
+        self.resolve_organizations({organization for _, organization in rows.values()})
+
+        users = User.objects.using(sharding.DIRECTORY_DATABASE)
+        created, updated, touched = [], [], set()
+        with transaction.atomic(using=sharding.DIRECTORY_DATABASE):
+            existing = users.filter(username__in=rows).in_bulk(field_name='username')
+            for username, (email, organization) in rows.items():
+                organization_id = self.organization_ids[organization]
+                user = existing.get(username)
+                if user is None:
+                    created.append(User(username=username, email=email, organization_id=organization_id))
+                elif (user.email, user.organization_id, user.is_active) != (email, organization_id, True):
+                    touched.add(user.organization_id)  # A move changes the old organization's directory too
+                    user.email, user.organization_id, user.is_active = email, organization_id, True
+                    updated.append(user)
+                else:
+                    continue
+                touched.add(organization_id)
+
+            users.bulk_create(created)
+            users.bulk_update(updated, ['email', 'organization', 'is_active'])
+            if self.track_seen:
+                seen = [(user.pk,) for user in created] + [(user.pk,) for user in existing.values()]
+                with connections[sharding.DIRECTORY_DATABASE].cursor() as cursor:
+                    cursor.executemany(f'INSERT INTO {SEEN_TABLE} (id) VALUES (%s) ON CONFLICT DO NOTHING', seen)
+
+        self.after_write(created + updated, touched)
+        self.created += len(created)
+        self.updated += len(updated)
+        self.unchanged += len(chunk) - len(created) - len(updated)
+
+    def deactivate_missing(self):
+        """Deactivate active members of the file's organizations that the file did not list"""
+        missing = User.objects.using(sharding.DIRECTORY_DATABASE).filter(
+            organization_id__in=self.organization_ids.values(), is_active=True
+        ).exclude(id__in=RawSQL(f'SELECT id FROM {SEEN_TABLE}', [])).order_by('id')
+
+        after = 0
+        while True:
+            users = list(missing.filter(id__gt=after)[:self.chunk_size])
+            if not users:
+                return
+            User.objects.using(sharding.DIRECTORY_DATABASE).filter(
+                id__in=[user.pk for user in users]
+            ).update(is_active=False)
+            for user in users:
+                user.is_active = False
+
+            self.after_write(users, {user.organization_id for user in users})
+            self.deactivated += len(users)
+            after = users[-1].pk
+            yield self
+
+    def after_write(self, users, organization_ids):
+        """What the save signals would have done for these rows"""
+        identity.invalidate_users([user.pk for user in users])
+        for organization_id in organization_ids:
+            directory.bump_version(organization_id)
+        if sharding.is_sharded():
+            sharding.replicate(users)
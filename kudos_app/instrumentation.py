@@ -0,0 +1,225 @@
+"""
+Opt-in per-request SQL and timing instrumentation.
+
+When ``KUDOS_INSTRUMENTATION`` is enabled, ``RequestInstrumentationMiddleware``
+wraps every database call made while handling a request (via
+``connection.execute_wrapper``). It records query count, SQL time, the slowest
+statements and repeated statement fingerprints. It also records time spent
+serializing (DRF ``serializer.data`` and the functions marked with
+``serialization``, minus any SQL they trigger), rendering, and everything
+else (middleware, authentication, throttling, view logic). The numbers are
+sent back in a ``Server-Timing`` header and folded into a rolling per-view
+histogram that the debug-only ``debug/stats/`` endpoint exposes.
+"""
+import re
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from contextlib import ExitStack
+from contextvars import ContextVar
+from functools import wraps
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from rest_framework.serializers import BaseSerializer
+from .metrics import percentile
+
+
+SLOWEST_STATEMENTS = getattr(settings, 'KUDOS_INSTRUMENTATION_SLOWEST', 3)
+WINDOW_SIZE = getattr(settings, 'KUDOS_INSTRUMENTATION_WINDOW', 1000)
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open-ended
+HISTOGRAM_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+# The instrumented request's SerializationTimer, if any
+_serialization = ContextVar('kudos_serialization', default=None)
+
+_IN_LIST = re.compile(r'\((?:\s*%s\s*,)+\s*%s\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """Normalize a statement so repeats with different parameters or IN-list lengths compare equal"""
+    return _WHITESPACE.sub(' ', _IN_LIST.sub('(...)', sql)).strip()
+
+
+class QueryRecorder:
+    """``execute_wrapper`` callable that times each statement"""
+
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.statements.append((sql, time.perf_counter() - started))
+
+    @property
+    def total_seconds(self):
+        return sum(duration for _, duration in self.statements)
+
+    def slowest(self, limit=SLOWEST_STATEMENTS):
+        return sorted(self.statements, key=lambda statement: statement[1], reverse=True)[:limit]
+
+    def duplicates(self):
+        counts = Counter(fingerprint(sql) for sql, _ in self.statements)
+        return {sql: count for sql, count in counts.items() if count > 1}
+
+
+class SerializationTimer:
+    """Serialization time of one request, excluding the SQL that ran inside it"""
+
+    def __init__(self, recorder):
+        self.recorder = recorder
+        self.seconds = 0.0
+        self.active = False  # Nested serializers are timed by the outermost call only
+
+    def measure(self, function, *args, **kwargs):
+        if self.active:
+            return function(*args, **kwargs)
+        self.active = True
+        sql_before = self.recorder.total_seconds
+        started = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.seconds += max(0.0, elapsed - (self.recorder.total_seconds - sql_before))
+            self.active = False
+
+
+def serialization(function):
+    """Count calls to ``function`` as serialization time of the instrumented request, if there is one"""
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        timer = _serialization.get()
+        if timer is None:
+            return function(*args, **kwargs)
+        return timer.measure(function, *args, **kwargs)
+    return wrapper
+
+
+def _time_serializer_data():
+    """Route every DRF ``serializer.data`` through ``serialization`` (subclasses reach it via super())"""
+    data = BaseSerializer.data
+    if getattr(data.fget, '_kudos_timed', False):
+        return
+    timed = serialization(data.fget)
+    timed._kudos_timed = True
+    BaseSerializer.data = property(timed)
+
+
+class RollingStats:
+    """Thread-safe per-view window of the most recent request measurements"""
+
+    def __init__(self, window=WINDOW_SIZE):
+        self.window = window
+        self._samples = defaultdict(lambda: deque(maxlen=self.window))
+        self._duplicates = defaultdict(Counter)
+        self._lock = threading.Lock()
+
+    def record(self, view_name, total_ms, sql_ms, queries, duplicates):
+        with self._lock:
+            self._samples[view_name].append((total_ms, sql_ms, queries))
+            self._duplicates[view_name].update(duplicates.keys())
+
+    def snapshot(self):
+        with self._lock:
+            samples = {name: list(rows) for name, rows in self._samples.items()}
+            duplicates = {name: counter.most_common(5) for name, counter in self._duplicates.items()}
+
+        report = {}
+        for name, rows in sorted(samples.items()):
+            totals = sorted(row[0] for row in rows)
+            report[name] = {
+                'requests': len(rows),
+                'p50_ms': round(percentile(totals, 50), 3),
+                'p95_ms': round(percentile(totals, 95), 3),
+                'p99_ms': round(percentile(totals, 99), 3),
+                'mean_sql_ms': round(sum(row[1] for row in rows) / len(rows), 3),
+                'mean_queries': round(sum(row[2] for row in rows) / len(rows), 2),
+                'histogram_ms': _histogram(totals),
+                'duplicate_queries': [{'sql': sql, 'requests': count} for sql, count in duplicates.get(name, [])],
+            }
+        return report
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+            self._duplicates.clear()
+
+
+def _histogram(values):
+    counts = [0] * (len(HISTOGRAM_BUCKETS_MS) + 1)
+    for value in values:
+        index = next((i for i, bound in enumerate(HISTOGRAM_BUCKETS_MS) if value <= bound), len(HISTOGRAM_BUCKETS_MS))
+        counts[index] += 1
+    labels = [f'<={bound}' for bound in HISTOGRAM_BUCKETS_MS] + [f'>{HISTOGRAM_BUCKETS_MS[-1]}']
+    return dict(zip(labels, counts))
+
+
+stats = RollingStats()
+
+
+class RequestInstrumentationMiddleware:
+    """Adds a Server-Timing header and feeds ``stats``; removed from the stack unless KUDOS_INSTRUMENTATION is set"""
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'KUDOS_INSTRUMENTATION', False):
+            raise MiddlewareNotUsed
+        _time_serializer_data()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        timer = SerializationTimer(recorder)
+        request._instrumentation_render = [0.0, 0.0]
+        token = _serialization.set(timer)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(recorder))
+                response = self.get_response(request)
+        finally:
+            _serialization.reset(token)
+        total = time.perf_counter() - started
+
+        render_started, render_finished = request._instrumentation_render
+        render = max(0.0, render_finished - render_started)
+        sql = recorder.total_seconds
+        serialize = timer.seconds
+        other = max(0.0, total - render - sql - serialize)
+
+        metrics = [
+            f'db;dur={sql * 1000:.2f};desc="{len(recorder.statements)} queries"',
+            f'serialize;dur={serialize * 1000:.2f}',
+            f'render;dur={render * 1000:.2f}',
+            f'other;dur={other * 1000:.2f};desc="middleware, auth, view logic"',
+            f'total;dur={total * 1000:.2f}',
+        ]
+        duplicates = recorder.duplicates()
+        if duplicates:
+            metrics.append(f'dup;desc="{sum(duplicates.values())} repeated queries"')
+        for index, (_, duration) in enumerate(recorder.slowest(), start=1):
+            metrics.append(f'sql{index};dur={duration * 1000:.2f}')
+        response['Server-Timing'] = ', '.join(metrics)
+
+        match = getattr(request, 'resolver_match', None)
+        stats.record(
+            match.view_name if match else 'unresolved',
+            total * 1000, sql * 1000, len(recorder.statements), duplicates
+        )
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF responses render right after this hook returns; time it up to the post-render callback
+        timings = request._instrumentation_render
+        timings[0] = time.perf_counter()
+
+        def finished_rendering(rendered_response):
+            timings[1] = time.perf_counter()
+
+        response.add_post_render_callback(finished_rendering)
+        return response
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from datetime import timedelta
+from kudos_app.archive import MIN_RETENTION_DAYS, archive_before
+from kudos_app.sharding import get_shards
+
+
+class Command(BaseCommand):
+    help = 'Move kudos older than the retention window from the hot Kudo table into the archive table'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than',
+            type=int,
+            required=True,
+            metavar='DAYS',
+            help=f'Archive kudos created more than DAYS days ago (at least {MIN_RETENTION_DAYS})',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Kudos moved per transaction (default 1000)',
+        )
+
+    def handle(self, *args, **options):
+        if options['older_than'] < MIN_RETENTION_DAYS:
+            raise CommandError(f'--older-than must be at least {MIN_RETENTION_DAYS} days to keep the current week hot')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+
+        cutoff = timezone.now() - timedelta(days=options['older_than'])
+        self.stdout.write(f'Archiving kudos created before {cutoff:%Y-%m-%d %H:%M}...')
+
+        total = 0
+        for database in get_shards():
+            moved = 0
+            for moved in archive_before(cutoff, using=database, batch_size=options['batch_size']):
+                self.stdout.write(f'  {database}: {moved} kudos archived')
+            total += moved
+
+        self.stdout.write(self.style.SUCCESS(f'Archived {total} kudos.'))
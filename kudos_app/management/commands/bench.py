@@ -0,0 +1,239 @@
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+from io import StringIO
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from kudos_app import bench
+from kudos_app.sqlite import read_pragmas
+from kudos_backend.settings_production import KUDOS_SQLITE_PRAGMAS as PRODUCTION_PRAGMAS
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark every API endpoint against a freshly seeded throwaway database and '
+        'fail if latency or query budgets in the baseline are exceeded'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orgs', type=int, default=5, help='Organizations to seed (default 5)')
+        parser.add_argument('--users-per-org', type=int, default=50, help='Users per organization (default 50)')
+        parser.add_argument('--kudos-per-user', type=int, default=8, help='Kudos sent per user (default 8)')
+        parser.add_argument('--weeks', type=int, default=8, help='Weeks of kudo history (default 8)')
+        parser.add_argument('--seed', type=int, default=0, help='Seed for data and request mix (default 0)')
+        parser.add_argument('--requests', type=int, default=2000, help='Requests to replay (default 2000)')
+        parser.add_argument('--write-ratio', type=float, default=0.1, help='Share of write requests (default 0.1)')
+        parser.add_argument('--baseline', default=str(bench.DEFAULT_BASELINE_PATH), help='Baseline JSON path')
+        parser.add_argument('--update-baseline', action='store_true', help='Write this run as the new baseline')
+        parser.add_argument('--output', help='Also write the full results as JSON to this path')
+        parser.add_argument(
+            '--compare-asgi',
+            action='store_true',
+            help='Instead of the budget run, compare read throughput of WSGI (sync views) and ASGI (async views)',
+        )
+        parser.add_argument(
+            '--serialization',
+            action='store_true',
+            help='Instead of the budget run, compare list serialization rows/s: ModelSerializer vs .values() + orjson',
+        )
+        parser.add_argument(
+            '--write-burst',
+            action='store_true',
+            help='Instead of the budget run, run readers alongside a kudo write burst on a file-backed database, '
+                 'once with default SQLite settings and once with the production pragmas',
+        )
+        parser.add_argument('--readers', type=int, default=8, help='Reader threads for --write-burst (default 8)')
+        parser.add_argument('--writers', type=int, default=4, help='Writer threads for --write-burst (default 4)')
+        parser.add_argument(
+            '--writes-per-writer', type=int, default=50, help='Kudos each writer posts for --write-burst (default 50)'
+        )
+        parser.add_argument(
+            '--group-commit',
+            action='store_true',
+            help='Instead of the budget run, compare a burst of kudo creations with per-request commits '
+                 'and with KUDOS_GROUP_COMMIT, on a file-backed database with the production pragmas',
+        )
+        parser.add_argument(
+            '--burst-writers', type=int, default=32, help='Concurrent writers for --group-commit (default 32)'
+        )
+        parser.add_argument(
+            '--throttle',
+            action='store_true',
+            help='Instead of the budget run, measure the latency the throttling middleware adds to read requests',
+        )
+        parser.add_argument('--rows', type=int, default=5000, help='Rows per list for --serialization (default 5000)')
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=50,
+            help='Requests in flight for --compare-asgi (default 50)',
+        )
+
+    def handle(self, *args, **options):
+        if options['write_burst']:
+            return self.handle_write_burst(options)
+        if options['group_commit']:
+            return self.handle_group_commit(options)
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            self.seed(options)
+            if options['throttle']:
+                self.stdout.write(f"Replaying {options['requests']} reads with and without throttling...")
+                throttle = bench.run_throttle_benchmark(requests=options['requests'], seed=options['seed'])
+            elif options['serialization']:
+                self.stdout.write(f"Rendering up to {options['rows']} rows per list...")
+                serialization = bench.run_serialization_benchmark(rows=options['rows'])
+            elif options['compare_asgi']:
+                comparison = {}
+                for mode in ('wsgi', 'asgi'):
+                    self.stdout.write(
+                        f"Replaying {options['requests']} reads via {mode.upper()} "
+                        f"with {options['concurrency']} in flight..."
+                    )
+                    comparison[mode] = bench.run_concurrency_benchmark(
+                        mode,
+                        requests=options['requests'],
+                        concurrency=options['concurrency'],
+                        seed=options['seed'],
+                    )
+            else:
+                self.stdout.write(f"Replaying {options['requests']} requests...")
+                results = bench.run_benchmark(
+                    requests=options['requests'],
+                    write_ratio=options['write_ratio'],
+                    seed=options['seed'],
+                )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        if options['throttle']:
+            self.stdout.write(f"Bucket check: {throttle['check_us']} us per request")
+            for mode in ('off', 'on'):
+                row = throttle[mode]
+                self.stdout.write(
+                    f"Throttling {mode:<3}: p50 {row['p50_ms']:.3f} ms, p95 {row['p95_ms']:.3f} ms, "
+                    f"mean {row['mean_ms']:.3f} ms"
+                )
+            return
+
+        if options['serialization']:
+            self.print_serialization_report(serialization)
+            return
+
+        if options['compare_asgi']:
+            for mode, mode_results in comparison.items():
+                self.stdout.write(f'\n{mode.upper()}')
+                self.print_report(mode_results)
+            return
+
+        self.print_report(results)
+
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                json.dump(results, output_file, indent=2)
+
+        if options['update_baseline']:
+            with open(options['baseline'], 'w') as baseline_file:
+                json.dump(bench.make_baseline(results), baseline_file, indent=2, sort_keys=True)
+                baseline_file.write('\n')
+            self.stdout.write(self.style.SUCCESS(f"Baseline written to {options['baseline']}"))
+            return
+
+        violations = bench.check_against_baseline(results, bench.load_baseline(options['baseline']))
+        if violations:
+            raise CommandError('Benchmark budgets exceeded:\n  ' + '\n  '.join(violations))
+        self.stdout.write(self.style.SUCCESS('All endpoints within budget.'))
+
+    def seed(self, options):
+        self.stdout.write('Seeding benchmark dataset...')
+        call_command(
+            'generate_demo_data',
+            orgs=options['orgs'],
+            users_per_org=options['users_per_org'],
+            kudos_per_user=options['kudos_per_user'],
+            weeks=options['weeks'],
+            seed=options['seed'],
+            stdout=StringIO(),
+        )
+
+    @contextmanager
+    def file_test_database(self, options, pragmas):
+        """Seed a throwaway database on a real file: WAL and locking don't behave realistically in memory"""
+        test_settings = connection.settings_dict.setdefault('TEST', {})
+        old_test_name = test_settings.get('NAME')
+        setup_test_environment()
+        try:
+            with tempfile.TemporaryDirectory() as directory, override_settings(KUDOS_SQLITE_PRAGMAS=pragmas):
+                test_settings['NAME'] = os.path.join(directory, 'bench.sqlite3')
+                old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+                try:
+                    self.seed(options)
+                    yield
+                finally:
+                    connection.creation.destroy_test_db(old_name, verbosity=0)
+        finally:
+            test_settings['NAME'] = old_test_name
+            teardown_test_environment()
+
+    def handle_write_burst(self, options):
+        for profile, pragmas in (('default', {}), ('production', PRODUCTION_PRAGMAS)):
+            with self.file_test_database(options, pragmas):
+                journal_mode = read_pragmas(connection, ['journal_mode'])['journal_mode']
+                self.stdout.write(
+                    f"{profile} ({journal_mode}): {options['readers']} readers, "
+                    f"{options['writers']} writers x {options['writes_per_writer']} kudos..."
+                )
+                results = bench.run_write_burst_benchmark(
+                    readers=options['readers'],
+                    writers=options['writers'],
+                    writes_per_writer=options['writes_per_writer'],
+                    seed=options['seed'],
+                )
+            self.stdout.write(
+                f"  {results['reads']} reads ({results['read_rps']} req/s), "
+                f"{results['writes']} writes ({results['write_rps']} req/s), "
+                f"{results['lock_errors']} lock errors, {results['server_errors']} server errors\n"
+            )
+
+    def handle_group_commit(self, options):
+        # Both runs use the production SQLite profile; only the commit strategy differs
+        for mode, enabled in (('per-request commit', False), ('group commit', True)):
+            with self.file_test_database(options, PRODUCTION_PRAGMAS), override_settings(KUDOS_GROUP_COMMIT=enabled):
+                self.stdout.write(f"{mode}: {options['burst_writers']} concurrent writers...")
+                results = bench.run_kudo_burst_benchmark(writers=options['burst_writers'], seed=options['seed'])
+            self.stdout.write(
+                f"  {results['created']} kudos in {results['wall_seconds']}s ({results['created_per_second']} kudos/s), "
+                f"p50 {results['p50_ms']:.1f} ms, p95 {results['p95_ms']:.1f} ms, p99 {results['p99_ms']:.1f} ms, "
+                f"{results['rejected']} rejected, {results['server_errors']} server errors\n"
+            )
+
+    def print_serialization_report(self, results):
+        header = f"{'list':<8}{'mode':<16}{'rows':>7}{'ms':>10}{'rows/s':>12}{'speedup':>9}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for name, modes in results.items():
+            for mode, row in modes.items():
+                self.stdout.write(
+                    f"{name:<8}{mode:<16}{row['rows']:>7}{row['seconds'] * 1000:>10.1f}"
+                    f"{row['rows_per_second']:>12,}{row['speedup']:>8.2f}x"
+                )
+
+    def print_report(self, results):
+        header = f"{'endpoint':<24}{'reqs':>6}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'req/s':>9}{'queries':>9}{'max q':>7}{'4xx':>6}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for name, row in results['endpoints'].items():
+            self.stdout.write(
+                f"{name:<24}{row['requests']:>6}{row['p50_ms']:>9.2f}{row['p95_ms']:>9.2f}{row['p99_ms']:>9.2f}"
+                f"{row['throughput_rps']:>9.0f}{row['mean_queries']:>9.2f}{row['max_queries']:>7}{row['client_errors']:>6}"
+            )
+        total = results['total']
+        self.stdout.write(
+            f"\n{total['requests']} requests in {total['wall_seconds']}s ({total['throughput_rps']} req/s overall)"
+        )
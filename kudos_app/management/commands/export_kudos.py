@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+from kudos_app import exports
+from kudos_app.models import Organization
+from kudos_app.sharding import db_for_organization
+
+
+class Command(BaseCommand):
+    help = "Stream an organization's kudos for a date range as NDJSON or CSV"
+
+    def add_arguments(self, parser):
+        parser.add_argument('organization', help='Organization id or name')
+        parser.add_argument('--start', help='First day to include (YYYY-MM-DD)')
+        parser.add_argument('--end', help='Last day to include (YYYY-MM-DD)')
+        parser.add_argument('--format', choices=sorted(exports.EXPORT_FORMATS), default='ndjson')
+        parser.add_argument('--output', help='File to write (default: stdout)')
+
+    def handle(self, *args, **options):
+        lookup = {'id': int(options['organization'])} if options['organization'].isdigit() else {'name': options['organization']}
+        try:
+            organization = Organization.objects.get(**lookup)
+        except Organization.DoesNotExist:
+            raise CommandError(f"Organization {options['organization']!r} not found")
+
+        try:
+            start, end = exports.parse_date_range(options['start'], options['end'])
+        except ValueError as error:
+            raise CommandError(str(error))
+
+        _, encode = exports.EXPORT_FORMATS[options['format']]
+        rows = 0
+        output = open(options['output'], 'w', encoding='utf-8', newline='') if options['output'] else None
+        try:
+            for line in encode(exports.export_rows(organization.id, start, end, using=db_for_organization(organization.id))):
+                if output:
+                    output.write(line)
+                else:
+                    self.stdout.write(line, ending='')
+                rows += 1
+        finally:
+            if output:
+                output.close()
+
+        if options['format'] == 'csv':
+            rows -= 1  # header
+        self.stderr.write(f'Exported {rows} kudos from {organization.name}.')
@@ -1,11 +1,44 @@
-from django.core.management.base import BaseCommand
+import random
+import time
+from django.core.management.base import BaseCommand, CommandError
 from django.db import transaction
-from datetime import datetime, timedelta
-from kudos_app.models import Organization, User, Kudo
+from django.db.models import Count
+from django.utils import timezone
+from datetime import timedelta
+from kudos_app.models import (
+    Organization, User, Kudo, ArchivedKudo, WeeklyActivity, WeeklyQuota, WEEKLY_KUDOS_LIMIT, explicit_created_at,
+    get_week_start, get_week_bounds
+)
+from kudos_app.sharding import DIRECTORY_DATABASE, db_for_organization, get_shards, place_organizations, replicate
+
+
+# Predefined static messages
+MESSAGES = [
+    "Great teamwork!",
+    "Thanks for your help!",
+    "Awesome contribution!",
+    "Really appreciated your effort!",
+    "Fantastic work on the project!",
+]
+
+SYNTHETIC_DEFAULTS = {
+    'orgs': 10,
+    'users_per_org': 100,
+    'kudos_per_user': 3,
+    'weeks': 4,
+    'seed': 0,
+}
+
+# Per-organization user listings are only printed for small datasets
+SUMMARY_USER_LIMIT = 50
 
 
 class Command(BaseCommand):
-    help = 'Generate demo data for the Kudos application (hardcoded, no randomness)'
+    help = (
+        'Generate demo data for the Kudos application. Without scale options this creates the '
+        'hardcoded demo dataset; with --orgs/--users-per-org/--kudos-per-user/--weeks/--seed it '
+        'creates a deterministic synthetic dataset for load testing.'
+    )
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -18,23 +51,64 @@ class Command(BaseCommand):
             action='store_true',
             help='Clear existing data without generating new data',
         )
+        parser.add_argument(
+            '--orgs',
+            type=int,
+            help=f'Synthetic mode: number of organizations (default {SYNTHETIC_DEFAULTS["orgs"]})',
+        )
+        parser.add_argument(
+            '--users-per-org',
+            type=int,
+            help=f'Synthetic mode: users per organization (default {SYNTHETIC_DEFAULTS["users_per_org"]})',
+        )
+        parser.add_argument(
+            '--kudos-per-user',
+            type=int,
+            help=f'Synthetic mode: kudos sent by each user (default {SYNTHETIC_DEFAULTS["kudos_per_user"]})',
+        )
+        parser.add_argument(
+            '--weeks',
+            type=int,
+            help=f'Synthetic mode: weeks of history to spread kudos over (default {SYNTHETIC_DEFAULTS["weeks"]})',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            help=f'Synthetic mode: random seed (default {SYNTHETIC_DEFAULTS["seed"]})',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=5000,
+            help='Synthetic mode: rows per bulk_create batch and transaction (default 5000)',
+        )
 
     def handle(self, *args, **options):
         if options['clear'] or options['clear_only']:
             self.stdout.write('Clearing existing data...')
-            Kudo.objects.all().delete()
-            User.objects.all().delete()
-            Organization.objects.all().delete()
+            # Shards first, then the directory (which also drops the shard placements)
+            for database in [*(shard for shard in get_shards() if shard != DIRECTORY_DATABASE), DIRECTORY_DATABASE]:
+                Kudo.objects.using(database).all().delete()
+                ArchivedKudo.objects.using(database).all().delete()
+                User.objects.using(database).all().delete()
+                Organization.objects.using(database).all().delete()
             self.stdout.write(self.style.SUCCESS('Existing data cleared.'))
 
         # If --clear-only is specified, don't generate new data
         if options['clear_only']:
             return
 
+        if any(options[name] is not None for name in SYNTHETIC_DEFAULTS):
+            params = {name: options[name] if options[name] is not None else default
+                      for name, default in SYNTHETIC_DEFAULTS.items()}
+            self.generate_synthetic(chunk_size=options['chunk_size'], **params)
+            return
+
         with transaction.atomic():
             self.create_organizations()
             self.create_users()
             self.create_kudos()
+            self.rebuild_counters()
 
         self.stdout.write(self.style.SUCCESS('Demo data generated successfully!'))
         self.print_summary()
@@ -100,18 +174,8 @@ class Command(BaseCommand):
     def create_kudos(self):
         self.stdout.write('Creating kudos...')
 
-        # Predefined static messages
-        messages = [
-            "Great teamwork!",
-            "Thanks for your help!",
-            "Awesome contribution!",
-            "Really appreciated your effort!",
-            "Fantastic work on the project!",
-        ]
-
-        # Current week range
-        current_date = datetime.now().date()
-        start_date = current_date - timedelta(days=current_date.weekday())
+        # Current week range (timezone-aware, half-open)
+        week_start, _ = get_week_bounds()
 
         kudos_created = 0
 
@@ -127,13 +191,12 @@ class Command(BaseCommand):
         for org_users in users_by_org.values():
             for i, sender in enumerate(org_users):
                 receiver = org_users[(i + 1) % len(org_users)]  # round-robin
-                message = messages[i % len(messages)]
+                message = MESSAGES[i % len(MESSAGES)]
 
                 # Fixed date: Wednesday 10 AM of current week
-                kudo_date = start_date + timedelta(days=2)
-                kudo_time = datetime.combine(kudo_date, datetime.min.time()).replace(hour=10, minute=0)
+                kudo_time = week_start + timedelta(days=2, hours=10)
 
-                Kudo.objects.create(
+                Kudo.objects.using(sender.shard).create(
                     sender=sender,
                     receiver=receiver,
                     message=message,
@@ -147,20 +210,135 @@ class Command(BaseCommand):
         self.stdout.write(f'  Created {kudos_created} kudos (hardcoded)')
         self.stdout.write(f'  Ensured each user has at least 2 kudos remaining')
 
+    def generate_synthetic(self, orgs, users_per_org, kudos_per_user, weeks, seed, chunk_size):
+        """Create a deterministic dataset of orgs * users_per_org users and kudos_per_user kudos each"""
+        if min(orgs, users_per_org, weeks, chunk_size) < 1 or kudos_per_user < 0:
+            raise CommandError('--orgs, --users-per-org, --weeks and --chunk-size must be positive')
+        if users_per_org < 2 and kudos_per_user:
+            raise CommandError('--users-per-org must be at least 2 to send kudos')
+        if -(-kudos_per_user // weeks) > WEEKLY_KUDOS_LIMIT:
+            self.stdout.write(self.style.WARNING(
+                f'  {kudos_per_user} kudos over {weeks} weeks exceeds the weekly limit of {WEEKLY_KUDOS_LIMIT}'
+            ))
+
+        org_names = [f'Synthetic {seed}-{index:05d}' for index in range(orgs)]
+        if Organization.objects.filter(name__in=org_names[:1]).exists():
+            raise CommandError(f'Synthetic data for seed {seed} already exists; rerun with --clear or another --seed')
+
+        rng = random.Random(seed)
+        week_start, _ = get_week_bounds()
+        now = timezone.now()
+        total_kudos = orgs * users_per_org * kudos_per_user
+        self.stdout.write(
+            f'Generating {orgs} orgs, {orgs * users_per_org} users and {total_kudos} kudos '
+            f'over {weeks} weeks (seed {seed})...'
+        )
+
+        started = time.monotonic()
+        Organization.objects.bulk_create([Organization(name=name) for name in org_names], batch_size=chunk_size)
+        org_ids = dict(Organization.objects.filter(name__in=org_names).values_list('name', 'id'))
+        # bulk_create skips the replication signals, so place and copy the rows explicitly
+        place_organizations(list(org_ids.values()))
+        replicate(Organization.objects.filter(id__in=org_ids.values()))
+
+        kudos_written = 0
+        for org_index, org_name in enumerate(org_names):
+            org_id = org_ids[org_name]
+            usernames = [f's{seed}_{org_index}_{user_index}' for user_index in range(users_per_org)]
+            for offset in range(0, users_per_org, chunk_size):
+                with transaction.atomic():
+                    User.objects.bulk_create([
+                        User(username=username, email=f'{username}@example.com', organization_id=org_id)
+                        for username in usernames[offset:offset + chunk_size]
+                    ])
+            replicate(User.objects.filter(organization_id=org_id))
+            user_ids = list(User.objects.filter(organization_id=org_id).order_by('username').values_list('id', flat=True))
+            shard = db_for_organization(org_id)
+
+            batch = []
+            for sender_index, sender_id in enumerate(user_ids):
+                for kudo_index in range(kudos_per_user):
+                    # Any colleague except the sender
+                    receiver_index = rng.randrange(users_per_org - 1)
+                    if receiver_index >= sender_index:
+                        receiver_index += 1
+                    batch.append(Kudo(
+                        sender_id=sender_id,
+                        receiver_id=user_ids[receiver_index],
+                        message=MESSAGES[rng.randrange(len(MESSAGES))],
+                        created_at=self.synthetic_timestamp(rng, week_start, now, kudo_index % weeks),
+                    ))
+                    if len(batch) >= chunk_size:
+                        kudos_written += self.flush_kudos(batch, shard)
+                        batch = []
+                        self.report_progress(kudos_written, total_kudos, started)
+            kudos_written += self.flush_kudos(batch, shard)
+            self.report_progress(kudos_written, total_kudos, started)
+
+        self.rebuild_counters()
+        self.stdout.write(self.style.SUCCESS(
+            f'Synthetic data generated in {time.monotonic() - started:.1f}s.'
+        ))
+        self.print_summary()
+
+    def synthetic_timestamp(self, rng, week_start, now, weeks_ago):
+        """A seeded point in the week ``weeks_ago`` weeks back, never later than now"""
+        start = week_start - timedelta(weeks=weeks_ago)
+        span = min(timedelta(weeks=1), now - start)
+        return start + span * rng.random()
+
+    def flush_kudos(self, batch, using=DIRECTORY_DATABASE):
+        if not batch:
+            return 0
+        with transaction.atomic(using=using), explicit_created_at(Kudo):
+            Kudo.objects.using(using).bulk_create(batch)
+        return len(batch)
+
+    def rebuild_counters(self):
+        for database in get_shards():
+            WeeklyQuota.rebuild(since=get_week_start(), using=database)
+            WeeklyActivity.rebuild(using=database)
+
+    def report_progress(self, written, total, started):
+        elapsed = max(time.monotonic() - started, 1e-6)
+        percent = 100 * written / total if total else 100
+        self.stdout.write(f'  {written}/{total} kudos ({percent:.0f}%, {written / elapsed:,.0f} rows/s)')
+
     def print_summary(self):
-        """Print a summary of created data"""
+        """Print a summary of created data using aggregate queries"""
         self.stdout.write('\n' + '='*50)
         self.stdout.write('DEMO DATA SUMMARY')
         self.stdout.write('='*50)
         
-        for org in Organization.objects.all():
-            users_count = User.objects.filter(organization=org).count()
-            kudos_count = Kudo.objects.filter(sender__organization=org).count()
-            self.stdout.write(f'\n{org.name}:')
-            self.stdout.write(f'  Users: {users_count}')
-            self.stdout.write(f'  Kudos given: {kudos_count}')
+        users_by_org = dict(User.objects.order_by().values_list('organization_id').annotate(n=Count('id')))
+        # Each organization's kudos and quota rows live on exactly one shard
+        kudos_by_org = {}
+        used = {}
+        show_users = sum(users_by_org.values()) <= SUMMARY_USER_LIMIT
+        for database in get_shards():
+            kudos_by_org.update(
+                Kudo.objects.using(database).order_by().values_list('sender__organization_id').annotate(n=Count('id'))
+            )
+            if show_users:
+                used.update(
+                    WeeklyQuota.objects.using(database).filter(week_start=get_week_start()).values_list('user_id', 'used')
+                )
+        if show_users:
+            users = User.objects.order_by('organization_id', 'username').values_list('organization_id', 'id', 'username')
+        
+        for org_id, name in Organization.objects.order_by('name').values_list('id', 'name'):
+            self.stdout.write(f'\n{name}:')
+            self.stdout.write(f'  Users: {users_by_org.get(org_id, 0)}')
+            self.stdout.write(f'  Kudos given: {kudos_by_org.get(org_id, 0)}')
             
             # Show remaining kudos for each user
-            for user in User.objects.filter(organization=org):
-                remaining = user.get_remaining_kudos()
-                self.stdout.write(f'    {user.username}: {remaining} kudos remaining this week')
+            if show_users:
+                for user_org_id, user_id, username in users:
+                    if user_org_id == org_id:
+                        remaining = max(0, WEEKLY_KUDOS_LIMIT - used.get(user_id, 0))
+                        self.stdout.write(f'    {username}: {remaining} kudos remaining this week')
+        
+        self.stdout.write(
+            f'\nTotal: {len(users_by_org)} organizations with users, {sum(users_by_org.values())} users, '
+            f'{sum(kudos_by_org.values())} kudos'
+        )
@@ -0,0 +1,72 @@
+import sys
+from contextlib import nullcontext
+from django.core.management.base import BaseCommand, CommandError
+from kudos_app.importer import CHUNK_SIZE, FORMATS, DirectoryImport, detect_format, read_rows
+
+
+class Command(BaseCommand):
+    help = (
+        'Create and update users (and their organizations) from a CSV or NDJSON file with username, email '
+        'and organization fields, in chunks. Optionally deactivate users the file no longer lists.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import, or - for standard input (needs --format)')
+        parser.add_argument('--format', choices=FORMATS, help='File format (default: from the extension)')
+        parser.add_argument('--organization', help='Organization name for rows without an organization field')
+        parser.add_argument(
+            '--deactivate-missing',
+            action='store_true',
+            help="Deactivate active users of the file's organizations that the file does not list",
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=CHUNK_SIZE,
+            help=f'Rows diffed and written per transaction (default {CHUNK_SIZE})',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        format = options['format'] or (None if path == '-' else detect_format(path))
+        if format is None:
+            raise CommandError(f"Cannot tell the format of {path!r}; pass --format ({' or '.join(FORMATS)})")
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive')
+
+        try:
+            stream = nullcontext(sys.stdin) if path == '-' else open(path, newline='', encoding='utf-8')
+        except OSError as error:
+            raise CommandError(f'Cannot read {path}: {error.strerror}')
+
+        self.stdout.write(f'Importing {"standard input" if path == "-" else path} ({format})...')
+        with stream as rows, DirectoryImport(
+            default_organization=options['organization'],
+            track_seen=options['deactivate_missing'],
+            chunk_size=options['chunk_size'],
+        ) as sync:
+            for _ in sync.run(read_rows(rows, format)):
+                self.stdout.write(
+                    f'  {sync.rows} rows: {sync.created} created, {sync.updated} updated, '
+                    f'{sync.unchanged} unchanged, {sync.skipped} skipped ({sync.rate:,.0f} rows/s)'
+                )
+
+            for error in sync.errors:
+                self.stderr.write(f'  Skipped {error}')
+            if sync.skipped > len(sync.errors):
+                self.stderr.write(f'  ...and {sync.skipped - len(sync.errors)} more invalid rows')
+
+            if options['deactivate_missing']:
+                if sync.skipped:
+                    # A skipped row may be an existing user, who would look missing
+                    self.stderr.write(self.style.WARNING('Not deactivating anyone: fix the skipped rows first.'))
+                else:
+                    for _ in sync.deactivate_missing():
+                        self.stdout.write(f'  {sync.deactivated} users deactivated')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {sync.rows} rows in {sync.elapsed:.1f}s: '
+            f'{sync.created} users created, {sync.updated} updated, {sync.unchanged} unchanged, '
+            f'{sync.skipped} skipped, {sync.deactivated} deactivated, '
+            f'{sync.organizations_created} organizations created.'
+        ))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from kudos_app.profiling import get_directory, list_profiles, summarize
+
+
+class Command(BaseCommand):
+    help = 'List recent request profiles written by RequestProfilingMiddleware, newest first, with their hottest functions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=10, help='Profiles to list (default 10)')
+        parser.add_argument('--view', help='Only profiles of this URL name (e.g. current-user)')
+        parser.add_argument('--user', type=int, help='Only profiles of this user id')
+        parser.add_argument(
+            '--top', type=int, default=5, help='Functions with the most self time to show per profile (default 5, 0 for none)'
+        )
+
+    def handle(self, *args, **options):
+        if options['limit'] < 1:
+            raise CommandError('--limit must be positive')
+
+        profiles = list_profiles()
+        if options['view']:
+            profiles = [profile for profile in profiles if profile['view'] == options['view']]
+        if options['user'] is not None:
+            profiles = [profile for profile in profiles if profile['user_id'] == options['user']]
+        if not profiles:
+            self.stdout.write(f'No profiles in {get_directory()}')
+            return
+
+        for profile in profiles[:options['limit']]:
+            self.stdout.write(
+                f"{profile['timestamp']:%Y-%m-%d %H:%M:%S}  {profile['view']:<28} user {profile['user_id']:<8}"
+                f"{profile['ms']:>7} ms  {profile['name']}"
+            )
+            if options['top'] > 0:
+                for function, percent in summarize(profile, limit=options['top']):
+                    self.stdout.write(f'    {percent:5.1f}%  {function}')
+
+        self.stdout.write(f"\n{min(len(profiles), options['limit'])} of {len(profiles)} profiles in {get_directory()}")
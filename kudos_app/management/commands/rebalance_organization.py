@@ -0,0 +1,166 @@
+import time
+from collections import defaultdict
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F
+from kudos_app import sharding
+from kudos_app.archive import archive_kudos
+from kudos_app.models import (
+    Organization, User, Kudo, ArchivedKudo, WeeklyActivity, WeeklyQuota, explicit_created_at
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Move an organization's kudos, quota ledger and leaderboard rows to another shard "
+        "and point the shard directory at it. Kudos get new ids on the target shard. After switching "
+        "the directory it waits until no process can still write to the old shard, then copies what "
+        "they wrote there before deleting it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('organization', help='Organization id or name')
+        parser.add_argument('database', help='Target database alias (must be listed in KUDOS_SHARDS)')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=2000,
+            help='Kudos copied per transaction (default 2000)',
+        )
+        parser.add_argument(
+            '--fence',
+            type=float,
+            default=None,
+            help='Seconds to wait for other processes to stop writing to the old shard '
+                 '(default KUDOS_SHARD_DIRECTORY_TTL plus 5 for requests in flight)',
+        )
+
+    def handle(self, *args, **options):
+        lookup = {'id': int(options['organization'])} if options['organization'].isdigit() else {'name': options['organization']}
+        try:
+            organization = Organization.objects.using(sharding.DIRECTORY_DATABASE).get(**lookup)
+        except Organization.DoesNotExist:
+            raise CommandError(f"Organization {options['organization']!r} not found")
+
+        target = options['database']
+        if target not in sharding.get_shards():
+            raise CommandError(f"{target!r} is not one of KUDOS_SHARDS ({', '.join(sharding.get_shards())})")
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+        fence = options['fence']
+        if fence is None:
+            fence = getattr(settings, 'KUDOS_SHARD_DIRECTORY_TTL', 30) + 5
+
+        source = sharding.db_for_organization(organization.id)
+        if source == target:
+            self.stdout.write(f'{organization.name} is already on {target}.')
+            return
+
+        self.stdout.write(f'Moving {organization.name} from {source} to {target}...')
+        # Leftovers of an interrupted run are not referenced by the directory, so start clean
+        self.delete_tenant_rows(organization.id, target)
+        sharding.replicate([organization], database=target)
+        sharding.replicate(User.objects.using(sharding.DIRECTORY_DATABASE).filter(organization=organization),
+                           database=target)
+
+        _, archived = self.copy_kudos(ArchivedKudo, organization.id, source, target, options['batch_size'])
+        last_id, copied = self.copy_kudos(Kudo, organization.id, source, target, options['batch_size'])
+        # Seed the target's ledger before it takes writes, so quotas hold from the first request there
+        counters = self.ledger(organization.id, source)
+        self.merge_ledger(organization.id, target, counters)
+        sharding.assign(organization.id, target)
+
+        # Other processes keep writing to the source until their cached placement expires
+        self.stdout.write(f'  Waiting {fence:g}s for other processes to switch to {target}...')
+        time.sleep(fence)
+        _, caught_up = self.copy_kudos(Kudo, organization.id, source, target, options['batch_size'], after=last_id)
+        self.merge_ledger(organization.id, target, {
+            name: {key: count - counters[name].get(key, 0) for key, count in counts.items()}
+            for name, counts in self.ledger(organization.id, source).items()
+        })
+        self.stdout.write(f'  Copied {copied + caught_up} kudos and {archived} archived kudos')
+
+        self.delete_tenant_rows(organization.id, source)
+        if source != sharding.DIRECTORY_DATABASE:
+            # Cascades to the user copies
+            Organization.objects.using(source).filter(pk=organization.id).delete()
+
+        self.stdout.write(self.style.SUCCESS(f'{organization.name} now lives on {target}.'))
+
+    def copy_kudos(self, model, organization_id, source, target, batch_size, after=0):
+        """
+        Copy kudos (or archived kudos) with ids above ``after`` in id order; returns the last id copied and the count.
+
+        Archived kudos go through the target's Kudo table to get ids from its sequence, then straight to its archive.
+        """
+        kudos = model.objects.using(source).filter(sender__organization_id=organization_id).order_by('id')
+        copied = 0
+        while True:
+            batch = list(kudos.filter(id__gt=after).values(
+                'id', 'sender_id', 'receiver_id', 'message', 'created_at'
+            )[:batch_size])
+            if not batch:
+                return after, copied
+            with transaction.atomic(using=target), explicit_created_at(Kudo):
+                created = Kudo.objects.using(target).bulk_create([
+                    Kudo(sender_id=row['sender_id'], receiver_id=row['receiver_id'], message=row['message'],
+                         created_at=row['created_at'])
+                    for row in batch
+                ])
+                if model is ArchivedKudo:
+                    archive_kudos([kudo.pk for kudo in created], using=target)
+            after = batch[-1]['id']
+            copied += len(batch)
+
+    def ledger(self, organization_id, database):
+        """The organization's ``used``, ``sent`` and ``received`` counts on ``database``, keyed by (user id, week)"""
+        counters = {'used': {}, 'sent': {}, 'received': {}}
+        for user_id, week_start, used in WeeklyQuota.objects.using(database).filter(
+            user__organization_id=organization_id
+        ).values_list('user_id', 'week_start', 'used'):
+            counters['used'][(user_id, week_start)] = used
+        for user_id, week_start, sent, received in WeeklyActivity.objects.using(database).filter(
+            organization_id=organization_id
+        ).values_list('user_id', 'week_start', 'sent', 'received'):
+            counters['sent'][(user_id, week_start)] = sent
+            counters['received'][(user_id, week_start)] = received
+        return counters
+
+    def merge_ledger(self, organization_id, database, counters):
+        """
+        Add ``counters`` (as returned by ``ledger``) onto the rows on ``database``.
+
+        The target may already have rows for the same users and weeks (kudos
+        given there since the directory switched), so counts are added with
+        UPDATEs rather than inserted.
+        """
+        quota_users = defaultdict(list)
+        for (user_id, week_start), used in counters['used'].items():
+            if used:
+                quota_users[(week_start, used)].append(user_id)
+        activity = defaultdict(lambda: {'sent': {}, 'received': {}})
+        for field in ('sent', 'received'):
+            for (user_id, week_start), count in counters[field].items():
+                if count:
+                    activity[week_start][field][user_id] = count
+
+        ledger = WeeklyQuota.objects.using(database)
+        with transaction.atomic(using=database):
+            ledger.bulk_create(
+                [WeeklyQuota(user_id=user_id, week_start=week_start, used=0)
+                 for (week_start, _), user_ids in quota_users.items() for user_id in user_ids],
+                ignore_conflicts=True,
+                batch_size=1000,
+            )
+            for (week_start, used), user_ids in quota_users.items():
+                ledger.filter(week_start=week_start, user_id__in=user_ids).update(used=F('used') + used)
+            for week_start, counts in activity.items():
+                WeeklyActivity.record(organization_id, week_start=week_start, using=database, **counts)
+
+    def delete_tenant_rows(self, organization_id, database):
+        with transaction.atomic(using=database):
+            Kudo.objects.using(database).filter(sender__organization_id=organization_id).delete()
+            ArchivedKudo.objects.using(database).filter(sender__organization_id=organization_id).delete()
+            WeeklyQuota.objects.using(database).filter(user__organization_id=organization_id).delete()
+            WeeklyActivity.objects.using(database).filter(organization_id=organization_id).delete()
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from datetime import timedelta
+from kudos_app.models import WeeklyActivity, get_week_start
+from kudos_app.sharding import get_shards
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the weekly leaderboard counters from Kudo history'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--weeks',
+            type=int,
+            default=None,
+            help='Only rebuild the most recent N weeks (default: all history)',
+        )
+
+    def handle(self, *args, **options):
+        since = None
+        if options['weeks'] is not None:
+            since = get_week_start() - timedelta(weeks=max(0, options['weeks'] - 1))
+            self.stdout.write(f'Rebuilding leaderboard for weeks starting on or after {since}...')
+        else:
+            self.stdout.write('Rebuilding leaderboard from full history...')
+
+        rows = 0
+        for database in get_shards():
+            with transaction.atomic(using=database):
+                rows += WeeklyActivity.rebuild(since=since, using=database)
+
+        self.stdout.write(self.style.SUCCESS(f'Leaderboard rebuilt ({rows} organization-week-user rows).'))
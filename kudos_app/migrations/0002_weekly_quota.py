@@ -0,0 +1,47 @@
+# Generated by Django 4.2.24 on 2026-10-18 04:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.utils import timezone
+from datetime import timedelta
+
+
+def backfill_current_week(apps, schema_editor):
+    """Seed the ledger for the current week so existing allowances carry over"""
+    Kudo = apps.get_model('kudos_app', 'Kudo')
+    WeeklyQuota = apps.get_model('kudos_app', 'WeeklyQuota')
+    using = schema_editor.connection.alias
+    today = timezone.localdate()
+    week_start = today - timedelta(days=today.weekday())
+
+    counts = {}
+    for sender_id in Kudo.objects.using(using).filter(created_at__date__gte=week_start).values_list('sender_id', flat=True):
+        counts[sender_id] = counts.get(sender_id, 0) + 1
+
+    WeeklyQuota.objects.using(using).bulk_create(
+        [WeeklyQuota(user_id=user_id, week_start=week_start, used=used) for user_id, used in counts.items()]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kudos_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WeeklyQuota',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('week_start', models.DateField()),
+                ('used', models.PositiveIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='weekly_quotas', to='kudos_app.user')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='weeklyquota',
+            constraint=models.UniqueConstraint(fields=('user', 'week_start'), name='unique_weekly_quota'),
+        ),
+        migrations.RunPython(backfill_current_week, migrations.RunPython.noop),
+    ]
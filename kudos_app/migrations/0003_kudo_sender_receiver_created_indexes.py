@@ -0,0 +1,32 @@
+# Generated by Django 4.2.24 on 2026-10-18 04:47
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kudos_app', '0002_weekly_quota'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='kudo',
+            name='receiver',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='kudos_received', to='kudos_app.user'),
+        ),
+        migrations.AlterField(
+            model_name='kudo',
+            name='sender',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='kudos_sent', to='kudos_app.user'),
+        ),
+        migrations.AddIndex(
+            model_name='kudo',
+            index=models.Index(fields=['sender', 'created_at'], name='kudo_sender_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='kudo',
+            index=models.Index(fields=['receiver', 'created_at'], name='kudo_receiver_created_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.24 on 2026-10-18 04:58
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kudos_app', '0003_kudo_sender_receiver_created_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WeeklyActivity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('week_start', models.DateField()),
+                ('sent', models.PositiveIntegerField(default=0)),
+                ('received', models.PositiveIntegerField(default=0)),
+                ('organization', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='weekly_activity', to='kudos_app.organization')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='weekly_activity', to='kudos_app.user')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['organization', 'week_start', '-received', 'user'], name='activity_top_received_idx'), models.Index(fields=['organization', 'week_start', '-sent', 'user'], name='activity_top_sent_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='weeklyactivity',
+            constraint=models.UniqueConstraint(fields=('organization', 'week_start', 'user'), name='unique_weekly_activity'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+from django.db import migrations
+
+
+# External-content FTS5 index over Kudo.message: the text lives only in
+# kudos_app_kudo, and the triggers keep the index in step with every write.
+FORWARD_SQL = [
+    """
+    CREATE VIRTUAL TABLE kudos_app_kudo_fts USING fts5(
+        message,
+        content='kudos_app_kudo',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER kudos_app_kudo_fts_insert AFTER INSERT ON kudos_app_kudo BEGIN
+        INSERT INTO kudos_app_kudo_fts(rowid, message) VALUES (new.id, new.message);
+    END
+    """,
+    """
+    CREATE TRIGGER kudos_app_kudo_fts_delete AFTER DELETE ON kudos_app_kudo BEGIN
+        INSERT INTO kudos_app_kudo_fts(kudos_app_kudo_fts, rowid, message) VALUES ('delete', old.id, old.message);
+    END
+    """,
+    """
+    CREATE TRIGGER kudos_app_kudo_fts_update AFTER UPDATE OF message ON kudos_app_kudo BEGIN
+        INSERT INTO kudos_app_kudo_fts(kudos_app_kudo_fts, rowid, message) VALUES ('delete', old.id, old.message);
+        INSERT INTO kudos_app_kudo_fts(rowid, message) VALUES (new.id, new.message);
+    END
+    """,
+    # Index the messages that already exist
+    "INSERT INTO kudos_app_kudo_fts(kudos_app_kudo_fts) VALUES ('rebuild')",
+]
+
+REVERSE_SQL = [
+    "DROP TRIGGER IF EXISTS kudos_app_kudo_fts_update",
+    "DROP TRIGGER IF EXISTS kudos_app_kudo_fts_delete",
+    "DROP TRIGGER IF EXISTS kudos_app_kudo_fts_insert",
+    "DROP TABLE IF EXISTS kudos_app_kudo_fts",
+]
+
+
+def run_on_sqlite(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kudos_app', '0004_weekly_activity'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_on_sqlite(FORWARD_SQL), run_on_sqlite(REVERSE_SQL)),
+    ]
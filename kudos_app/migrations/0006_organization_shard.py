@@ -0,0 +1,21 @@
+# Generated by Django 4.2.24 on 2026-10-18 05:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kudos_app', '0005_kudo_message_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrganizationShard',
+            fields=[
+                ('organization', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='placement', serialize=False, to='kudos_app.organization')),
+                ('database', models.CharField(max_length=64)),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.24 on 2026-10-18 05:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kudos_app', '0006_organization_shard'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedKudo',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('message', models.TextField()),
+                ('created_at', models.DateTimeField()),
+                ('receiver', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='archived_kudos_received', to='kudos_app.user')),
+                ('sender', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='archived_kudos_sent', to='kudos_app.user')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['receiver', 'created_at'], name='archived_receiver_created_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.24 on 2026-10-18 05:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kudos_app', '0007_archived_kudo'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='kudo',
+            index=models.Index(fields=['created_at'], name='kudo_created_idx'),
+        ),
+    ]
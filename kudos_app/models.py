@@ -1,5 +1,50 @@
+from collections import defaultdict
+from contextlib import contextmanager
 from django.db import models
-from datetime import datetime, timedelta
+from django.db.models import F
+from django.utils import timezone
+from datetime import datetime, time, timedelta
+
+
+WEEKLY_KUDOS_LIMIT = 3
+
+
+def get_week_start(day=None):
+    """Return the Monday of the week containing ``day`` (defaults to today)"""
+    if day is None:
+        day = timezone.localdate()
+    return day - timedelta(days=day.weekday())
+
+
+def get_week_bounds(week_start=None):
+    """
+    Return the half-open ``[start, end)`` aware datetime range for a week.
+
+    Filtering ``created_at__gte=start, created_at__lt=end`` compares the raw
+    column, so the (sender, created_at) and (receiver, created_at) indexes
+    can be used; ``created_at__date`` lookups wrap the column and cannot.
+    """
+    if week_start is None:
+        week_start = get_week_start()
+    start = timezone.make_aware(datetime.combine(week_start, time.min))
+    end = timezone.make_aware(datetime.combine(week_start + timedelta(days=7), time.min))
+    return start, end
+
+
+@contextmanager
+def explicit_created_at(model):
+    """
+    Let bulk_create keep the created_at values we set instead of auto_now_add stamping now().
+
+    Offline commands only: the flag lives on the field object every thread
+    shares, so a request saving the model meanwhile would get no timestamp.
+    """
+    field = model._meta.get_field('created_at')
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
 
 
 class Organization(models.Model):
@@ -14,37 +59,50 @@ class User(models.Model):
     username = models.CharField(max_length=50, unique=True)
     email = models.EmailField()
     organization = models.ForeignKey(Organization, on_delete=models.CASCADE, related_name='users')
+    # Cleared by ``import_directory --deactivate-missing``: inactive users cannot sign in, are left out
+    # of the directory and cannot receive kudos. Their history is kept.
+    is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return f"{self.username} ({self.organization.name})"
 
+    @property
+    def shard(self):
+        """Database alias holding this user's kudos, quota and leaderboard rows"""
+        from .sharding import db_for_organization
+        return db_for_organization(self.organization_id)
+
     def get_remaining_kudos(self):
-        """Calculate how many kudos this user has left for the current week"""
-        today = datetime.now().date()
-        start_of_week = today - timedelta(days=today.weekday())
-        
-        # Count kudos given this week
-        kudos_given_this_week = Kudo.objects.filter(
-            sender=self,
-            created_at__date__gte=start_of_week
-        ).count()
-        
-        return max(0, 3 - kudos_given_this_week)
+        """Read how many kudos this user has left for the current week from the quota ledger"""
+        return WeeklyQuota.remaining_for(self.pk, using=self.shard)
+
+    def get_kudos_sent_this_week(self):
+        """Get kudos sent by this user in the current week"""
+        start, end = get_week_bounds()
+        return Kudo.objects.using(self.shard).filter(sender=self, created_at__gte=start, created_at__lt=end)
 
     def get_kudos_received(self):
         """Get all kudos received by this user"""
-        return Kudo.objects.filter(receiver=self).select_related('sender').order_by('-created_at')
+        return Kudo.objects.using(self.shard).filter(receiver=self).select_related('sender').order_by('-created_at')
 
 
 class Kudo(models.Model):
-    sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='kudos_sent')
-    receiver = models.ForeignKey(User, on_delete=models.CASCADE, related_name='kudos_received')
+    # The composite indexes below lead with these columns, so the default
+    # single-column FK indexes would only add write cost.
+    sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='kudos_sent', db_index=False)
+    receiver = models.ForeignKey(User, on_delete=models.CASCADE, related_name='kudos_received', db_index=False)
     message = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['sender', 'created_at'], name='kudo_sender_created_idx'),
+            models.Index(fields=['receiver', 'created_at'], name='kudo_receiver_created_idx'),
+            # Date ranges and newest-first ordering in the admin
+            models.Index(fields=['created_at'], name='kudo_created_idx'),
+        ]
 
     def __str__(self):
         return f"Kudo from {self.sender.username} to {self.receiver.username}"
@@ -54,3 +112,251 @@ class Kudo(models.Model):
         from django.core.exceptions import ValidationError
         if self.sender == self.receiver:
             raise ValidationError("Users cannot give kudos to themselves.")
+
+
+class ArchivedKudo(models.Model):
+    """
+    Kudos moved out of ``Kudo`` by ``archive_kudos`` once they pass the retention window.
+
+    Rows keep their original id and columns, so API output and cursors are
+    unchanged. Only the receiver index is kept (for the received list's
+    fall-through, see ``KeysetPagination.paginate_querysets``); archived
+    messages are not in the search index.
+    """
+    id = models.BigIntegerField(primary_key=True)  # The Kudo id
+    sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_kudos_sent', db_index=False)
+    receiver = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_kudos_received',
+                                 db_index=False)
+    message = models.TextField()
+    created_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['receiver', 'created_at'], name='archived_receiver_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"Archived kudo {self.id} from {self.sender_id} to {self.receiver_id}"
+
+
+def kudo_history(fields, using=None, since=None):
+    """Rows of ``fields`` for every kudo, hot and archived, created at or after ``since``"""
+    for model in (Kudo, ArchivedKudo):
+        kudos = model.objects.using(using).order_by()
+        if since is not None:
+            kudos = kudos.filter(created_at__gte=since)
+        yield from kudos.values_list(*fields).iterator(chunk_size=2000)
+
+
+class WeeklyQuota(models.Model):
+    """Ledger of kudos used per user per week, so quota checks never re-count Kudo rows"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='weekly_quotas')
+    week_start = models.DateField()
+    used = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'week_start'], name='unique_weekly_quota'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} week of {self.week_start}: {self.used}/{WEEKLY_KUDOS_LIMIT}"
+
+    @classmethod
+    def _used_this_week(cls, user_id, using=None):
+        return cls.objects.using(using).filter(
+            user_id=user_id,
+            week_start=get_week_start()
+        ).values_list('used', flat=True)
+
+    @classmethod
+    def remaining_for(cls, user_id, using=None):
+        """Kudos the user can still give this week; needs only the user id (and its shard)"""
+        used = cls._used_this_week(user_id, using).first()
+        return max(0, WEEKLY_KUDOS_LIMIT - (used or 0))
+
+    @classmethod
+    async def aremaining_for(cls, user_id, using=None):
+        used = await cls._used_this_week(user_id, using).afirst()
+        return max(0, WEEKLY_KUDOS_LIMIT - (used or 0))
+
+    @classmethod
+    def reserve(cls, user, count=1, week_start=None, using=None):
+        """
+        Atomically take ``count`` kudos from the user's weekly allowance.
+
+        Runs a single conditional UPDATE, so concurrent callers can never push
+        ``used`` past the limit. Returns True if the reservation succeeded.
+        Call inside the transaction that inserts the kudos so a failed insert
+        also rolls the reservation back.
+
+        The UPDATE runs before anything is read. A SQLite transaction whose first
+        statement writes takes the write lock up front and waits out
+        ``busy_timeout``. One that reads first has to upgrade its snapshot, and
+        fails at once with "database is locked" if another writer committed
+        in the meantime.
+        """
+        if week_start is None:
+            week_start = get_week_start()
+        if count > WEEKLY_KUDOS_LIMIT:
+            return False
+
+        ledger = cls.objects.using(using).filter(user_id=getattr(user, 'pk', user), week_start=week_start)
+        updated = ledger.filter(used__lte=WEEKLY_KUDOS_LIMIT - count).update(used=F('used') + count)
+        if updated:
+            return True
+
+        # First kudo of the week: create the row, or retry if it already exists
+        _, created = cls.objects.using(using).get_or_create(
+            user_id=getattr(user, 'pk', user), week_start=week_start, defaults={'used': count}
+        )
+        if created:
+            return True
+        return ledger.filter(used__lte=WEEKLY_KUDOS_LIMIT - count).update(used=F('used') + count) == 1
+
+    @classmethod
+    def reserve_many(cls, counts, week_start=None, using=None):
+        """
+        Take as many of ``counts[user_id]`` kudos as fit in each user's allowance; returns ``{user_id: taken}``.
+
+        Costs one insert, one read and one UPDATE per distinct amount taken,
+        however many users are involved. Call inside the transaction that
+        inserts the kudos. The insert comes first, so on SQLite the transaction
+        holds the write lock before it reads the ledger.
+        """
+        if week_start is None:
+            week_start = get_week_start()
+
+        cls.objects.using(using).bulk_create(
+            [cls(user_id=user_id, week_start=week_start, used=0) for user_id in counts],
+            ignore_conflicts=True
+        )
+        ledger = cls.objects.using(using).filter(week_start=week_start)
+        used = dict(ledger.filter(user_id__in=list(counts)).values_list('user_id', 'used'))
+        taken = {user_id: max(0, min(count, WEEKLY_KUDOS_LIMIT - used[user_id])) for user_id, count in counts.items()}
+
+        users_by_count = defaultdict(list)
+        for user_id, count in taken.items():
+            if count:
+                users_by_count[count].append(user_id)
+        for count, user_ids in users_by_count.items():
+            ledger.filter(user_id__in=user_ids).update(used=F('used') + count)
+        return taken
+
+    @classmethod
+    def rebuild(cls, since=None, using=None):
+        """Recreate ledger rows from Kudo history (optionally only weeks starting on or after ``since``)"""
+        ledger = cls.objects.using(using).all()
+        start = None
+        if since is not None:
+            since = get_week_start(since)
+            start = get_week_bounds(since)[0]
+            ledger = ledger.filter(week_start__gte=since)
+
+        counts = {}
+        for sender_id, created_at in kudo_history(('sender_id', 'created_at'), using, start):
+            key = (sender_id, get_week_start(timezone.localdate(created_at)))
+            counts[key] = counts.get(key, 0) + 1
+
+        ledger.delete()
+        cls.objects.using(using).bulk_create(
+            [cls(user_id=user_id, week_start=week_start, used=used)
+             for (user_id, week_start), used in counts.items()],
+            batch_size=1000
+        )
+
+        return len(counts)
+
+
+class WeeklyActivity(models.Model):
+    """
+    Per-organization, per-week, per-user kudos sent and received.
+
+    Maintained incrementally in the same transaction as each kudo insert, so
+    leaderboards read a handful of index entries instead of grouping Kudo rows.
+    """
+    # Covered by the unique constraint and the leaderboard indexes, which all lead with it
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE, related_name='weekly_activity',
+                                     db_index=False)
+    week_start = models.DateField()
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='weekly_activity')
+    sent = models.PositiveIntegerField(default=0)
+    received = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['organization', 'week_start', 'user'], name='unique_weekly_activity'),
+        ]
+        indexes = [
+            # Top-N leaderboards read these in order and stop after N entries
+            models.Index(fields=['organization', 'week_start', '-received', 'user'], name='activity_top_received_idx'),
+            models.Index(fields=['organization', 'week_start', '-sent', 'user'], name='activity_top_sent_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} week of {self.week_start}: sent {self.sent}, received {self.received}"
+
+    @classmethod
+    def record(cls, organization_id, sent=None, received=None, week_start=None, using=None):
+        """
+        Add kudos to the week's counters; ``sent`` and ``received`` map user ids to counts.
+
+        Uses one lookup, at most one insert and one UPDATE per distinct count,
+        however many users are involved. Call inside the kudo insert transaction.
+        """
+        sent, received = sent or {}, received or {}
+        if week_start is None:
+            week_start = get_week_start()
+
+        scope = cls.objects.using(using).filter(organization_id=organization_id, week_start=week_start)
+        user_ids = set(sent) | set(received)
+        missing = user_ids - set(scope.filter(user_id__in=user_ids).values_list('user_id', flat=True))
+        if missing:
+            cls.objects.using(using).bulk_create(
+                [cls(organization_id=organization_id, week_start=week_start, user_id=user_id) for user_id in missing],
+                ignore_conflicts=True
+            )
+
+        for field, counts in (('sent', sent), ('received', received)):
+            users_by_count = defaultdict(list)
+            for user_id, count in counts.items():
+                users_by_count[count].append(user_id)
+            for count, ids in users_by_count.items():
+                scope.filter(user_id__in=ids).update(**{field: F(field) + count})
+
+    @classmethod
+    def rebuild(cls, since=None, using=None):
+        """Recreate rows from Kudo history (optionally only weeks starting on or after ``since``)"""
+        activity = cls.objects.using(using).all()
+        start = None
+        if since is not None:
+            since = get_week_start(since)
+            start = get_week_bounds(since)[0]
+            activity = activity.filter(week_start__gte=since)
+
+        counts = defaultdict(lambda: [0, 0])
+        rows = kudo_history(('sender__organization_id', 'sender_id', 'receiver_id', 'created_at'), using, start)
+        for organization_id, sender_id, receiver_id, created_at in rows:
+            week_start = get_week_start(timezone.localdate(created_at))
+            counts[(organization_id, week_start, sender_id)][0] += 1
+            counts[(organization_id, week_start, receiver_id)][1] += 1
+
+        activity.delete()
+        cls.objects.using(using).bulk_create(
+            [cls(organization_id=organization_id, week_start=week_start, user_id=user_id, sent=sent, received=received)
+             for (organization_id, week_start, user_id), (sent, received) in counts.items()],
+            batch_size=1000
+        )
+
+        return len(counts)
+
+
+class OrganizationShard(models.Model):
+    """Directory entry: which database holds an organization's kudos (see kudos_app/sharding.py)"""
+    organization = models.OneToOneField(Organization, on_delete=models.CASCADE, primary_key=True,
+                                        related_name='placement')
+    database = models.CharField(max_length=64)
+
+    def __str__(self):
+        return f"{self.organization_id} -> {self.database}"
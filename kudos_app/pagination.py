@@ -0,0 +1,193 @@
+import json
+from base64 import b64decode, b64encode
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination keyed on a (sort column, unique tiebreaker) pair.
+
+    Each page is fetched with a ``WHERE (key) < (last key) ORDER BY key LIMIT n``
+    range seek instead of an OFFSET, so every page costs the same no matter how
+    deep it is. Cursors are opaque base64 tokens holding the boundary row's key
+    and the direction to read in.
+    """
+    ordering = None  # e.g. ('-created_at', '-id')
+    page_size = api_settings.PAGE_SIZE or 20
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+    # Absolute URL the next/previous links point at; defaults to the request's own URL
+    link_url = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        window = self.get_window(queryset, request)
+        return self.finish_page(list(window))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """Async counterpart of ``paginate_queryset`` for views using the async ORM"""
+        window = self.get_window(queryset, request)
+        return self.finish_page([row async for row in window])
+
+    def paginate_querysets(self, querysets, request, view=None):
+        """
+        Paginate the concatenation of ``querysets``, given in ordering order and not overlapping
+        (e.g. hot kudos, then archived ones). A queryset is only queried once the page runs past
+        the ones before it.
+        """
+        rows = []
+        for window in self.get_windows(querysets, request):
+            rows += window[:self.page_size + 1 - len(rows)]
+            if len(rows) > self.page_size:
+                break
+        return self.finish_page(rows)
+
+    async def apaginate_querysets(self, querysets, request, view=None):
+        rows = []
+        for window in self.get_windows(querysets, request):
+            rows += [row async for row in window[:self.page_size + 1 - len(rows)]]
+            if len(rows) > self.page_size:
+                break
+        return self.finish_page(rows)
+
+    def get_windows(self, querysets, request):
+        self.cursor = self.decode_cursor(request)
+        # Reading backwards starts from the last queryset
+        for queryset in (reversed(querysets) if self.is_reversed else querysets):
+            yield self.get_window(queryset, request)
+
+    def get_window(self, queryset, request):
+        """Order and seek the queryset to the cursor; returns a lazy slice of ``page_size + 1`` rows"""
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.cursor = self.decode_cursor(request)
+
+        ordering = self.get_ordering(self.is_reversed)
+        queryset = queryset.order_by(*ordering)
+        if self.cursor:
+            try:
+                queryset = queryset.filter(self.get_seek_filter(ordering, self.cursor['position']))
+            except (ValidationError, TypeError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+
+        # Fetch one extra row to learn whether another page exists
+        return queryset[:self.page_size + 1]
+
+    def finish_page(self, rows):
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if self.is_reversed:
+            rows.reverse()
+
+        if self.is_reversed:
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.cursor is not None
+
+        self.page = rows
+        return rows
+
+    @property
+    def is_reversed(self):
+        return bool(self.cursor and self.cursor['reverse'])
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get_ordering(self, reverse=False):
+        if not reverse:
+            return self.ordering
+        return tuple(field[1:] if field.startswith('-') else f'-{field}' for field in self.ordering)
+
+    def get_seek_filter(self, ordering, position):
+        """Build ``(key, tiebreaker) > (a, b)`` in a form SQLite can serve with an index range seek"""
+        (key, key_value), (tiebreaker, tiebreaker_value) = zip(
+            (field.lstrip('-') for field in ordering), position
+        )
+        key_op = 'lt' if ordering[0].startswith('-') else 'gt'
+        tiebreaker_op = 'lt' if ordering[1].startswith('-') else 'gt'
+
+        return Q(**{f'{key}__{key_op}e': key_value}) & (
+            Q(**{f'{key}__{key_op}': key_value}) | Q(**{f'{tiebreaker}__{tiebreaker_op}': tiebreaker_value})
+        )
+
+    def get_position(self, row):
+        fields = (field.lstrip('-') for field in self.ordering)
+        if isinstance(row, dict):
+            values = [row[field] for field in fields]
+        else:
+            values = [getattr(row, field) for field in fields]
+        return [value.isoformat() if hasattr(value, 'isoformat') else value for value in values]
+
+    def encode_cursor(self, position, reverse):
+        token = json.dumps({'p': position, 'r': int(reverse)}, separators=(',', ':'))
+        return b64encode(token.encode('utf-8'), altchars=b'-_').decode('ascii')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+
+        try:
+            token = json.loads(b64decode(encoded.encode('ascii'), altchars=b'-_', validate=True))
+            position, reverse = token['p'], bool(token['r'])
+            if not isinstance(position, list) or len(position) != 2:
+                raise ValueError
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+        return {'position': position, 'reverse': reverse}
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self._build_link(self.get_position(self.page[-1]), reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self._build_link(self.get_position(self.page[0]), reverse=True)
+
+    def _build_link(self, position, reverse):
+        url = self.link_url or self.request.build_absolute_uri()
+        url = remove_query_param(url, self.cursor_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(position, reverse))
+
+
+class KudoCursorPagination(KeysetPagination):
+    """Newest kudos first, keyed on (created_at, id)"""
+    ordering = ('-created_at', '-id')
+
+
+class UserCursorPagination(KeysetPagination):
+    """Users alphabetically, keyed on (username, id)"""
+    ordering = ('username', 'id')
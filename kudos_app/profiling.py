@@ -0,0 +1,185 @@
+"""
+On-demand profiling of single requests, enabled with ``KUDOS_PROFILING``.
+
+Only callers whose ``X-User-ID`` is in ``KUDOS_PROFILING_USERS`` can be
+profiled. A request is profiled when it sends an ``X-Profile`` header, or
+at random with probability ``KUDOS_PROFILING_SAMPLE_RATE``. The header value
+picks the profiler:
+
+- ``cprofile`` (the default) records every call deterministically and writes
+  a pstats ``.prof`` file (``python -m pstats``, snakeviz, ...).
+- ``sample`` has a background thread read the request thread's stack every
+  ``KUDOS_PROFILING_INTERVAL_MS`` and writes the stacks in collapsed form
+  (``frame;frame;frame count`` per line), ready for flamegraph.pl or
+  speedscope. It distorts timings far less than cProfile.
+
+Profiles are written to ``KUDOS_PROFILING_DIR`` as
+``<timestamp>_<url name>_u<user id>_<ms>ms.<prof|collapsed>``. Only the
+newest ``KUDOS_PROFILING_KEEP`` are kept. The response names the file in an
+``X-Profile-File`` header. ``manage.py list_profiles`` lists and summarizes
+them.
+
+With profiling off the middleware removes itself from the stack, so it costs
+nothing. Only the thread running the middleware is profiled, which covers
+the sync views. Async views under ASGI run on the event loop thread instead.
+"""
+import cProfile
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from .identity import parse_user_id
+
+
+PROFILE_HEADER = 'X-Profile'
+PROFILERS = ('cprofile', 'sample')
+EXTENSIONS = {'cprofile': '.prof', 'sample': '.collapsed'}
+FILENAME = re.compile(
+    r'^(?P<timestamp>\d{8}T\d{6}\.\d{6})_(?P<view>.+)_u(?P<user_id>\d+)_(?P<ms>\d+)ms\.(?P<kind>prof|collapsed)$'
+)
+
+
+def get_directory():
+    return str(getattr(settings, 'KUDOS_PROFILING_DIR', os.path.join(settings.BASE_DIR, 'profiles')))
+
+
+class StackSampler:
+    """Counts collapsed stacks of one thread, sampled every ``interval`` seconds from a background thread"""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='kudos-profiler', daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if frames:
+                self.stacks[';'.join(reversed(frames))] += 1
+
+    def write(self, path):
+        with open(path, 'w') as output:
+            for stack, count in self.stacks.most_common():
+                output.write(f'{stack} {count}\n')
+
+
+class RequestProfilingMiddleware:
+    """Profiles requests from allowed users on demand; removed from the stack unless KUDOS_PROFILING is set"""
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'KUDOS_PROFILING', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.user_ids = set(getattr(settings, 'KUDOS_PROFILING_USERS', ()))
+        self.sample_rate = getattr(settings, 'KUDOS_PROFILING_SAMPLE_RATE', 0.0)
+        self.interval = getattr(settings, 'KUDOS_PROFILING_INTERVAL_MS', 1) / 1000
+        self.keep = getattr(settings, 'KUDOS_PROFILING_KEEP', 200)
+        self.directory = get_directory()
+
+    def __call__(self, request):
+        user_id = parse_user_id(request.headers.get('X-User-ID'))
+        if user_id not in self.user_ids:
+            return self.get_response(request)
+
+        requested = request.headers.get(PROFILE_HEADER)
+        if requested is None and not (self.sample_rate and random.random() < self.sample_rate):
+            return self.get_response(request)
+        profiler = (requested or '').strip().lower()
+        if profiler not in PROFILERS:
+            profiler = 'cprofile'
+
+        started = time.perf_counter()
+        if profiler == 'sample':
+            with StackSampler(threading.get_ident(), self.interval) as recorder:
+                response = self.get_response(request)
+        else:
+            recorder = cProfile.Profile()
+            response = recorder.runcall(self.get_response, request)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name.replace(':', '.') if match else 'unresolved'
+        name = f'{datetime.now():%Y%m%dT%H%M%S.%f}_{view}_u{user_id}_{elapsed_ms:.0f}ms{EXTENSIONS[profiler]}'
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, name)
+        if profiler == 'sample':
+            recorder.write(path)
+        else:
+            recorder.dump_stats(path)
+        self.prune()
+
+        response['X-Profile-File'] = name
+        return response
+
+    def prune(self):
+        for profile in list_profiles(self.directory)[self.keep:]:
+            try:
+                os.remove(profile['path'])
+            except FileNotFoundError:
+                pass  # Another worker pruned it first
+
+
+def list_profiles(directory=None):
+    """Profiles in ``directory`` as dicts (path, name, timestamp, view, user_id, ms, kind), newest first"""
+    directory = directory or get_directory()
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+
+    profiles = []
+    for name in names:
+        match = FILENAME.match(name)
+        if match is None:
+            continue
+        profiles.append({
+            'path': os.path.join(directory, name),
+            'name': name,
+            'timestamp': datetime.strptime(match['timestamp'], '%Y%m%dT%H%M%S.%f'),
+            'view': match['view'],
+            'user_id': int(match['user_id']),
+            'ms': int(match['ms']),
+            'kind': match['kind'],
+        })
+    profiles.sort(key=lambda profile: profile['timestamp'], reverse=True)
+    return profiles
+
+
+def summarize(profile, limit=10):
+    """``[(function, percent of self time), ...]`` for the ``limit`` functions with the most self time"""
+    self_time = Counter()
+    if profile['kind'] == 'prof':
+        for (filename, line, function), (_, _, own_seconds, _, _) in pstats.Stats(profile['path']).stats.items():
+            self_time[f'{function} ({os.path.basename(filename)}:{line})'] += own_seconds
+    else:
+        with open(profile['path']) as collapsed:
+            for line in collapsed:
+                stack, _, count = line.rstrip('\n').rpartition(' ')
+                self_time[stack.rpartition(';')[2]] += int(count)
+
+    total = sum(self_time.values())
+    if not total:
+        return []
+    return [(function, round(100 * value / total, 1)) for function, value in self_time.most_common(limit)]
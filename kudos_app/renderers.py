@@ -0,0 +1,46 @@
+try:
+    import orjson
+except ImportError:  # Optional: without orjson responses go through the stock JSONRenderer
+    orjson = None
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils import encoders
+
+
+LINE_SEPARATOR = '\u2028'.encode('utf-8')
+PARAGRAPH_SEPARATOR = '\u2029'.encode('utf-8')
+
+
+class OrJSONRenderer(JSONRenderer):
+    """
+    ``JSONRenderer`` that encodes with orjson when it is installed.
+
+    The output is byte for byte what ``JSONRenderer`` produces with the default
+    settings: compact separators, raw UTF-8, and U+2028/U+2029 escaped. Datetimes,
+    Decimals, lazy strings and the like are formatted by DRF's own encoder.
+    Indented output, non-default ``UNICODE_JSON``/``COMPACT_JSON``/``STRICT_JSON``
+    settings, and values orjson rejects (e.g. integers wider than 64 bits)
+    fall back to the stock renderer. The one difference is float notation
+    outside [1e-4, 1e16). orjson writes ``1e16`` where ``json`` writes ``1e+16``.
+    """
+    options = (
+        orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_NON_STR_KEYS
+        if orjson else 0
+    )
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or not self.compact or self.ensure_ascii or not self.strict:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=encoders.JSONEncoder().default, option=self.options)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Same JavaScript-safety escaping as JSONRenderer
+        if LINE_SEPARATOR in ret:
+            ret = ret.replace(LINE_SEPARATOR, b'\\u2028')
+        if PARAGRAPH_SEPARATOR in ret:
+            ret = ret.replace(PARAGRAPH_SEPARATOR, b'\\u2029')
+        return ret
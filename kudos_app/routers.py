@@ -0,0 +1,47 @@
+from .models import Organization
+from .sharding import DIRECTORY_DATABASE, db_for_organization
+
+
+class OrganizationShardRouter:
+    """
+    Database router for organization sharding (see kudos_app/sharding.py).
+
+    Organization, User and the shard directory are read from and written to
+    the default database. The per-organization models are routed explicitly
+    with ``.using(user.shard)`` or ``sharding.db_for_organization``. This router
+    covers the implicit cases: related-object access and model instances
+    built from a related instance follow that instance's organization.
+    Kudos tables are created on every configured database. Other apps only
+    live on the default one.
+    """
+    app_label = 'kudos_app'
+    directory_models = {'organization', 'user', 'organizationshard'}
+
+    def _db_for(self, model, instance=None, **hints):
+        if model._meta.app_label != self.app_label or model._meta.model_name in self.directory_models:
+            return None
+        if instance is None:
+            return None
+        if instance._state.db and instance._state.db != DIRECTORY_DATABASE:
+            return instance._state.db
+        if isinstance(instance, Organization):
+            return db_for_organization(instance.pk)
+        if hasattr(instance, 'organization_id'):
+            return db_for_organization(instance.organization_id)
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self._db_for(model, **hints)
+
+    def db_for_write(self, model, **hints):
+        return self._db_for(model, **hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if obj1._meta.app_label == self.app_label and obj2._meta.app_label == self.app_label:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if app_label == self.app_label:
+            return True
+        return db == DIRECTORY_DATABASE
@@ -0,0 +1,82 @@
+"""
+Full-text search over kudo messages, backed by the ``kudos_app_kudo_fts`` FTS5
+index (created and kept in sync by triggers in migration 0005).
+
+Results are ranked by BM25 and paginated with a keyset on ``(score, id)``,
+so later pages seek past the previous boundary instead of re-ranking and
+skipping with OFFSET.
+"""
+import re
+from django.db import connections
+from django.db.models.expressions import RawSQL
+from rest_framework.exceptions import NotFound
+from .pagination import KeysetPagination
+
+
+FTS_TABLE = 'kudos_app_kudo_fts'
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+
+
+def fts_query(text):
+    """
+    Turn free text into a safe FTS5 query: every word quoted, all required.
+
+    Quoting stops user input from being parsed as FTS5 syntax (``AND``,
+    ``NEAR``, column filters, stray quotes), which would otherwise raise errors.
+    Returns '' if the text has no searchable words.
+    """
+    return ' '.join(f'"{token}"' for token in _TOKEN.findall(text or ''))
+
+
+def message_match(text):
+    """Expression for ``Kudo.objects.filter(id__in=...)`` selecting kudos whose message matches ``text``"""
+    return RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [fts_query(text)])
+
+
+def search_kudo_ids(organization_id, text, limit, after=None, reverse=False, using='default'):
+    """
+    Return up to ``limit`` ``{'id', 'score'}`` dicts for kudos sent within the organization.
+
+    Lower BM25 scores are better matches. ``after`` is an exclusive
+    ``(score, id)`` boundary; ``reverse`` walks backwards from it. ``using``
+    is the database holding the organization's kudos (its shard).
+    """
+    direction, comparison = ('DESC', '<') if reverse else ('ASC', '>')
+    sql = f"""
+        SELECT kudo.id, bm25({FTS_TABLE}) AS score
+        FROM {FTS_TABLE}
+        JOIN kudos_app_kudo AS kudo ON kudo.id = {FTS_TABLE}.rowid
+        JOIN kudos_app_user AS sender ON sender.id = kudo.sender_id
+        WHERE {FTS_TABLE} MATCH %s AND sender.organization_id = %s
+    """
+    params = [fts_query(text), organization_id]
+    if after is not None:
+        sql += f" AND (bm25({FTS_TABLE}) {comparison} %s OR (bm25({FTS_TABLE}) = %s AND kudo.id {comparison} %s))"
+        params += [after[0], after[0], after[1]]
+    sql += f' ORDER BY score {direction}, kudo.id {direction} LIMIT %s'
+    params.append(limit)
+
+    with connections[using].cursor() as cursor:
+        cursor.execute(sql, params)
+        return [{'id': kudo_id, 'score': score} for kudo_id, score in cursor.fetchall()]
+
+
+class KudoSearchPagination(KeysetPagination):
+    """Best BM25 matches first, keyed on (score, id)"""
+    ordering = ('score', 'id')
+
+    def paginate_search(self, organization_id, text, request, using='default'):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.cursor = self.decode_cursor(request)
+
+        after = None
+        if self.cursor:
+            try:
+                after = (float(self.cursor['position'][0]), int(self.cursor['position'][1]))
+            except (TypeError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+
+        rows = search_kudo_ids(organization_id, text, self.page_size + 1, after=after, reverse=self.is_reversed,
+                               using=using)
+        return self.finish_page(rows)
@@ -1,6 +1,16 @@
+from django.db import transaction
+from django.db.models import F
 from rest_framework import serializers
-from .models import Organization, User, Kudo
-from datetime import datetime, timedelta
+from rest_framework.settings import api_settings
+from .instrumentation import serialization
+from .models import Organization, User, Kudo, WeeklyActivity, WeeklyQuota
+
+
+def quota_exhausted():
+    """The error for a sender with no quota left, reported like the other validation errors"""
+    return serializers.ValidationError(
+        {api_settings.NON_FIELD_ERRORS_KEY: ["You have no remaining kudos for this week."]}
+    )
 
 
 class OrganizationSerializer(serializers.ModelSerializer):
@@ -18,6 +28,9 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ['id', 'username', 'email', 'organization', 'organization_name', 'remaining_kudos', 'created_at']
     
     def get_remaining_kudos(self, obj):
+        # Callers that already know the quota (e.g. async views) pass it in context
+        if 'remaining_kudos' in self.context:
+            return self.context['remaining_kudos']
         return obj.get_remaining_kudos()
 
 
@@ -50,19 +63,15 @@ class KudoSerializer(serializers.ModelSerializer):
             if sender_id == receiver_id:
                 raise serializers.ValidationError("You cannot give kudos to yourself.")
             
-            # Check if sender has remaining kudos
-            try:
-                sender = User.objects.get(id=sender_id)
-                if sender.get_remaining_kudos() <= 0:
-                    raise serializers.ValidationError("You have no remaining kudos for this week.")
-                
-                # Check if sender and receiver are in the same organization
-                receiver = data.get('receiver')
-                if sender.organization != receiver.organization:
-                    raise serializers.ValidationError("You can only give kudos to users in your organization.")
-                    
-            except User.DoesNotExist:
+            # The sender was already resolved (with organization) by SimpleAuthenticationMixin
+            sender = getattr(request, 'current_user', None)
+            if sender is None:
                 raise serializers.ValidationError("Invalid sender.")
+            
+            # Check if sender and receiver are in the same organization
+            receiver = data.get('receiver')
+            if sender.organization_id != receiver.organization_id:
+                raise serializers.ValidationError("You can only give kudos to users in your organization.")
         
         return data
 
@@ -73,6 +82,11 @@ class KudoCreateSerializer(serializers.ModelSerializer):
         model = Kudo
         fields = ['receiver', 'message']
     
+    def validate_receiver(self, value):
+        if not value.is_active:
+            raise serializers.ValidationError("Invalid receiver.")
+        return value
+    
     def validate(self, data):
         """Custom validation for creating kudos"""
         request = self.context.get('request')
@@ -84,18 +98,92 @@ class KudoCreateSerializer(serializers.ModelSerializer):
             if sender_id == receiver_id:
                 raise serializers.ValidationError("You cannot give kudos to yourself.")
             
-            # Check if sender has remaining kudos
-            try:
-                sender = User.objects.get(id=sender_id)
-                if sender.get_remaining_kudos() <= 0:
-                    raise serializers.ValidationError("You have no remaining kudos for this week.")
-                
-                # Check if sender and receiver are in the same organization
-                receiver = data.get('receiver')
-                if sender.organization != receiver.organization:
-                    raise serializers.ValidationError("You can only give kudos to users in your organization.")
-                    
-            except User.DoesNotExist:
+            # The sender was already resolved (with organization) by SimpleAuthenticationMixin
+            sender = getattr(request, 'current_user', None)
+            if sender is None:
                 raise serializers.ValidationError("Invalid sender.")
+            
+            # Check if sender and receiver are in the same organization
+            receiver = data.get('receiver')
+            if sender.organization_id != receiver.organization_id:
+                raise serializers.ValidationError("You can only give kudos to users in your organization.")
         
         return data
+
+    def create(self, validated_data):
+        """Reserve quota, insert the kudo and update the leaderboard counters in one transaction on the sender's shard"""
+        sender = validated_data['sender']
+        using = sender.shard
+        with transaction.atomic(using=using):
+            # The conditional UPDATE is the quota check: no separate read beforehand
+            if not WeeklyQuota.reserve(sender, using=using):
+                raise quota_exhausted()
+            kudo = Kudo.objects.using(using).create(**validated_data)
+            WeeklyActivity.record(
+                sender.organization_id,
+                sent={kudo.sender_id: 1},
+                received={kudo.receiver_id: 1},
+                using=using
+            )
+            return kudo
+
+
+class KudoBatchItemSerializer(serializers.Serializer):
+    """One entry of a batch; receivers are loaded in bulk by the view and passed in context"""
+    receiver = serializers.IntegerField()
+    message = serializers.CharField()
+
+    def validate_receiver(self, value):
+        receiver = self.context['receivers'].get(value)
+        if receiver is None:
+            raise serializers.ValidationError("Invalid receiver.")
+        return receiver
+
+    def validate(self, data):
+        sender = self.context['request'].current_user
+        receiver = data['receiver']
+
+        if sender.id == receiver.id:
+            raise serializers.ValidationError("You cannot give kudos to yourself.")
+        if sender.organization_id != receiver.organization_id:
+            raise serializers.ValidationError("You can only give kudos to users in your organization.")
+
+        return data
+
+
+# Fast read path for the hot list endpoints: project rows with .values() and
+# build exactly the dicts UserSimpleSerializer / KudoSerializer would, without
+# model instances or per-row field objects. KeysetPagination works on these
+# rows directly since they keep the ordering columns.
+_datetime_field = serializers.DateTimeField()
+
+
+def user_simple_values(queryset):
+    """Rows in UserSimpleSerializer's shape (id, username, organization_name)"""
+    return queryset.values('id', 'username', organization_name=F('organization__name'))
+
+
+def kudo_values(queryset):
+    """Rows carrying every column KudoSerializer reads; pass pages to ``serialize_kudo_rows``"""
+    return queryset.values(
+        'id', 'sender_id', 'receiver_id', 'message', 'created_at',
+        sender_username=F('sender__username'), receiver_username=F('receiver__username'),
+    )
+
+
+@serialization
+def serialize_kudo_rows(rows):
+    """Same output as ``KudoSerializer(kudos, many=True).data`` for rows from ``kudo_values``"""
+    format_datetime = _datetime_field.to_representation
+    return [
+        {
+            'id': row['id'],
+            'sender': row['sender_id'],
+            'receiver': row['receiver_id'],
+            'sender_username': row['sender_username'],
+            'receiver_username': row['receiver_username'],
+            'message': row['message'],
+            'created_at': format_datetime(row['created_at']),
+        }
+        for row in rows
+    ]
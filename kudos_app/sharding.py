@@ -0,0 +1,150 @@
+"""
+Organization sharding across the SQLite databases listed in ``KUDOS_SHARDS``.
+
+The default database is the directory. It holds the canonical Organization
+and User rows, so organization ids and ``X-User-ID`` values stay globally
+unique and resolvable without knowing the shard. It also holds
+``OrganizationShard``, which records where each organization's kudos, quota
+ledger and leaderboard rows live. Each shard keeps copies of its
+organizations' Organization and User rows, so joins (usernames in kudo
+lists) and foreign keys stay inside one database. The signals in
+``signals.py`` keep those copies current; bulk writers call ``replicate``
+themselves.
+
+New organizations are placed by hashing their id over the configured
+shards. Organizations without a directory entry (created before sharding
+was enabled) live on the default database. ``rebalance_organization`` moves
+an organization to another shard. With the default single-entry
+``KUDOS_SHARDS`` everything stays on the default database and none of this
+runs a query.
+"""
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.dispatch import receiver
+from .identity import LRUCache
+from .models import Organization, OrganizationShard
+
+
+DIRECTORY_DATABASE = DEFAULT_DB_ALIAS
+
+# Placements are cached per process; rebalancing invalidates this process and
+# other processes pick the new placement up within the TTL
+_placements = LRUCache(
+    maxsize=getattr(settings, 'KUDOS_SHARD_DIRECTORY_SIZE', 4096),
+    ttl=getattr(settings, 'KUDOS_SHARD_DIRECTORY_TTL', 30),
+)
+
+
+def get_shards():
+    return list(getattr(settings, 'KUDOS_SHARDS', None) or [DIRECTORY_DATABASE])
+
+
+def is_sharded():
+    return get_shards() != [DIRECTORY_DATABASE]
+
+
+def hash_shard(organization_id):
+    """Initial placement for a new organization"""
+    shards = get_shards()
+    return shards[organization_id % len(shards)]
+
+
+def db_for_organization(organization_id):
+    """Database alias holding the organization's kudos, quota ledger and leaderboard"""
+    if organization_id is None or not is_sharded():
+        return DIRECTORY_DATABASE
+
+    database = _placements.get(organization_id)
+    if database is None:
+        database = OrganizationShard.objects.using(DIRECTORY_DATABASE).filter(
+            organization_id=organization_id
+        ).values_list('database', flat=True).first() or DIRECTORY_DATABASE
+        _placements.set(organization_id, database)
+    return database
+
+
+async def adb_for_organization(organization_id):
+    if organization_id is None or not is_sharded():
+        return DIRECTORY_DATABASE
+
+    database = _placements.get(organization_id)
+    if database is None:
+        database = await OrganizationShard.objects.using(DIRECTORY_DATABASE).filter(
+            organization_id=organization_id
+        ).values_list('database', flat=True).afirst() or DIRECTORY_DATABASE
+        _placements.set(organization_id, database)
+    return database
+
+
+def place_organizations(organization_ids):
+    """Give new organizations a directory entry on their hashed shard"""
+    if not is_sharded():
+        return
+    OrganizationShard.objects.using(DIRECTORY_DATABASE).bulk_create(
+        [OrganizationShard(organization_id=org_id, database=hash_shard(org_id)) for org_id in organization_ids],
+        ignore_conflicts=True,
+    )
+    for org_id in organization_ids:
+        _placements.delete(org_id)
+
+
+def assign(organization_id, database):
+    """Point the directory at ``database`` for the organization (used when rebalancing)"""
+    OrganizationShard.objects.using(DIRECTORY_DATABASE).update_or_create(
+        organization_id=organization_id, defaults={'database': database}
+    )
+    _placements.delete(organization_id)
+
+
+def forget(organization_id):
+    """Drop this process's cached placement for the organization"""
+    _placements.delete(organization_id)
+
+
+def replicate(instances, database=None):
+    """
+    Upsert copies of directory Organization/User rows onto their shard (or ``database``).
+
+    Rows already on the target are updated in place, so this is safe to repeat.
+    """
+    by_target = {}
+    for instance in instances:
+        organization_id = instance.pk if isinstance(instance, Organization) else instance.organization_id
+        target = database or db_for_organization(organization_id)
+        if target != DIRECTORY_DATABASE:
+            by_target.setdefault((target, type(instance)), []).append(instance)
+
+    for (target, model), rows in by_target.items():
+        _upsert(model, rows, target)
+
+
+def _upsert(model, rows, using):
+    """
+    ``INSERT ... ON CONFLICT (id) DO UPDATE`` with each row's own values.
+
+    Values go through ``get_db_prep_save`` but not ``pre_save``, so
+    ``created_at`` is copied as is without touching the field's
+    ``auto_now_add`` (which request threads share).
+    """
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    fields = model._meta.concrete_fields
+    columns = [quote(field.column) for field in fields]
+    updates = ', '.join(
+        f'{quote(field.column)} = excluded.{quote(field.column)}' for field in fields if not field.primary_key
+    )
+    sql = (
+        f'INSERT INTO {quote(model._meta.db_table)} ({", ".join(columns)}) '
+        f'VALUES ({", ".join(["%s"] * len(columns))}) '
+        f'ON CONFLICT ({quote(model._meta.pk.column)}) DO UPDATE SET {updates}'
+    )
+    params = [[field.get_db_prep_save(getattr(row, field.attname), connection) for field in fields] for row in rows]
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        cursor.executemany(sql, params)
+
+
+@receiver(setting_changed)
+def reset_placements(setting, **kwargs):
+    if setting == 'KUDOS_SHARDS':
+        _placements.clear()
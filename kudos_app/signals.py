@@ -0,0 +1,55 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from . import directory, identity, sharding
+from .models import Organization, User
+
+
+@receiver([post_save, post_delete], sender=User)
+def evict_cached_user(sender, instance, **kwargs):
+    identity.invalidate_user(instance.pk)
+    directory.bump_version(instance.organization_id)
+
+
+@receiver([post_save, post_delete], sender=Organization)
+def evict_cached_organization_users(sender, instance, **kwargs):
+    identity.invalidate_organization(instance.pk)
+    directory.bump_version(instance.pk)
+    directory.bump_version(directory.ORGANIZATIONS_SCOPE)
+
+
+# Organization sharding: keep each shard's copies of directory rows current (see sharding.py)
+
+@receiver(post_save, sender=Organization)
+def replicate_organization(sender, instance, created, using, **kwargs):
+    if using != sharding.DIRECTORY_DATABASE or not sharding.is_sharded():
+        return
+    if created:
+        sharding.place_organizations([instance.pk])
+    sharding.replicate([instance])
+
+
+@receiver(post_save, sender=User)
+def replicate_user(sender, instance, using, **kwargs):
+    if using == sharding.DIRECTORY_DATABASE and sharding.is_sharded():
+        sharding.replicate([instance])
+
+
+@receiver(post_delete, sender=User)
+def delete_user_replica(sender, instance, using, **kwargs):
+    if using != sharding.DIRECTORY_DATABASE or not sharding.is_sharded():
+        return
+    database = sharding.db_for_organization(instance.organization_id)
+    if database != sharding.DIRECTORY_DATABASE:
+        # Cascades to the user's kudos, quota and leaderboard rows on the shard
+        User.objects.using(database).filter(pk=instance.pk).delete()
+
+
+@receiver(pre_delete, sender=Organization)
+def delete_organization_replica(sender, instance, using, **kwargs):
+    # pre_delete: the directory entry is removed by the same cascade
+    if using != sharding.DIRECTORY_DATABASE or not sharding.is_sharded():
+        return
+    database = sharding.db_for_organization(instance.pk)
+    if database != sharding.DIRECTORY_DATABASE:
+        Organization.objects.using(database).filter(pk=instance.pk).delete()
+    sharding.forget(instance.pk)
@@ -0,0 +1,30 @@
+"""
+Per-connection SQLite tuning.
+
+``configure_sqlite`` runs on every new connection (``connection_created``) and
+applies ``KUDOS_SQLITE_PRAGMAS``. The development settings leave that empty;
+``kudos_backend.settings_production`` turns on WAL so readers never block the
+writer, ``synchronous=NORMAL`` (durable at checkpoints, safe with WAL), a
+``busy_timeout`` so overlapping writers wait instead of failing with
+"database is locked", and a larger page cache and memory map.
+"""
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'KUDOS_SQLITE_PRAGMAS', None) or {}
+    for name, value in pragmas.items():
+        # Raw DB-API execute: runs before Django wraps the connection, and stays out of query logs
+        connection.connection.execute(f'PRAGMA {name} = {value}')
+
+
+def read_pragmas(connection, names=None):
+    """Current values of the given (default: configured) pragmas on a Django connection"""
+    names = names or list(getattr(settings, 'KUDOS_SQLITE_PRAGMAS', None) or {})
+    connection.ensure_connection()
+    return {name: connection.connection.execute(f'PRAGMA {name}').fetchone()[0] for name in names}
@@ -1,3 +1,1285 @@
-from django.test import TestCase
+import asyncio
+import csv
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from io import StringIO
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from unittest import mock, skipUnless
+from kudos_backend.settings_production import KUDOS_SQLITE_PRAGMAS as PRODUCTION_PRAGMAS
+from . import (
+    archive, bench, events, graph, group_commit, identity, importer, instrumentation, profiling, sharding,
+    throttling
+)
+from .models import (
+    Organization, OrganizationShard, User, Kudo, ArchivedKudo, WeeklyActivity, WeeklyQuota, WEEKLY_KUDOS_LIMIT,
+    get_week_start, get_week_bounds
+)
+from .pagination import UserCursorPagination
+from .renderers import OrJSONRenderer
+from .sqlite import read_pragmas
+from .serializers import (
+    KudoSerializer, UserSerializer, UserSimpleSerializer, kudo_values, serialize_kudo_rows, user_simple_values
+)
 
 
+class KudosTestMixin:
+    """Shared fixtures: one organization with a handful of users"""
+
+    def setUp(self):
+        self.org = Organization.objects.create(name='Company A')
+        self.other_org = Organization.objects.create(name='Company B')
+        self.alice = User.objects.create(username='alice', email='alice@a.com', organization=self.org)
+        self.bob = User.objects.create(username='bob', email='bob@a.com', organization=self.org)
+        self.carol = User.objects.create(username='carol', email='carol@a.com', organization=self.org)
+        self.dave = User.objects.create(username='dave', email='dave@b.com', organization=self.other_org)
+        self.client = APIClient()
+
+    def as_user(self, user):
+        self.client.credentials(HTTP_X_USER_ID=str(user.id))
+        return self.client
+
+    def give_kudo(self, sender, receiver, message='Great work!'):
+        return self.as_user(sender).post('/api/kudos/', {'receiver': receiver.id, 'message': message}, format='json')
+
+
+class WeeklyQuotaTests(KudosTestMixin, TestCase):
+
+    def test_reserve_stops_at_limit(self):
+        results = [WeeklyQuota.reserve(self.alice) for _ in range(WEEKLY_KUDOS_LIMIT + 1)]
+        self.assertEqual(results, [True] * WEEKLY_KUDOS_LIMIT + [False])
+        self.assertEqual(self.alice.get_remaining_kudos(), 0)
+
+    def test_create_decrements_ledger(self):
+        response = self.give_kudo(self.alice, self.bob)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.alice.get_remaining_kudos(), WEEKLY_KUDOS_LIMIT - 1)
+
+        me = self.as_user(self.alice).get('/api/users/me/')
+        self.assertEqual(me.data['remaining_kudos'], WEEKLY_KUDOS_LIMIT - 1)
+
+    def test_create_rejected_when_quota_exhausted(self):
+        for _ in range(WEEKLY_KUDOS_LIMIT):
+            self.assertEqual(self.give_kudo(self.alice, self.bob).status_code, 201)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.give_kudo(self.alice, self.carol)
+        # The conditional UPDATE is the first ledger statement: no separate remaining-kudos read
+        ledger = [query['sql'] for query in queries.captured_queries if 'weeklyquota' in query['sql']]
+        self.assertTrue(ledger[0].startswith('UPDATE'))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {'non_field_errors': ['You have no remaining kudos for this week.']})
+        self.assertEqual(Kudo.objects.filter(sender=self.alice).count(), WEEKLY_KUDOS_LIMIT)
+
+    def test_rebuild_matches_history(self):
+        Kudo.objects.create(sender=self.alice, receiver=self.bob, message='one')
+        Kudo.objects.create(sender=self.alice, receiver=self.carol, message='two')
+        self.assertEqual(WeeklyQuota.rebuild(), 1)
+
+        quota = WeeklyQuota.objects.get(user=self.alice)
+        self.assertEqual((quota.week_start, quota.used), (get_week_start(), 2))
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN is SQLite specific')
+class KudoQueryPlanTests(KudosTestMixin, TestCase):
+
+    def assertIndexSeek(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertRegex(plan, rf'SEARCH \S+ USING (COVERING )?INDEX {index_name}')
+        self.assertNotIn('SCAN', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_received_list_uses_receiver_index_without_sort(self):
+        queryset = Kudo.objects.filter(receiver=self.bob).select_related('sender')
+        self.assertIndexSeek(queryset, 'kudo_receiver_created_idx')
+
+    def test_weekly_sender_count_uses_sender_index(self):
+        queryset = self.alice.get_kudos_sent_this_week().order_by().values('pk')
+        self.assertIndexSeek(queryset, 'kudo_sender_created_idx')
+
+    def test_admin_month_range_uses_created_index_without_sort(self):
+        start, end = get_week_bounds()
+        queryset = Kudo.objects.filter(created_at__gte=start, created_at__lt=end).order_by('-created_at', '-pk')
+        self.assertIndexSeek(queryset, 'kudo_created_idx')
+
+    def test_week_bounds_are_half_open_and_aware(self):
+        start, end = get_week_bounds()
+        self.assertIsNotNone(start.tzinfo)
+        self.assertEqual(start.date(), get_week_start())
+        self.assertEqual((end - start).days, 7)
+
+
+class KeysetPaginationTests(KudosTestMixin, TestCase):
+
+    def collect_pages(self, url):
+        seen = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(item['id'] for item in response.data['results'])
+            url = response.data['next']
+        return seen
+
+    def test_received_kudos_walks_every_row_once(self):
+        kudos = [Kudo.objects.create(sender=self.alice, receiver=self.bob, message=str(i)) for i in range(25)]
+        # Force ties on created_at so the id tiebreaker matters
+        Kudo.objects.filter(id__in=[k.id for k in kudos[5:15]]).update(created_at=kudos[5].created_at)
+
+        self.as_user(self.bob)
+        expected = list(Kudo.objects.filter(receiver=self.bob).order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(self.collect_pages('/api/kudos/received/?page_size=7'), expected)
+
+    def test_previous_link_returns_prior_page(self):
+        for i in range(6):
+            Kudo.objects.create(sender=self.alice, receiver=self.bob, message=str(i))
+
+        first = self.as_user(self.bob).get('/api/kudos/received/?page_size=3')
+        self.assertIsNone(first.data['previous'])
+        second = self.client.get(first.data['next'])
+        back = self.client.get(second.data['previous'])
+        self.assertEqual([k['id'] for k in back.data['results']], [k['id'] for k in first.data['results']])
+
+    def test_user_directory_is_paginated_by_username(self):
+        for i in range(5):
+            User.objects.create(username=f'user{i}', email=f'user{i}@a.com', organization=self.org)
+
+        ids = self.collect_pages(f'/api/organizations/{self.org.id}/users/?page_size=2')
+        expected = list(User.objects.filter(organization=self.org).order_by('username').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.as_user(self.bob).get('/api/kudos/received/?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 404)
+
+
+class IdentityResolutionTests(KudosTestMixin, TestCase):
+
+    def test_repeat_requests_skip_identity_lookup(self):
+        self.as_user(self.alice).get('/api/users/me/')
+        # Only the quota ledger read remains once the identity is cached
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/users/me/')
+        self.assertEqual(response.data['organization_name'], 'Company A')
+
+    def test_user_save_evicts_cached_identity(self):
+        self.as_user(self.alice).get('/api/users/me/')
+        self.alice.username = 'alice2'
+        self.alice.save()
+        self.assertEqual(self.client.get('/api/users/me/').data['username'], 'alice2')
+
+    def test_organization_save_evicts_member_identities(self):
+        self.as_user(self.alice).get('/api/users/me/')
+        self.org.name = 'Company A2'
+        self.org.save()
+        self.assertEqual(self.client.get('/api/users/me/').data['organization_name'], 'Company A2')
+
+    def test_unknown_user_is_not_found(self):
+        self.client.credentials(HTTP_X_USER_ID='999999')
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 404)
+
+    def test_unknown_ids_are_remembered_until_created(self):
+        self.addCleanup(identity.invalidate_user, 424242)
+        self.client.credentials(HTTP_X_USER_ID='424242')
+        self.client.get('/api/users/me/')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/users/me/').status_code, 404)
+            self.assertIsNone(async_to_sync(identity.aget_user)(424242))
+
+        User.objects.create(id=424242, username='erin', email='erin@a.com', organization=self.org)
+        self.assertEqual(self.client.get('/api/users/me/').data['username'], 'erin')
+
+
+class DirectoryCacheTests(KudosTestMixin, TestCase):
+
+    def test_if_none_match_returns_304_without_queries(self):
+        url = f'/api/organizations/{self.org.id}/users/'
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_user_change_bumps_directory_version(self):
+        first = self.client.get('/api/organizations/')
+        User.objects.create(username='erin', email='erin@a.com', organization=self.org)
+        self.assertEqual(self.client.get('/api/organizations/', HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+
+        users = self.client.get(f'/api/organizations/{self.org.id}/users/')
+        self.bob.email = 'bob@new.com'
+        self.bob.save()
+        response = self.client.get(f'/api/organizations/{self.org.id}/users/', HTTP_IF_NONE_MATCH=users['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], users['ETag'])
+
+    def test_user_list_snapshot_is_per_caller(self):
+        alice_view = self.as_user(self.alice).get('/api/users/')
+        bob_view = self.as_user(self.bob).get('/api/users/')
+        self.assertNotEqual(alice_view['ETag'], bob_view['ETag'])
+        self.assertNotIn(self.bob.id, [u['id'] for u in bob_view.data['results']])
+
+        with self.assertNumQueries(0):
+            cached = self.client.get('/api/users/')
+        self.assertEqual(cached.data, bob_view.data)
+
+
+class KudoBatchTests(KudosTestMixin, TestCase):
+
+    def post_batch(self, sender, items):
+        return self.as_user(sender).post('/api/kudos/batch/', items, format='json')
+
+    def test_batch_creates_kudos_with_constant_queries(self):
+        items = [{'receiver': self.bob.id, 'message': 'a'}, {'receiver': self.carol.id, 'message': 'b'}]
+        self.post_batch(self.alice, items[:1])  # warm the identity cache
+
+        with self.assertNumQueries(9):
+            response = self.post_batch(self.alice, items)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual(response.data['results'][1]['kudo']['receiver_username'], 'carol')
+        self.assertEqual(self.alice.get_remaining_kudos(), WEEKLY_KUDOS_LIMIT - 3)
+
+    def test_invalid_items_are_reported_per_item(self):
+        response = self.post_batch(self.alice, [
+            {'receiver': self.bob.id, 'message': 'thanks'},
+            {'receiver': self.alice.id, 'message': 'me'},
+            {'receiver': self.dave.id, 'message': 'other org'},
+            {'receiver': 999999, 'message': 'nobody'},
+        ])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([r['status'] for r in response.data['results']], ['created', 'error', 'error', 'error'])
+        self.assertEqual(Kudo.objects.count(), 1)
+
+    def test_batch_over_quota_creates_nothing(self):
+        items = [{'receiver': self.bob.id, 'message': str(i)} for i in range(WEEKLY_KUDOS_LIMIT + 1)]
+        response = self.post_batch(self.alice, items)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Kudo.objects.count(), 0)
+        self.assertEqual(self.alice.get_remaining_kudos(), WEEKLY_KUDOS_LIMIT)
+
+
+class EndpointBudgetTests(TestCase):
+    """Replays the benchmark mix on a small dataset and holds every endpoint to its baseline query budget"""
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('generate_demo_data', orgs=2, users_per_org=10, kudos_per_user=4, weeks=4, seed=0, stdout=StringIO())
+
+    def test_endpoints_within_query_budget(self):
+        results = bench.run_benchmark(requests=300, write_ratio=0.2, seed=0)
+        self.assertEqual(set(results['endpoints']), set(bench.READ_ENDPOINTS + bench.WRITE_ENDPOINTS))
+        self.assertEqual(bench.check_against_baseline(results, bench.load_baseline(), check_latency=False), [])
+
+
+@override_settings(KUDOS_INSTRUMENTATION=True, DEBUG=True)
+class InstrumentationMiddlewareTests(KudosTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        instrumentation.stats.clear()
+
+    def test_server_timing_header_reports_queries(self):
+        response = self.as_user(self.bob).get('/api/kudos/received/')
+        self.assertRegex(response['Server-Timing'], r'db;dur=[\d.]+;desc="\d+ queries"')
+        self.assertIn('render;dur=', response['Server-Timing'])
+
+    def test_serialize_is_measured_not_the_remainder(self):
+        def slow(function):
+            def wrapper(*args, **kwargs):
+                time.sleep(0.05)
+                return function(*args, **kwargs)
+            return wrapper
+
+        with mock.patch('rest_framework.generics.GenericAPIView.check_permissions', slow(lambda *args: None)):
+            response = self.as_user(self.bob).get('/api/users/')
+        timings = dict(re.findall(r'(\w+);dur=([\d.]+)', response['Server-Timing']))
+        self.assertGreaterEqual(float(timings['other']), 50)
+        self.assertLess(float(timings['serialize']), 50)
+
+        with mock.patch.object(UserSerializer, 'to_representation', slow(UserSerializer.to_representation)):
+            response = self.as_user(self.bob).get('/api/users/me/')
+        timings = dict(re.findall(r'(\w+);dur=([\d.]+)', response['Server-Timing']))
+        self.assertGreaterEqual(float(timings['serialize']), 50)
+        self.assertLess(float(timings['other']), 50)
+
+    def test_stats_endpoint_aggregates_per_view(self):
+        for _ in range(3):
+            self.as_user(self.bob).get('/api/kudos/received/')
+        views = self.client.get('/api/debug/stats/').data['views']
+        self.assertEqual(views['kudos-received']['requests'], 3)
+        self.assertEqual(sum(views['kudos-received']['histogram_ms'].values()), 3)
+
+    def test_duplicate_statements_share_a_fingerprint(self):
+        self.assertEqual(
+            instrumentation.fingerprint('SELECT * FROM t WHERE id IN (%s, %s)'),
+            instrumentation.fingerprint('SELECT  *  FROM t WHERE id IN (%s, %s, %s)'),
+        )
+
+    @override_settings(DEBUG=False)
+    def test_stats_endpoint_hidden_without_debug(self):
+        self.assertEqual(self.client.get('/api/debug/stats/').status_code, 404)
+
+
+@override_settings(KUDOS_THROTTLE=True, KUDOS_THROTTLE_RATES={
+    'read': {'user': (0.5, 3), 'organization': (0.5, 5)},
+    'create': {'user': (0.5, 1), 'organization': (0.5, 5)},
+})
+class ThrottleMiddlewareTests(KudosTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        throttling.buckets.clear()
+
+    def test_rejects_over_budget_caller_before_any_query(self):
+        statuses = [self.as_user(self.bob).get('/api/kudos/received/').status_code for _ in range(3)]
+        self.assertEqual(statuses, [200] * 3)
+
+        with self.assertNumQueries(0):
+            response = self.as_user(self.bob).get('/api/kudos/received/')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '2')
+        self.assertEqual(response.json(), {'error': 'Too many requests'})
+
+    def test_create_has_its_own_budget(self):
+        for _ in range(3):
+            self.as_user(self.alice).get('/api/users/')
+        self.assertEqual(self.give_kudo(self.alice, self.bob).status_code, 201)
+        self.assertEqual(self.give_kudo(self.alice, self.bob).status_code, 429)
+        self.assertEqual(Kudo.objects.count(), 1)
+
+    def test_organization_budget_is_shared_by_its_users(self):
+        for user in (self.alice, self.alice, self.alice, self.bob, self.bob):
+            self.assertEqual(self.as_user(user).get('/api/users/').status_code, 200)
+        self.assertEqual(self.as_user(self.carol).get('/api/users/').status_code, 429)
+        self.assertEqual(self.as_user(self.dave).get('/api/users/').status_code, 200)
+
+    def test_buckets_refill_and_spend_all_or_nothing(self):
+        now = [0.0]
+        buckets = throttling.TokenBuckets(clock=lambda: now[0])
+        user, organization = ('user', 1, 1), ('organization', 2, 2)
+        self.assertEqual(buckets.take([user, organization]), 0)
+        self.assertEqual(buckets.take([user, organization]), 1)
+
+        # The failed take left the organization's second token in place
+        now[0] = 0.5
+        self.assertEqual([buckets.take([organization]) for _ in range(3)], [0, 0, 0.5])
+        now[0] = 1.0
+        self.assertEqual(buckets.take([user, organization]), 0)
+
+
+class RequestProfilingTests(KudosTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(
+            KUDOS_PROFILING=True, KUDOS_PROFILING_USERS=[self.alice.id], KUDOS_PROFILING_DIR=directory.name
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_header_writes_a_tagged_profile(self):
+        response = self.as_user(self.alice).get('/api/users/me/', HTTP_X_PROFILE='cprofile')
+        self.assertEqual(response.status_code, 200)
+
+        [profile] = profiling.list_profiles()
+        self.assertEqual(response['X-Profile-File'], profile['name'])
+        self.assertEqual((profile['view'], profile['user_id'], profile['kind']), ('current-user', self.alice.id, 'prof'))
+        self.assertTrue(profiling.summarize(profile))
+
+        output = StringIO()
+        call_command('list_profiles', stdout=output)
+        self.assertIn(f"current-user                 user {self.alice.id}", output.getvalue())
+
+    def test_only_configured_users_are_profiled(self):
+        response = self.as_user(self.bob).get('/api/users/me/', HTTP_X_PROFILE='cprofile')
+        self.assertNotIn('X-Profile-File', response)
+        response = self.as_user(self.alice).get('/api/users/me/')
+        self.assertNotIn('X-Profile-File', response)
+        self.assertEqual(profiling.list_profiles(), [])
+
+    @override_settings(KUDOS_PROFILING_SAMPLE_RATE=1.0, KUDOS_PROFILING_KEEP=2)
+    def test_sampling_rate_and_retention(self):
+        for _ in range(3):
+            self.as_user(self.alice).get('/api/users/')
+        self.assertEqual([profile['view'] for profile in profiling.list_profiles()], ['user-list'] * 2)
+
+    def test_sampler_writes_collapsed_stacks(self):
+        def busy():
+            deadline = time.perf_counter() + 0.05
+            while time.perf_counter() < deadline:
+                pass
+
+        with profiling.StackSampler(threading.get_ident(), 0.001) as sampler:
+            busy()
+        path = os.path.join(profiling.get_directory(), 'stacks.collapsed')
+        sampler.write(path)
+        profile = {'path': path, 'kind': 'collapsed'}
+        self.assertTrue(profiling.summarize(profile)[0][0].startswith('busy (tests.py:'))
+
+
+class AsyncReadViewTests(KudosTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        Kudo.objects.create(sender=self.alice, receiver=self.bob, message='Thanks!')
+        WeeklyQuota.reserve(self.alice)
+
+    async def fetch_both(self, path, user):
+        headers = {'X-User-ID': str(user.id)}
+        sync_response = await self.async_client.get(f'/api{path}', headers=headers)
+        async_response = await self.async_client.get(f'/api/async{path}', headers=headers)
+        self.assertEqual((async_response.status_code, sync_response.status_code), (200, 200), path)
+        return sync_response.json(), async_response.json()
+
+    async def test_async_views_match_sync_views(self):
+        for path, user in [('/users/me/', self.alice), ('/kudos/received/', self.bob), ('/users/', self.alice),
+                           ('/organizations/', self.alice), (f'/organizations/{self.org.id}/users/', self.alice)]:
+            sync_data, async_data = await self.fetch_both(path, user)
+            if isinstance(sync_data, dict) and 'results' in sync_data:
+                self.assertTrue(sync_data['results'], path)
+                sync_data, async_data = sync_data['results'], async_data['results']
+            self.assertEqual(async_data, sync_data, path)
+
+    async def test_async_current_user_errors(self):
+        self.assertEqual((await self.async_client.get('/api/async/users/me/')).status_code, 400)
+        response = await self.async_client.get('/api/async/users/me/', headers={'X-User-ID': '999999'})
+        self.assertEqual(response.status_code, 404)
+        response = await self.async_client.get('/api/async/organizations/999999/users/')
+        self.assertEqual(response.status_code, 404)
+
+    async def test_async_views_reject_writes(self):
+        self.assertEqual((await self.async_client.post('/api/async/users/')).status_code, 405)
+
+
+class KudoExportTests(KudosTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        Kudo.objects.create(sender=self.alice, receiver=self.bob, message='Thanks, "Bob"!')
+        Kudo.objects.create(sender=self.bob, receiver=self.carol, message='Great demo')
+        Kudo.objects.create(sender=self.dave, receiver=self.dave, message='Other org')
+
+    def export(self, user, query=''):
+        response = self.as_user(user).get(f'/api/organizations/{self.org.id}/kudos/export/{query}')
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_ndjson_export_streams_one_object_per_line(self):
+        rows = [json.loads(line) for line in self.export(self.alice).splitlines()]
+        self.assertEqual(sorted(row['message'] for row in rows), ['Great demo', 'Thanks, "Bob"!'])
+        self.assertEqual({row['sender_username'] for row in rows}, {'alice', 'bob'})
+
+    def test_csv_export_has_header_and_quoted_rows(self):
+        rows = list(csv.reader(StringIO(self.export(self.alice, '?format=csv'))))
+        self.assertEqual(rows[0], ['id', 'created_at', 'sender_username', 'receiver_username', 'message'])
+        self.assertIn('Thanks, "Bob"!', [row[4] for row in rows[1:]])
+
+    def test_date_range_excludes_rows_outside_it(self):
+        self.assertEqual(self.export(self.alice, '?start=2000-01-01&end=2000-03-31'), '')
+
+    def test_export_restricted_to_own_organization(self):
+        response = self.as_user(self.dave).get(f'/api/organizations/{self.org.id}/kudos/export/')
+        self.assertEqual(response.status_code, 403)
+
+    def test_export_command_writes_rows(self):
+        out = StringIO()
+        call_command('export_kudos', str(self.org.id), stdout=out, stderr=StringIO())
+        self.assertEqual(len(out.getvalue().splitlines()), 2)
+
+
+class KudoArchiveTests(KudosTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        now = timezone.now()
+        for days_ago, sender in [(60, self.alice), (50, self.carol), (40, self.alice), (1, self.carol), (0, self.alice)]:
+            kudo = Kudo.objects.create(sender=sender, receiver=self.bob, message=f'Deploy {days_ago} days ago')
+            Kudo.objects.filter(pk=kudo.pk).update(created_at=now - timedelta(days=days_ago))
+
+    def archive(self, days=30):
+        call_command('archive_kudos', '--older-than', str(days), '--batch-size', '2', stdout=StringIO())
+
+    def walk(self, page_size=2):
+        """Follow next links to the end, then previous links back; returns both id sequences"""
+        client = self.as_user(self.bob)
+        response = client.get('/api/kudos/received/', {'page_size': page_size})
+        pages = [response.data['results']]
+        while response.data['next']:
+            response = client.get(response.data['next'])
+            pages.append(response.data['results'])
+        backwards = [response.data['results']]
+        while response.data['previous']:
+            response = client.get(response.data['previous'])
+            backwards.insert(0, response.data['results'])
+        return pages, backwards
+
+    def test_command_moves_only_old_kudos(self):
+        self.archive()
+        self.assertEqual(Kudo.objects.count(), 2)
+        self.assertEqual(
+            sorted(ArchivedKudo.objects.values_list('message', flat=True)),
+            ['Deploy 40 days ago', 'Deploy 50 days ago', 'Deploy 60 days ago']
+        )
+        # The search index only covers hot kudos
+        found = self.as_user(self.bob).get('/api/kudos/search/', {'q': 'deploy'}).data['results']
+        self.assertEqual(len(found), 2)
+
+    def test_received_list_falls_through_to_archive(self):
+        before, _ = self.walk()
+        self.archive()
+        # Pages that end before the oldest hot kudo never touch the archive
+        with self.assertNumQueries(1):
+            first = self.as_user(self.bob).get('/api/kudos/received/', {'page_size': 1})
+        self.assertEqual(first.data['results'], before[0][:1])
+
+        pages, backwards = self.walk()
+        self.assertEqual(pages, before)
+        self.assertEqual(backwards, pages)
+        # A page can mix hot and archived kudos
+        pages, _ = self.walk(page_size=3)
+        self.assertEqual([kudo['message'] for kudo in pages[0]],
+                         ['Deploy 0 days ago', 'Deploy 1 days ago', 'Deploy 40 days ago'])
+
+    async def test_async_received_list_matches_sync(self):
+        await sync_to_async(self.archive)()
+        headers = {'X-User-ID': str(self.bob.id)}
+        sync_data = (await self.async_client.get('/api/kudos/received/', {'page_size': 4}, headers=headers)).json()
+        async_data = (await self.async_client.get('/api/async/kudos/received/', {'page_size': 4},
+                                                  headers=headers)).json()
+        self.assertEqual(len(async_data['results']), 4)
+        self.assertEqual(async_data['results'], sync_data['results'])
+
+    def test_history_readers_include_archive(self):
+        WeeklyActivity.rebuild()
+        counts = sorted(WeeklyActivity.objects.values_list('user__username', 'week_start', 'received'))
+        self.archive()
+        WeeklyActivity.rebuild()
+        self.assertEqual(sorted(WeeklyActivity.objects.values_list('user__username', 'week_start', 'received')),
+                         counts)
+
+        out = StringIO()
+        call_command('export_kudos', str(self.org.id), stdout=out, stderr=StringIO())
+        self.assertEqual(len(out.getvalue().splitlines()), 5)
+
+    def test_retention_must_keep_current_week(self):
+        with self.assertRaises(CommandError):
+            self.archive(days=3)
+
+
+class LeaderboardTests(KudosTestMixin, TestCase):
+
+    def leaderboard(self, user, org=None):
+        org = org or self.org
+        return self.as_user(user).get(f'/api/organizations/{org.id}/leaderboard/')
+
+    def test_counters_follow_single_and_batch_creates(self):
+        self.give_kudo(self.alice, self.bob)
+        self.give_kudo(self.carol, self.bob)
+        self.as_user(self.alice).post('/api/kudos/batch/', [
+            {'receiver': self.carol.id, 'message': 'a'}, {'receiver': self.bob.id, 'message': 'b'},
+        ], format='json')
+
+        data = self.leaderboard(self.alice).data
+        self.assertEqual(data['top_receivers'][0], {'user_id': self.bob.id, 'username': 'bob', 'count': 3})
+        self.assertEqual(data['top_senders'][0], {'user_id': self.alice.id, 'username': 'alice', 'count': 3})
+        self.assertEqual(data['participation'], {'active_senders': 2, 'members': 3, 'rate': 0.6667})
+
+    def test_rebuild_matches_incremental_counters(self):
+        self.give_kudo(self.alice, self.bob)
+        self.give_kudo(self.bob, self.carol)
+        incremental = sorted(WeeklyActivity.objects.values_list('user_id', 'sent', 'received'))
+
+        call_command('rebuild_leaderboard', stdout=StringIO())
+        self.assertEqual(sorted(WeeklyActivity.objects.values_list('user_id', 'sent', 'received')), incremental)
+
+    def test_leaderboard_restricted_to_own_organization(self):
+        self.assertEqual(self.leaderboard(self.dave).status_code, 403)
+
+
+@skipUnless(graph.np is not None, 'Graph analytics need NumPy')
+class GraphStatsTests(KudosTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        for sender, receiver in [(self.alice, self.bob), (self.alice, self.bob), (self.bob, self.alice),
+                                 (self.carol, self.bob), (self.dave, self.dave)]:
+            Kudo.objects.create(sender=sender, receiver=receiver, message='Thanks')
+
+    def stats(self, **params):
+        return self.as_user(self.alice).get(f'/api/organizations/{self.org.id}/graph-stats/', params)
+
+    def test_metrics(self):
+        response = self.stats()
+        self.assertEqual(response.status_code, 200)
+        data = response.data
+        self.assertEqual((data['members'], data['kudos'], data['pairs']), (3, 4, 3))
+        self.assertEqual(data['reciprocity'], 0.6667)
+        self.assertEqual(data['participation'], {'senders': 3, 'receivers': 2})
+        self.assertEqual(data['isolated'], {'count': 1, 'users': [{'user_id': self.carol.id, 'username': 'carol'}]})
+        self.assertEqual(data['islands'], {'count': 1, 'largest': 3})
+        self.assertEqual(data['top_pairs'][0], {
+            'sender': {'user_id': self.alice.id, 'username': 'alice'},
+            'receiver': {'user_id': self.bob.id, 'username': 'bob'},
+            'kudos': 2,
+        })
+        self.assertEqual([(c['username'], c['colleagues']) for c in data['connectors']],
+                         [('bob', 2), ('alice', 1), ('carol', 1)])
+
+    def test_deactivated_users_are_not_members(self):
+        User.objects.filter(pk=self.carol.pk).update(is_active=False)
+        data = self.stats().data
+        self.assertEqual((data['members'], data['kudos'], data['isolated']['count']), (2, 3, 0))
+
+    def test_organization_with_everyone_deactivated(self):
+        User.objects.filter(organization=self.org).update(is_active=False)
+        # Read the graph directly: deactivated users cannot call the endpoint
+        start, end = get_week_bounds()
+        stats = graph.load_graph(self.org.id, start, end).stats()
+        self.assertEqual((stats['members'], stats['kudos'], stats['isolated']['count']), (0, 0, 0))
+
+    def test_separate_islands_and_archived_kudos(self):
+        erin = User.objects.create(username='erin', email='erin@a.com', organization=self.org)
+        frank = User.objects.create(username='frank', email='frank@a.com', organization=self.org)
+        kudo = Kudo.objects.create(sender=erin, receiver=frank, message='Thanks')
+        archive.archive_kudos([kudo.id])
+
+        data = self.stats().data
+        self.assertEqual(data['islands'], {'count': 2, 'largest': 3})
+        self.assertEqual(data['kudos'], 5)
+
+    def test_chunked_compaction_matches_one_pass(self):
+        start, end = get_week_bounds()
+        whole = graph.load_graph(self.org.id, start, end).stats()
+        with mock.patch.object(graph, 'COMPACT_EVERY', 2):
+            chunked = graph.load_graph(self.org.id, start, end, chunk_size=1).stats()
+        self.assertEqual(chunked, whole)
+
+    def test_table_scan_matches_index_seeks(self):
+        start, end = get_week_bounds()
+        results = []
+        for share in (0, 1000):  # Never / always scan
+            with mock.patch.object(graph, 'SCAN_SHARE', share):
+                results.append(graph.load_graph(self.org.id, start, end).stats())
+        self.assertEqual(results[0], results[1])
+
+    def test_cached_per_organization_and_window(self):
+        graph.organization_stats(self.org.id, get_week_start(), 4)
+        with self.assertNumQueries(0):
+            graph.organization_stats(self.org.id, get_week_start(), 4)
+        with self.assertNumQueries(4):  # Members, user count, hot kudos, archived kudos
+            graph.organization_stats(self.org.id, get_week_start(), 1)
+
+    def test_other_organizations_are_forbidden(self):
+        response = self.as_user(self.dave).get(f'/api/organizations/{self.org.id}/graph-stats/')
+        self.assertEqual(response.status_code, 403)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'FTS5 index is SQLite-only')
+class KudoSearchTests(KudosTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        Kudo.objects.create(sender=self.alice, receiver=self.bob, message='Thanks for the deploy fix')
+        Kudo.objects.create(sender=self.bob, receiver=self.carol, message='Deploy deploy deploy, what a week')
+        Kudo.objects.create(sender=self.carol, receiver=self.alice, message='Great review')
+        Kudo.objects.create(sender=self.dave, receiver=self.dave, message='Other org deploy')
+
+    def search(self, query, user=None, **params):
+        return self.as_user(user or self.alice).get('/api/kudos/search/', {'q': query, **params})
+
+    def test_results_ranked_and_scoped_to_organization(self):
+        response = self.search('deploy')
+        self.assertEqual(response.status_code, 200)
+        messages = [kudo['message'] for kudo in response.data['results']]
+        self.assertEqual(messages, ['Deploy deploy deploy, what a week', 'Thanks for the deploy fix'])
+
+    def test_index_follows_updates_and_deletes(self):
+        kudo = Kudo.objects.get(message='Great review')
+        kudo.message = 'Great deploy review'
+        kudo.save()
+        Kudo.objects.filter(message__startswith='Thanks').delete()
+        messages = [kudo['message'] for kudo in self.search('deploy').data['results']]
+        self.assertEqual(messages, ['Deploy deploy deploy, what a week', 'Great deploy review'])
+        self.assertEqual(self.search('thanks').data['results'], [])
+
+    def test_keyset_pages_cover_all_matches(self):
+        first = self.search('deploy', page_size=1)
+        second = self.client.get(first.data['next'])
+        self.assertIsNone(second.data['next'])
+        back = self.client.get(second.data['previous'])
+        self.assertEqual(back.data['results'], first.data['results'])
+        self.assertEqual(len({kudo['id'] for kudo in first.data['results'] + second.data['results']}), 2)
+
+    def test_query_syntax_is_treated_as_text(self):
+        self.assertEqual(self.search('"deploy AND (').status_code, 200)
+        self.assertEqual(self.search('  ').status_code, 400)
+
+
+class KudoStreamTests(KudosTestMixin, TestCase):
+
+    async def open_stream(self, user, **headers):
+        response = await self.async_client.get('/api/kudos/stream/', headers={'X-User-ID': str(user.id), **headers})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        return response
+
+    async def next_frame(self, response):
+        if not hasattr(response, 'frames'):
+            response.frames = aiter(response.streaming_content)
+        return (await asyncio.wait_for(anext(response.frames), timeout=2)).decode('utf-8')
+
+    async def test_live_kudo_pushed_to_receiver(self):
+        response = await self.open_stream(self.bob)
+        try:
+            self.assertTrue((await self.next_frame(response)).startswith('retry:'))
+            kudo = await Kudo.objects.acreate(sender=self.alice, receiver=self.bob, message='Live!')
+            events.broker.publish_kudos([kudo])
+            frame = await self.next_frame(response)
+        finally:
+            response.close()
+
+        self.assertIn(f'id: {events.format_event_id(events.event_position(kudo))}\n', frame)
+        self.assertEqual(json.loads(frame.split('data: ', 1)[1])['message'], 'Live!')
+        self.assertFalse(events.broker.has_subscribers(self.bob.id))
+
+    async def test_last_event_id_resumes_after_position(self):
+        first = await Kudo.objects.acreate(sender=self.alice, receiver=self.bob, message='Seen')
+        await Kudo.objects.acreate(sender=self.carol, receiver=self.bob, message='Missed')
+        last_event_id = events.format_event_id(events.event_position(first))
+
+        response = await self.open_stream(self.bob, **{'Last-Event-ID': last_event_id})
+        try:
+            await self.next_frame(response)
+            frame = await self.next_frame(response)
+        finally:
+            response.close()
+        self.assertIn('"message":"Missed"', frame)
+
+    async def test_stream_rejects_bad_requests(self):
+        response = await self.async_client.get('/api/kudos/stream/', headers={'X-User-ID': str(self.bob.id),
+                                                                               'Last-Event-ID': 'nonsense'})
+        self.assertEqual(response.status_code, 400)
+        response = await self.async_client.get('/api/kudos/stream/', headers={'X-User-ID': '999999'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_stream_requires_asgi(self):
+        self.assertEqual(self.as_user(self.bob).get('/api/kudos/stream/').status_code, 501)
+
+    def test_create_publishes_on_commit(self):
+        loop = asyncio.new_event_loop()
+        subscription = events.broker.subscribe(self.bob.id, loop=loop)
+        try:
+            with self.captureOnCommitCallbacks(execute=False) as callbacks:
+                self.give_kudo(self.alice, self.bob, 'Committed')
+            self.assertTrue(subscription.queue.empty())
+            for callback in callbacks:
+                callback()
+            event = loop.run_until_complete(subscription.get(timeout=1))
+        finally:
+            events.broker.unsubscribe(subscription)
+            loop.close()
+        self.assertIn(b'"message":"Committed"', event.payload)
+
+
+class BootstrapTests(KudosTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        for message in ('One', 'Two'):
+            self.give_kudo(self.alice, self.bob, message)
+
+    def test_matches_the_separate_endpoints(self):
+        client = self.as_user(self.bob)
+        data = client.get('/api/bootstrap/').json()
+
+        self.assertEqual(data['user'], client.get('/api/users/me/').json())
+        self.assertEqual(data['users'], client.get('/api/users/').json())
+        self.assertEqual(data['kudos_received'], client.get('/api/kudos/received/').json())
+
+    def test_links_continue_on_the_received_list(self):
+        data = self.as_user(self.bob).get('/api/bootstrap/', {'page_size': 1}).json()
+        self.assertTrue(data['kudos_received']['next'].startswith('http://testserver/api/kudos/received/?'))
+
+        follow = self.as_user(self.bob).get(data['kudos_received']['next']).json()
+        self.assertEqual([kudo['message'] for kudo in follow['results']], ['One'])
+
+    def test_directory_is_one_page(self):
+        User.objects.bulk_create([
+            User(username=f'member{i:02}', email=f'member{i}@a.com', organization=self.org) for i in range(25)
+        ])
+        users = self.as_user(self.bob).get('/api/bootstrap/').json()['users']
+        self.assertEqual(len(users['results']), UserCursorPagination.page_size)
+        self.assertTrue(users['next'].startswith('http://testserver/api/users/?'))
+
+        rest = self.as_user(self.bob).get(users['next']).json()['results']
+        self.assertEqual(len(users['results']) + len(rest), 27)  # Everyone but bob
+
+    def test_fixed_queries_once_warm(self):
+        client = self.as_user(self.bob)
+        client.get('/api/bootstrap/')
+        # The quota read, the hot kudos page and the archive behind it
+        with self.assertNumQueries(3):
+            client.get('/api/bootstrap/')
+
+    def test_directory_follows_changes(self):
+        self.as_user(self.bob).get('/api/bootstrap/')
+        erin = User.objects.create(username='erin', email='erin@a.com', organization=self.org)
+        users = self.as_user(self.bob).get('/api/bootstrap/').json()['users']['results']
+        self.assertIn(erin.id, [user['id'] for user in users])
+
+    def test_requires_a_valid_user(self):
+        self.client.credentials()
+        self.assertEqual(self.client.get('/api/bootstrap/').status_code, 400)
+        self.client.credentials(HTTP_X_USER_ID='999999')
+        self.assertEqual(self.client.get('/api/bootstrap/').status_code, 404)
+
+
+class FastSerializationTests(KudosTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.eve = User.objects.create(username='ève 🎉', email='eve@a.com', organization=self.org)
+        for sender, receiver, message in [
+            (self.alice, self.bob, 'Plain thanks'),
+            (self.eve, self.bob, 'Line\u2028and paragraph\u2029separators'),
+            (self.bob, self.eve, 'Quotes " and \\ backslash </script> ü 漢字 \x07'),
+        ]:
+            Kudo.objects.create(sender=sender, receiver=receiver, message=message)
+
+    def assertRendersIdentically(self, expected_data, fast_data):
+        expected = JSONRenderer().render(expected_data)
+        self.assertEqual(JSONRenderer().render(fast_data), expected)
+        self.assertEqual(OrJSONRenderer().render(fast_data), expected)
+        self.assertEqual(OrJSONRenderer().render(expected_data), expected)
+
+    def test_kudo_rows_match_serializer(self):
+        queryset = Kudo.objects.order_by('-created_at', '-id')
+        self.assertRendersIdentically(
+            KudoSerializer(queryset.select_related('sender', 'receiver'), many=True).data,
+            serialize_kudo_rows(kudo_values(queryset)),
+        )
+
+    def test_user_rows_match_serializer(self):
+        queryset = User.objects.order_by('username', 'id')
+        self.assertRendersIdentically(
+            UserSimpleSerializer(queryset.select_related('organization'), many=True).data,
+            list(user_simple_values(queryset)),
+        )
+
+    def test_renderer_matches_json_renderer(self):
+        data = {
+            'when': timezone.now(), 'offset': datetime(2024, 5, 1, 12, 30, tzinfo=timezone.get_fixed_timezone(120)),
+            'day': date(2024, 5, 1), 'amount': Decimal('1.50'), 'uuid': uuid.UUID(int=7), 'lazy': gettext_lazy('Hi'),
+            'numbers': [0, -1, 2 ** 63 - 1, 0.6667, 0.0, True, None], 1: 'int key', 'text': 'a\u2028b\u2029c "é"',
+        }
+        self.assertEqual(OrJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(OrJSONRenderer().render({'big': 2 ** 70}), JSONRenderer().render({'big': 2 ** 70}))
+        indented = 'application/json; indent=2'
+        self.assertEqual(OrJSONRenderer().render(data, indented), JSONRenderer().render(data, indented))
+
+    def test_endpoint_pages_match_serializer_output(self):
+        response = self.as_user(self.bob).get('/api/kudos/received/')
+        expected = KudoSerializer(
+            Kudo.objects.filter(receiver=self.bob).select_related('sender', 'receiver').order_by('-created_at', '-id'),
+            many=True,
+        ).data
+        self.assertEqual(response.content, JSONRenderer().render(
+            {'next': None, 'previous': None, 'results': expected}
+        ))
+
+
+# shard_1 is only configured when listed in KUDOS_SHARDS, and the runner sets up every alias tests name
+SHARD_DATABASES = {'default', 'shard_1'} & set(settings.DATABASES)
+
+
+@skipUnless('shard_1' in SHARD_DATABASES, 'Needs the shard_1 database: run with KUDOS_SHARDS=default,shard_1')
+@skipUnless(connection.vendor == 'sqlite', 'Search assertions need the SQLite FTS5 index')
+@override_settings(KUDOS_SHARDS=['default', 'shard_1'])
+class OrganizationShardingTests(KudosTestMixin, TestCase):
+    databases = SHARD_DATABASES
+
+    def setUp(self):
+        # Ids are reused after each test's rollback, so cached placements would go stale
+        sharding._placements.clear()
+        super().setUp()
+        self.move(self.org, 'shard_1')
+        self.move(self.other_org, 'default')
+
+    def move(self, organization, database):
+        call_command('rebalance_organization', str(organization.id), database, '--fence', '0', stdout=StringIO())
+
+    def test_new_organizations_are_placed_and_replicated(self):
+        org = Organization.objects.create(name='Company C')
+        erin = User.objects.create(username='erin', email='erin@c.com', organization=org)
+
+        database = OrganizationShard.objects.get(organization=org).database
+        self.assertEqual(database, sharding.hash_shard(org.id))
+        self.assertEqual(erin.shard, database)
+        if database != 'default':
+            self.assertTrue(User.objects.using(database).filter(pk=erin.pk, organization_id=org.id).exists())
+
+            erin.delete()
+            self.assertFalse(User.objects.using(database).filter(pk=erin.pk).exists())
+
+    def test_writes_and_reads_use_the_organization_shard(self):
+        self.assertEqual(self.give_kudo(self.alice, self.bob, 'Shipped the deploy').status_code, 201)
+        self.assertEqual(self.as_user(self.alice).post('/api/kudos/batch/', [
+            {'receiver': self.carol.id, 'message': 'Batch thanks'},
+        ], format='json').status_code, 201)
+
+        self.assertEqual(Kudo.objects.using('shard_1').count(), 2)
+        self.assertFalse(Kudo.objects.using('default').exists())
+        self.assertEqual(self.alice.get_remaining_kudos(), WEEKLY_KUDOS_LIMIT - 2)
+        self.assertEqual(self.as_user(self.alice).get('/api/users/me/').data['remaining_kudos'], WEEKLY_KUDOS_LIMIT - 2)
+
+        received = self.as_user(self.bob).get('/api/kudos/received/').data['results']
+        self.assertEqual([(kudo['sender_username'], kudo['message']) for kudo in received],
+                         [('alice', 'Shipped the deploy')])
+        found = self.as_user(self.bob).get('/api/kudos/search/', {'q': 'deploy'}).data['results']
+        self.assertEqual([kudo['message'] for kudo in found], ['Shipped the deploy'])
+        leaderboard = self.as_user(self.alice).get(f'/api/organizations/{self.org.id}/leaderboard/').data
+        self.assertEqual(leaderboard['top_senders'][0]['count'], 2)
+        self.assertEqual(leaderboard['participation']['members'], 3)
+
+    def test_replicas_keep_created_at(self):
+        joined = timezone.now() - timedelta(days=30)
+        User.objects.filter(pk=self.bob.pk).update(created_at=joined)
+        sharding.replicate([User.objects.get(pk=self.bob.pk)])
+
+        self.assertEqual(User.objects.using('shard_1').get(pk=self.bob.pk).created_at, joined)
+        self.assertTrue(User._meta.get_field('created_at').auto_now_add)
+
+    def test_rebalance_moves_kudos_and_counters(self):
+        self.give_kudo(self.alice, self.bob, 'First')
+        self.give_kudo(self.bob, self.carol, 'Second')
+        before = self.as_user(self.carol).get('/api/kudos/received/').data['results']
+
+        self.move(self.org, 'default')
+
+        self.assertEqual(sharding.db_for_organization(self.org.id), 'default')
+        self.assertFalse(Kudo.objects.using('shard_1').exists())
+        self.assertFalse(User.objects.using('shard_1').exists())
+        self.assertEqual(sorted(Kudo.objects.values_list('message', flat=True)), ['First', 'Second'])
+        self.assertEqual(self.bob.get_remaining_kudos(), WEEKLY_KUDOS_LIMIT - 1)
+        self.assertEqual(
+            sorted(WeeklyActivity.objects.values_list('user__username', 'sent', 'received')),
+            [('alice', 1, 0), ('bob', 1, 1), ('carol', 0, 1)]
+        )
+        after = self.as_user(self.carol).get('/api/kudos/received/').data['results']
+        self.assertEqual([kudo['message'] for kudo in after], [kudo['message'] for kudo in before])
+
+    def test_rebalance_keeps_writes_made_during_the_fence(self):
+        self.give_kudo(self.alice, self.bob, 'Before')
+
+        def writes_during_fence(seconds):
+            # This process already follows the new placement...
+            self.assertEqual(self.give_kudo(self.alice, self.carol, 'On the target').status_code, 201)
+            # ...while another one still has shard_1 cached
+            with transaction.atomic(using='shard_1'):
+                self.assertTrue(WeeklyQuota.reserve(self.bob, using='shard_1'))
+                Kudo.objects.using('shard_1').create(sender=self.bob, receiver=self.alice, message='Stale')
+                WeeklyActivity.record(self.org.id, sent={self.bob.id: 1}, received={self.alice.id: 1}, using='shard_1')
+
+        with mock.patch('kudos_app.management.commands.rebalance_organization.time.sleep',
+                        side_effect=writes_during_fence) as sleep:
+            call_command('rebalance_organization', str(self.org.id), 'default', '--fence', '7', stdout=StringIO())
+
+        sleep.assert_called_once_with(7)
+        self.assertFalse(Kudo.objects.using('shard_1').exists())
+        self.assertEqual(sorted(Kudo.objects.values_list('message', flat=True)), ['Before', 'On the target', 'Stale'])
+        self.assertEqual(self.alice.get_remaining_kudos(), WEEKLY_KUDOS_LIMIT - 2)
+        self.assertEqual(self.bob.get_remaining_kudos(), WEEKLY_KUDOS_LIMIT - 1)
+        self.assertEqual(
+            sorted(WeeklyActivity.objects.values_list('user__username', 'sent', 'received')),
+            [('alice', 2, 1), ('bob', 1, 1), ('carol', 0, 1)]
+        )
+
+    def test_imported_users_are_replicated(self):
+        rows = [(2, {'username': 'erin', 'email': 'erin@a.com', 'organization': 'Company A'}),
+                (3, {'username': 'frank', 'email': 'frank@c.com', 'organization': 'Company C'})]
+        with importer.DirectoryImport() as sync:
+            list(sync.run(rows))
+
+        for user in User.objects.filter(username__in=['erin', 'frank']):
+            self.assertTrue(User.objects.using(user.shard).filter(pk=user.pk).exists())
+        self.assertTrue(User.objects.using('shard_1').filter(username='erin').exists())
+
+    def test_rebuild_commands_cover_every_shard(self):
+        self.give_kudo(self.alice, self.bob)
+        WeeklyQuota.objects.using('shard_1').all().delete()
+
+        call_command('rebuild_quota_ledger', stdout=StringIO())
+        self.assertEqual(self.alice.get_remaining_kudos(), WEEKLY_KUDOS_LIMIT - 1)
+
+
+class DirectoryImportTests(KudosTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def run_import(self, name, content, *args):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, name)
+            with open(path, 'w') as file:
+                file.write(content)
+            out, err = StringIO(), StringIO()
+            call_command('import_directory', path, *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_creates_and_updates_in_chunks(self):
+        self.assertEqual(identity.get_user(self.alice.id).email, 'alice@a.com')  # Now cached
+        next_id = self.dave.id + 1
+        self.assertIsNone(identity.get_user(next_id))  # Cached as unknown
+        out, err = self.run_import('users.csv', (
+            'username,email,organization\n'
+            'alice,alice@new.com,Company A\n'
+            'bob,bob@a.com,Company A\n'
+            'erin,erin@a.com,\n'
+            'frank,frank@c.com,Company C\n'
+            'grace,not-an-email,Company C\n'
+        ), '--organization', 'Company A', '--chunk-size', '2')
+
+        self.assertIn('4 rows: 2 created, 1 updated, 1 unchanged, 0 skipped', out)  # Progress after the second chunk
+        self.assertIn('Imported 5 rows', out)
+        self.assertIn('2 users created, 1 updated, 1 unchanged, 1 skipped, 0 deactivated, 1 organizations created', out)
+        self.assertIn("line 6: invalid email 'not-an-email'", err)
+        self.assertEqual(identity.get_user(self.alice.id).email, 'alice@new.com')
+        self.assertEqual(User.objects.get(username='erin').organization, self.org)
+        self.assertEqual(identity.get_user(next_id).username, 'erin')
+
+        self.assertEqual(User.objects.get(username='frank').organization.name, 'Company C')
+
+    def test_ndjson_and_unknown_formats(self):
+        out, _ = self.run_import('users.ndjson', (
+            '{"username": "erin", "email": "erin@b.com", "organization": "Company B"}\n'
+            '\n'
+            '{"username": "dave", "email": "dave@b.com", "organization": "Company B"}\n'
+        ))
+        self.assertIn('1 users created, 0 updated, 1 unchanged', out)
+        with self.assertRaisesMessage(CommandError, 'Cannot tell the format'):
+            self.run_import('users.txt', '')
+
+    def test_deactivate_missing_users(self):
+        content = 'username,email\nalice,alice@a.com\nbob,bob@a.com\n'
+        out, _ = self.run_import('users.csv', content, '--organization', 'Company A', '--deactivate-missing')
+        self.assertIn('1 deactivated', out)
+        self.assertEqual(
+            set(User.objects.filter(is_active=False).values_list('username', flat=True)), {'carol'}
+        )  # dave is in another organization
+
+        self.assertEqual(self.as_user(self.carol).get('/api/users/me/').status_code, 404)
+        members = self.as_user(self.alice).get('/api/users/').data['results']
+        self.assertEqual([user['username'] for user in members], ['bob'])
+        self.assertEqual(self.give_kudo(self.alice, self.carol).status_code, 400)
+        leaderboard = self.as_user(self.alice).get(f'/api/organizations/{self.org.id}/leaderboard/').data
+        self.assertEqual(leaderboard['participation']['members'], 2)
+
+        self.run_import('users.csv', content + 'carol,carol@a.com\n', '--organization', 'Company A')
+        self.assertTrue(User.objects.get(pk=self.carol.pk).is_active)
+
+    def test_skipped_rows_block_deactivation(self):
+        _, err = self.run_import('users.csv', 'username,email\nalice,alice@a.com\nbob,\n',
+                                 '--organization', 'Company A', '--deactivate-missing')
+        self.assertIn('Not deactivating anyone', err)
+        self.assertFalse(User.objects.filter(is_active=False).exists())
+
+
+class GroupCommitTests(KudosTestMixin, TestCase):
+
+    def test_batch_admits_each_sender_up_to_quota(self):
+        WeeklyQuota.reserve(self.carol, count=2)
+        batch = [group_commit.PendingKudo(Kudo(sender=sender, receiver=receiver, message='Burst'))
+                 for sender, receiver in [(self.alice, self.bob)] * 4 + [(self.carol, self.bob)] * 2]
+
+        group_commit.writer.write(batch)
+
+        self.assertTrue(all(pending.done.is_set() for pending in batch))
+        outcomes = [type(pending.error).__name__ if pending.error else pending.kudo.pk is not None for pending in batch]
+        self.assertEqual(outcomes, [True, True, True, 'QuotaExceeded', True, 'QuotaExceeded'])
+        self.assertEqual(Kudo.objects.count(), 4)
+        self.assertEqual((self.alice.get_remaining_kudos(), self.carol.get_remaining_kudos()), (0, 0))
+        self.assertEqual(WeeklyActivity.objects.get(user=self.bob).received, 4)
+
+    def test_failed_batch_reports_the_error_to_every_request(self):
+        batch = [group_commit.PendingKudo(Kudo(sender=self.alice, receiver=self.bob, message='Burst'))]
+        with mock.patch.object(Kudo.objects, 'using', side_effect=OperationalError('database is locked')):
+            group_commit.writer.write(batch)
+        self.assertIsInstance(batch[0].error, OperationalError)
+        self.assertEqual(self.alice.get_remaining_kudos(), WEEKLY_KUDOS_LIMIT)
+
+    @override_settings(KUDOS_GROUP_COMMIT=True)
+    def test_view_returns_each_requests_outcome(self):
+        # The writer thread cannot see this test's uncommitted rows, so write in-line
+        def submit(kudo):
+            pending = group_commit.PendingKudo(kudo)
+            group_commit.writer.write([pending])
+            if pending.error:
+                raise pending.error
+            return kudo
+
+        with mock.patch.object(group_commit.writer, 'submit', side_effect=submit):
+            responses = [self.give_kudo(self.alice, self.bob) for _ in range(WEEKLY_KUDOS_LIMIT + 1)]
+        self.assertEqual([response.status_code for response in responses], [201] * WEEKLY_KUDOS_LIMIT + [400])
+        self.assertEqual(responses[0].data, {'receiver': self.bob.id, 'message': 'Great work!'})
+        self.assertEqual(Kudo.objects.filter(sender=self.alice).count(), WEEKLY_KUDOS_LIMIT)
+
+    def test_submit_takes_the_kudo_back_from_a_stalled_writer(self):
+        writer = group_commit.GroupCommitWriter(timeout=0.01)
+        with mock.patch.object(writer, '_run'):  # The thread exits at once and never reads the queue
+            with self.assertRaises(group_commit.WriterUnavailable):
+                writer.submit(Kudo(sender=self.alice, receiver=self.bob, message='Stalled'))
+
+        # A writer reaching it later skips it, so the request's own write is the only one
+        writer.write([writer._queue.get_nowait()])
+        self.assertFalse(Kudo.objects.exists())
+
+    def test_submit_gives_up_when_the_writer_dies_mid_batch(self):
+        writer = group_commit.GroupCommitWriter(timeout=0.01)
+        with mock.patch.object(writer, '_run', side_effect=lambda: writer._queue.get().claim()):
+            with self.assertRaises(group_commit.WriteTimeout):
+                writer.submit(Kudo(sender=self.alice, receiver=self.bob, message='Lost'))
+
+    @override_settings(KUDOS_GROUP_COMMIT=True)
+    def test_view_falls_back_or_answers_503(self):
+        with mock.patch.object(group_commit.writer, 'submit', side_effect=group_commit.WriterUnavailable):
+            self.assertEqual(self.give_kudo(self.alice, self.bob).status_code, 201)
+        self.assertEqual(Kudo.objects.filter(sender=self.alice).count(), 1)
+
+        with mock.patch.object(group_commit.writer, 'submit', side_effect=group_commit.WriteTimeout):
+            self.assertEqual(self.give_kudo(self.alice, self.bob).status_code, 503)
+
+
+class AdminChangelistTests(KudosTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        admin_user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(admin_user)
+        self.url = '/admin/kudos_app/kudo/'
+
+    def changelist_queries(self, kudos):
+        Kudo.objects.bulk_create([Kudo(sender=self.alice, receiver=self.bob, message='Thanks')] * kudos)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, {'q': 'bob'})
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        few = self.changelist_queries(2)
+        self.assertEqual(self.changelist_queries(40), few)
+
+    def test_bare_changelist_opens_on_current_month(self):
+        today = timezone.localdate()
+        response = self.client.get(self.url)
+        self.assertRedirects(response, f'{self.url}?created_at__year={today.year}&created_at__month={today.month}')
+
+    @override_settings(KUDOS_ADMIN_COUNT_LIMIT=3)
+    def test_count_is_capped(self):
+        Kudo.objects.bulk_create([Kudo(sender=self.alice, receiver=self.bob, message='Thanks')] * 5)
+        response = self.client.get(self.url, {'o': '4'})
+        self.assertEqual(response.context['cl'].result_count, 3)
+        self.assertIsNone(response.context['cl'].full_result_count)
+
+    def test_organization_filter_and_search(self):
+        Kudo.objects.create(sender=self.alice, receiver=self.bob, message='Shipped the release')
+        Kudo.objects.create(sender=self.dave, receiver=self.dave, message='Fixed the build')
+
+        response = self.client.get(self.url, {'organization': self.other_org.id})
+        self.assertEqual([kudo.sender for kudo in response.context['cl'].result_list], [self.dave])
+
+        for term, sender in (('alic', self.alice), ('build', self.dave)):
+            response = self.client.get(self.url, {'q': term})
+            self.assertEqual([kudo.sender for kudo in response.context['cl'].result_list], [sender])
+
+    def test_user_changelist(self):
+        response = self.client.get('/admin/kudos_app/user/', {'organization__id__exact': self.org.id})
+        self.assertEqual(response.context['cl'].result_count, 3)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'SQLite tuning')
+class SQLiteTuningTests(TransactionTestCase):
+
+    def test_pragmas_applied_to_new_connections(self):
+        with override_settings(KUDOS_SQLITE_PRAGMAS={'cache_size': -1234, 'synchronous': 'normal'}):
+            fresh = connection.copy()
+            try:
+                self.assertEqual(read_pragmas(fresh), {'cache_size': -1234, 'synchronous': 1})
+            finally:
+                fresh.close()
+
+    def test_write_burst_alongside_readers_has_no_lock_errors(self):
+        org = Organization.objects.create(name='Company A')
+        User.objects.bulk_create([
+            User(username=f'user{index}', email=f'user{index}@a.com', organization=org) for index in range(20)
+        ])
+
+        with tempfile.TemporaryDirectory() as directory:
+            # Copy the test database to a real file: WAL and file locking don't apply to in-memory databases
+            path = os.path.join(directory, 'burst.sqlite3')
+            connection.ensure_connection()
+            target = sqlite3.connect(path)
+            connection.connection.backup(target)
+            target.close()
+
+            # Worker threads open their own connections from these settings
+            with mock.patch.dict(connection.settings_dict, NAME=path), \
+                    override_settings(KUDOS_SQLITE_PRAGMAS=PRODUCTION_PRAGMAS):
+                results = bench.run_write_burst_benchmark(readers=6, writers=4, writes_per_writer=10)
+
+            with sqlite3.connect(path) as check:
+                self.assertEqual(check.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+                written = check.execute('SELECT COUNT(*) FROM kudos_app_kudo').fetchone()[0]
+
+        self.assertEqual((results['lock_errors'], results['server_errors']), (0, 0))
+        self.assertEqual(results['writes'], 40)
+        self.assertGreater(results['reads'], 0)
+        self.assertGreater(results['read_rps'], 0)
+        # Every sender is capped by the weekly quota, so some writes are rejected, but none are lost to locking
+        self.assertGreater(written, 0)
+
+    def test_group_commit_burst_writes_every_admitted_kudo(self):
+        org = Organization.objects.create(name='Company A')
+        # Saved one by one so the post_save signals evict identities cached under reused ids
+        for index in range(20):
+            User.objects.create(username=f'user{index}', email=f'user{index}@a.com', organization=org)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'group.sqlite3')
+            connection.ensure_connection()
+            target = sqlite3.connect(path)
+            connection.connection.backup(target)
+            target.close()
+
+            with mock.patch.dict(connection.settings_dict, NAME=path), \
+                    override_settings(KUDOS_SQLITE_PRAGMAS=PRODUCTION_PRAGMAS, KUDOS_GROUP_COMMIT=True):
+                results = bench.run_kudo_burst_benchmark(writers=8)
+
+            with sqlite3.connect(path) as check:
+                written = check.execute('SELECT COUNT(*) FROM kudos_app_kudo').fetchone()[0]
+                used = check.execute('SELECT SUM(used) FROM kudos_app_weeklyquota').fetchone()[0]
+
+        self.assertEqual((results['created'], results['rejected'], results['server_errors']),
+                         (20 * WEEKLY_KUDOS_LIMIT, 0, 0))
+        self.assertEqual((written, used), (20 * WEEKLY_KUDOS_LIMIT, 20 * WEEKLY_KUDOS_LIMIT))
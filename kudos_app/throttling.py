@@ -0,0 +1,120 @@
+"""
+Token-bucket request throttling for the API, enabled with ``KUDOS_THROTTLE``.
+
+Each caller has one bucket per scope, keyed on the ``X-User-ID`` header (or
+the client address when there is none), and each organization has another.
+``KUDOS_THROTTLE_RATES`` gives every (scope, key) pair a refill rate in
+requests per second and a burst size. Kudo creation (``create``) has its own
+budget, separate from every other endpoint (``read``). A request spends one
+token from both its user and organization buckets, or neither.
+
+``ThrottleMiddleware`` checks the buckets in ``process_view``, before the
+view runs, and answers 429 with a ``Retry-After`` header when either is
+empty. The caller's bucket is checked from the header alone. The organization
+comes from the identity cache (see ``identity.py``), which the view would
+consult anyway. A caller that is already over budget is therefore rejected
+without touching the database, even with an unknown id.
+
+Buckets live in a bounded per-process LRU with O(1) checks. Each worker
+process enforces the budget independently, so the effective limit scales
+with the number of workers.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import JsonResponse
+from .identity import get_user, parse_user_id
+
+
+# Views spending the ``create`` budget; every other API view spends ``read``
+CREATE_VIEWS = {'kudo-create', 'kudo-batch-create'}
+
+
+class TokenBuckets:
+    """Thread-safe, bounded map of ``key -> [tokens, updated_at]``; idle buckets are evicted first"""
+
+    def __init__(self, maxsize=10000, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.clock = clock
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, limits, consume=True):
+        """
+        Spend one token from every bucket in ``limits`` (``[(key, rate, burst), ...]``), all or none.
+
+        Returns 0 when the tokens were spent (or, with ``consume=False``, are
+        available), otherwise the seconds until every bucket holds a token again.
+        """
+        now = self.clock()
+        with self._lock:
+            buckets = [(self._refill(key, rate, burst, now), rate) for key, rate, burst in limits]
+            wait = max((1 - bucket[0]) / rate for bucket, rate in buckets)
+            if wait > 0:
+                return wait
+            if consume:
+                for bucket, _ in buckets:
+                    bucket[0] -= 1
+            return 0
+
+    def _refill(self, key, rate, burst, now):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            # An evicted bucket comes back full, which only ever errs on the side of admitting
+            bucket = self._buckets[key] = [burst, now]
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        else:
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+buckets = TokenBuckets(maxsize=getattr(settings, 'KUDOS_THROTTLE_MAX_BUCKETS', 10000))
+
+
+class ThrottleMiddleware:
+    """Answers 429 with Retry-After once a caller or its organization runs out of tokens; removed unless KUDOS_THROTTLE"""
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'KUDOS_THROTTLE', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.rates = settings.KUDOS_THROTTLE_RATES
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not view_func.__module__.startswith('kudos_app.'):
+            return None
+        scope = 'create' if request.resolver_match.url_name in CREATE_VIEWS else 'read'
+        rates = self.rates[scope]
+
+        user_id = parse_user_id(request.headers.get('X-User-ID'))
+        if user_id is None:
+            caller = (scope, 'address', request.META.get('REMOTE_ADDR'))
+        else:
+            caller = (scope, 'user', user_id)
+        limits = [(caller, *rates['user'])]
+
+        # Reject callers that are already over budget before resolving who they are
+        wait = buckets.take(limits, consume=False)
+        if not wait:
+            user = get_user(user_id) if user_id is not None else None
+            if user is not None:
+                limits.append(((scope, 'organization', user.organization_id), *rates['organization']))
+            wait = buckets.take(limits)
+        if wait:
+            response = JsonResponse({'error': 'Too many requests'}, status=429)
+            response['Retry-After'] = str(math.ceil(wait))
+            return response
+        return None
@@ -1,14 +1,39 @@
-from django.urls import path
-from . import views
-
-urlpatterns = [
-    # User endpoints
-    path('users/me/', views.current_user, name='current-user'),
-    path('users/', views.UserListView.as_view(), name='user-list'),
-    path('organizations/', views.organizations_list, name='organizations-list'),
-    path('organizations/<int:org_id>/users/', views.users_by_organization, name='users-by-organization'),
+from django.conf import settings
+from django.urls import include, path
+from . import async_views, views
+
+
+def read_urlpatterns(use_async):
+    """Read endpoints, served either by the DRF views or by their native async counterparts"""
+    return [
+        path('users/me/', async_views.current_user if use_async else views.current_user, name='current-user'),
+        path('users/', async_views.user_list if use_async else views.UserListView.as_view(), name='user-list'),
+        path('organizations/', async_views.organizations_list if use_async else views.organizations_list,
+             name='organizations-list'),
+        path('organizations/<int:org_id>/users/',
+             async_views.users_by_organization if use_async else views.users_by_organization,
+             name='users-by-organization'),
+        path('kudos/received/', async_views.kudos_received if use_async else views.KudosReceivedView.as_view(),
+             name='kudos-received'),
+    ]
+
+
+urlpatterns = read_urlpatterns(getattr(settings, 'KUDOS_ASYNC_READS', False)) + [
+    # Initial page load: current user, directory and first page of received kudos in one request
+    path('bootstrap/', views.bootstrap, name='bootstrap'),
     
     # Kudo endpoints
     path('kudos/', views.KudoCreateView.as_view(), name='kudo-create'),
-    path('kudos/received/', views.KudosReceivedView.as_view(), name='kudos-received'),
+    path('kudos/batch/', views.KudoBatchCreateView.as_view(), name='kudo-batch-create'),
+    path('kudos/search/', views.KudoSearchView.as_view(), name='kudo-search'),
+    path('kudos/stream/', async_views.kudos_stream, name='kudo-stream'),
+    path('organizations/<int:org_id>/kudos/export/', views.export_kudos, name='kudos-export'),
+    path('organizations/<int:org_id>/leaderboard/', views.organization_leaderboard, name='organization-leaderboard'),
+    path('organizations/<int:org_id>/graph-stats/', views.organization_graph_stats, name='organization-graph-stats'),
+    
+    # Async read endpoints, always available for ASGI deployments and benchmarking
+    path('async/', include((read_urlpatterns(True), 'async'))),
+    
+    # Debug endpoints
+    path('debug/stats/', views.instrumentation_stats, name='instrumentation-stats'),
 ]
@@ -1,11 +1,22 @@
+from collections import Counter
 from rest_framework import generics, status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
+from django.conf import settings
+from django.db import transaction
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from .models import Organization, User, Kudo
+from django.urls import reverse
+from django.utils.dateparse import parse_date
+from django.views.decorators.http import require_GET
+from . import directory, events, exports, graph, group_commit, instrumentation, search
+from .identity import parse_user_id, resolve_request_user
+from .models import Organization, User, Kudo, ArchivedKudo, WeeklyActivity, WeeklyQuota, get_week_start
+from .pagination import KudoCursorPagination, UserCursorPagination
 from .serializers import (
     OrganizationSerializer, UserSerializer, UserSimpleSerializer, 
-    KudoSerializer, KudoCreateSerializer
+    KudoSerializer, KudoCreateSerializer, KudoBatchItemSerializer, quota_exhausted,
+    kudo_values, serialize_kudo_rows, user_simple_values
 )
 
 
@@ -13,18 +24,8 @@ class SimpleAuthenticationMixin:
     """Simple authentication mixin that gets user ID from headers"""
     
     def dispatch(self, request, *args, **kwargs):
-        # Get user ID from X-User-ID header (simple authentication)
-        user_id = request.headers.get('X-User-ID')
-        if user_id:
-            try:
-                request.user_id = int(user_id)
-                request.current_user = User.objects.get(id=user_id)
-            except (ValueError, User.DoesNotExist):
-                request.user_id = None
-                request.current_user = None
-        else:
-            request.user_id = None
-            request.current_user = None
+        # Resolve the X-User-ID header (simple authentication) through the cached identity resolver
+        request.user_id, request.current_user = resolve_request_user(request)
         
         return super().dispatch(request, *args, **kwargs)
 
@@ -32,21 +33,72 @@ class SimpleAuthenticationMixin:
 @api_view(['GET'])
 def current_user(request):
     """Get current user information including remaining kudos"""
-    user_id = request.headers.get('X-User-ID')
-    if not user_id:
+    if not request.headers.get('X-User-ID'):
         return Response({'error': 'X-User-ID header required'}, status=status.HTTP_400_BAD_REQUEST)
     
-    try:
-        user = User.objects.get(id=int(user_id))
-        serializer = UserSerializer(user)
-        return Response(serializer.data)
-    except (ValueError, User.DoesNotExist):
+    user_id, user = resolve_request_user(request)
+    if user is None:
         return Response({'error': 'Invalid user ID'}, status=status.HTTP_404_NOT_FOUND)
+    
+    serializer = UserSerializer(user)
+    return Response(serializer.data)
+
+
+@api_view(['GET'])
+def bootstrap(request):
+    """
+    Everything the frontend loads at startup: the current user with their remaining kudos,
+    the first page of their organization's directory and their first page of received kudos.
+
+    One identity lookup serves all three. The directory page is cached per organization
+    version and caller (see directory.cached_data), so a warm request costs the quota read
+    and the kudos page. Both pages link to their own endpoints for the rest.
+    """
+    if not request.headers.get('X-User-ID'):
+        return Response({'error': 'X-User-ID header required'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    _, user = resolve_request_user(request)
+    if user is None:
+        return Response({'error': 'Invalid user ID'}, status=status.HTTP_404_NOT_FOUND)
+    
+    using = user.shard
+    remaining_kudos = WeeklyQuota.remaining_for(user.id, using=using)
+    
+    # Same page as /users/, excluding the caller
+    members_paginator = UserCursorPagination()
+    members_paginator.link_url = request.build_absolute_uri(reverse('user-list'))
+    
+    def build_directory():
+        users = User.objects.filter(
+            organization_id=user.organization_id, is_active=True
+        ).exclude(id=user.id)
+        page = members_paginator.paginate_queryset(user_simple_values(users), request)
+        return members_paginator.get_paginated_response(page).data
+    
+    members = directory.cached_data(
+        user.organization_id, f'members:{user.id}:{members_paginator.get_page_size(request)}', build_directory
+    )
+    
+    # Same page as /kudos/received/; its links point there for the following pages
+    paginator = KudoCursorPagination()
+    paginator.link_url = request.build_absolute_uri(reverse('kudos-received'))
+    page = paginator.paginate_querysets(
+        [kudo_values(Kudo.objects.using(using).filter(receiver=user)),
+         kudo_values(ArchivedKudo.objects.using(using).filter(receiver=user))],
+        request
+    )
+    
+    return Response({
+        'user': UserSerializer(user, context={'remaining_kudos': remaining_kudos}).data,
+        'users': members,
+        'kudos_received': paginator.get_paginated_response(serialize_kudo_rows(page)).data,
+    })
 
 
 class UserListView(SimpleAuthenticationMixin, generics.ListAPIView):
     """List all users in the same organization as the current user"""
     serializer_class = UserSimpleSerializer
+    pagination_class = UserCursorPagination
     
     def get_queryset(self):
         if not self.request.current_user:
@@ -54,8 +106,25 @@ class UserListView(SimpleAuthenticationMixin, generics.ListAPIView):
         
         # Return users in the same organization, excluding the current user
         return User.objects.filter(
-            organization=self.request.current_user.organization
-        ).exclude(id=self.request.current_user.id).order_by('username')
+            organization_id=self.request.current_user.organization_id, is_active=True
+        ).exclude(id=self.request.current_user.id).select_related('organization')
+    
+    def list(self, request, *args, **kwargs):
+        def build():
+            # Plain .values() rows in UserSimpleSerializer's shape (see serializers.user_simple_values)
+            page = self.paginate_queryset(user_simple_values(self.get_queryset()))
+            return self.get_paginated_response(page)
+        
+        if not request.current_user:
+            return build()
+        
+        # The page excludes the caller, so each caller gets their own snapshot
+        return directory.cached_response(
+            request,
+            request.current_user.organization_id,
+            build,
+            vary=request.current_user.id
+        )
 
 
 class KudoCreateView(SimpleAuthenticationMixin, generics.CreateAPIView):
@@ -66,7 +135,21 @@ class KudoCreateView(SimpleAuthenticationMixin, generics.CreateAPIView):
         if not self.request.current_user:
             raise ValueError("Authentication required")
         
-        serializer.save(sender=self.request.current_user)
+        if group_commit.is_enabled():
+            # Validated here; the shared writer inserts it with others in one transaction and publishes it
+            kudo = Kudo(sender=self.request.current_user, **serializer.validated_data)
+            try:
+                serializer.instance = group_commit.writer.submit(kudo)
+            except group_commit.QuotaExceeded:
+                raise quota_exhausted()
+            except group_commit.WriterUnavailable:
+                pass  # Taken back unwritten: commit it on its own below
+            else:
+                return
+        
+        kudo = serializer.save(sender=self.request.current_user)
+        # Push to the receiver's open /kudos/stream/ connections once the kudo is durable
+        transaction.on_commit(lambda: events.broker.publish_kudos([kudo]), using=kudo._state.db)
     
     def create(self, request, *args, **kwargs):
         if not request.current_user:
@@ -75,33 +158,302 @@ class KudoCreateView(SimpleAuthenticationMixin, generics.CreateAPIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        return super().create(request, *args, **kwargs)
+        try:
+            return super().create(request, *args, **kwargs)
+        except group_commit.WriteTimeout:
+            return Response(
+                {'error': 'Timed out waiting for the kudo to be saved; it may still appear'},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+
+
+class KudoBatchCreateView(SimpleAuthenticationMixin, generics.GenericAPIView):
+    """Create several kudos in one request with a constant number of queries"""
+    serializer_class = KudoBatchItemSerializer
+    max_batch_size = 50
+    
+    def post(self, request, *args, **kwargs):
+        if not request.current_user:
+            return Response(
+                {'error': 'X-User-ID header required'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        items = request.data
+        if not isinstance(items, list) or not items:
+            return Response({'error': 'Expected a non-empty list of kudos'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > self.max_batch_size:
+            return Response(
+                {'error': f'A batch can contain at most {self.max_batch_size} kudos'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # Load every receiver with a single IN query
+        receiver_ids = {parse_user_id(item.get('receiver')) for item in items if isinstance(item, dict)}
+        receivers = User.objects.filter(is_active=True).only('id', 'username', 'organization_id').in_bulk(receiver_ids - {None})
+        
+        sender = request.current_user
+        results = []
+        pending = []
+        for index, item in enumerate(items):
+            serializer = self.get_serializer(data=item, context={'request': request, 'receivers': receivers})
+            if serializer.is_valid():
+                kudo = Kudo(sender=sender, receiver=serializer.validated_data['receiver'],
+                            message=serializer.validated_data['message'])
+                pending.append(kudo)
+                results.append({'index': index, 'status': 'created', 'kudo': kudo})
+            else:
+                results.append({'index': index, 'status': 'error', 'errors': serializer.errors})
+        
+        if pending:
+            using = sender.shard
+            with transaction.atomic(using=using):
+                # One quota reservation covers the whole batch
+                if not WeeklyQuota.reserve(sender, count=len(pending), using=using):
+                    return Response(
+                        {'error': f'This batch needs {len(pending)} kudos but you have '
+                                  f'{sender.get_remaining_kudos()} remaining this week.'},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+                Kudo.objects.using(using).bulk_create(pending)
+                WeeklyActivity.record(
+                    sender.organization_id,
+                    sent={sender.id: len(pending)},
+                    received=Counter(kudo.receiver_id for kudo in pending),
+                    using=using
+                )
+                transaction.on_commit(lambda: events.broker.publish_kudos(pending), using=using)
+            
+            for result in results:
+                if result['status'] == 'created':
+                    result['kudo'] = KudoSerializer(result['kudo']).data
+        
+        return Response(
+            {'created': len(pending), 'results': results},
+            status=status.HTTP_201_CREATED if pending else status.HTTP_400_BAD_REQUEST
+        )
 
 
 class KudosReceivedView(SimpleAuthenticationMixin, generics.ListAPIView):
     """List all kudos received by the current user"""
     serializer_class = KudoSerializer
+    pagination_class = KudoCursorPagination
     
     def get_queryset(self):
         if not self.request.current_user:
             return Kudo.objects.none()
         
-        return Kudo.objects.filter(receiver=self.request.current_user).select_related('sender')
+        user = self.request.current_user
+        return Kudo.objects.using(user.shard).filter(receiver=user).select_related('sender', 'receiver')
+    
+    def get_archived_queryset(self):
+        if not self.request.current_user:
+            return ArchivedKudo.objects.none()
+        
+        user = self.request.current_user
+        return ArchivedKudo.objects.using(user.shard).filter(receiver=user)
+    
+    def list(self, request, *args, **kwargs):
+        # Plain .values() rows serialized like KudoSerializer (see serializers.serialize_kudo_rows).
+        # The archive is only read once the page runs past the hot kudos (see kudos_app/archive.py).
+        page = self.paginator.paginate_querysets(
+            [kudo_values(self.get_queryset()), kudo_values(self.get_archived_queryset())], request, view=self
+        )
+        return self.get_paginated_response(serialize_kudo_rows(page))
+
+
+class KudoSearchView(SimpleAuthenticationMixin, generics.GenericAPIView):
+    """Full-text search over kudo messages sent within the current user's organization"""
+    serializer_class = KudoSerializer
+    
+    def get(self, request):
+        if not request.current_user:
+            return Response({'error': 'Invalid user ID'}, status=status.HTTP_404_NOT_FOUND)
+        
+        query = request.query_params.get('q', '')
+        if not search.fts_query(query):
+            return Response({'error': 'Search query q is required'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        using = request.current_user.shard
+        paginator = search.KudoSearchPagination()
+        matches = paginator.paginate_search(request.current_user.organization_id, query, request, using=using)
+        kudos = Kudo.objects.using(using).select_related('sender', 'receiver').in_bulk(
+            [match['id'] for match in matches]
+        )
+        serializer = self.get_serializer([kudos[match['id']] for match in matches], many=True)
+        return paginator.get_paginated_response(serializer.data)
 
 
 @api_view(['GET'])
 def organizations_list(request):
-    organizations = Organization.objects.all()
-    serializer = OrganizationSerializer(organizations, many=True)
-    return Response(serializer.data)
+    def build():
+        organizations = Organization.objects.all()
+        serializer = OrganizationSerializer(organizations, many=True)
+        return Response(serializer.data)
+    
+    return directory.cached_response(request, directory.ORGANIZATIONS_SCOPE, build)
 
 
 @api_view(['GET'])
 def users_by_organization(request, org_id):
+    def build():
+        try:
+            organization = Organization.objects.get(id=org_id)
+        except Organization.DoesNotExist:
+            return Response({'error': 'Organization not found'}, status=status.HTTP_404_NOT_FOUND)
+        
+        users = User.objects.filter(organization=organization, is_active=True)
+        paginator = UserCursorPagination()
+        page = paginator.paginate_queryset(user_simple_values(users), request)
+        return paginator.get_paginated_response(page)
+    
+    return directory.cached_response(request, org_id, build)
+
+
+@api_view(['GET'])
+def organization_leaderboard(request, org_id):
+    """Top receivers, top senders and participation for one organization and week"""
+    _, user = resolve_request_user(request)
+    if user is None:
+        return Response({'error': 'X-User-ID header required'}, status=status.HTTP_400_BAD_REQUEST)
+    if user.organization_id != org_id:
+        return Response({'error': 'You can only view your own organization'}, status=status.HTTP_403_FORBIDDEN)
+    
+    week = request.query_params.get('week')
+    day = parse_date(week) if week else None
+    if week and day is None:
+        return Response({'error': 'Invalid week; expected YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
+    week_start = get_week_start(day)
+    
     try:
-        organization = Organization.objects.get(id=org_id)
-        users = User.objects.filter(organization=organization).order_by('username')
-        serializer = UserSimpleSerializer(users, many=True)
-        return Response(serializer.data)
-    except Organization.DoesNotExist:
-        return Response({'error': 'Organization not found'}, status=status.HTTP_404_NOT_FOUND)
+        limit = max(1, min(int(request.query_params.get('limit', 10)), 50))
+    except ValueError:
+        return Response({'error': 'Invalid limit'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    scope = WeeklyActivity.objects.using(user.shard).filter(organization_id=org_id, week_start=week_start)
+    
+    def top(field):
+        # Ordered like the (organization, week_start, -field, user) index, so this reads `limit` entries
+        rows = scope.filter(**{f'{field}__gt': 0}).order_by(f'-{field}', 'user_id').values_list(
+            'user_id', 'user__username', field
+        )[:limit]
+        return [{'user_id': user_id, 'username': username, 'count': count} for user_id, username, count in rows]
+    
+    active_senders = scope.filter(sent__gt=0).count()
+    members = User.objects.filter(organization_id=org_id, is_active=True).count()
+    return Response({
+        'organization': org_id,
+        'week_start': week_start,
+        'top_receivers': top('received'),
+        'top_senders': top('sent'),
+        'participation': {
+            'active_senders': active_senders,
+            'members': members,
+            'rate': round(active_senders / members, 4) if members else 0.0,
+        },
+    })
+
+
+@api_view(['GET'])
+def organization_graph_stats(request, org_id):
+    """Recognition-graph metrics (reciprocity, isolated members, islands, connectors) over a window of weeks"""
+    _, user = resolve_request_user(request)
+    if user is None:
+        return Response({'error': 'X-User-ID header required'}, status=status.HTTP_400_BAD_REQUEST)
+    if user.organization_id != org_id:
+        return Response({'error': 'You can only view your own organization'}, status=status.HTTP_403_FORBIDDEN)
+    if graph.np is None:
+        return Response({'error': 'Graph analytics need NumPy installed'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    
+    week = request.query_params.get('week')
+    day = parse_date(week) if week else None
+    if week and day is None:
+        return Response({'error': 'Invalid week; expected YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
+    week_start = get_week_start(day)
+    
+    try:
+        weeks = max(1, min(int(request.query_params.get('weeks', 4)), 52))
+        limit = max(1, min(int(request.query_params.get('limit', 10)), graph.MAX_LIMIT))
+    except ValueError:
+        return Response({'error': 'Invalid weeks or limit'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    stats = graph.organization_stats(org_id, week_start, weeks, using=user.shard)
+    isolated = stats['isolated']['users'][:limit]
+    top_pairs = stats['top_pairs'][:limit]
+    connectors = stats['connectors'][:limit]
+    
+    listed = {*isolated, *(connector['user'] for connector in connectors)}
+    listed.update(pair[side] for pair in top_pairs for side in ('sender', 'receiver'))
+    usernames = dict(User.objects.filter(id__in=listed).values_list('id', 'username'))
+    
+    def member(user_id):
+        return {'user_id': user_id, 'username': usernames.get(user_id)}
+    
+    return Response({
+        'organization': org_id,
+        'week_start': week_start,
+        'weeks': weeks,
+        'members': stats['members'],
+        'kudos': stats['kudos'],
+        'pairs': stats['pairs'],
+        'reciprocity': stats['reciprocity'],
+        'participation': {'senders': stats['senders'], 'receivers': stats['receivers']},
+        'isolated': {'count': stats['isolated']['count'], 'users': [member(user_id) for user_id in isolated]},
+        'islands': stats['islands'],
+        'top_pairs': [
+            {'sender': member(pair['sender']), 'receiver': member(pair['receiver']), 'kudos': pair['kudos']}
+            for pair in top_pairs
+        ],
+        'connectors': [
+            {**member(connector['user']), 'colleagues': connector['colleagues'],
+             'sent': connector['sent'], 'received': connector['received']}
+            for connector in connectors
+        ],
+    })
+
+
+@require_GET
+def export_kudos(request, org_id):
+    """
+    Stream an organization's kudos as NDJSON (default) or CSV.
+    
+    A plain Django view rather than a DRF one: the response is a
+    StreamingHttpResponse, and DRF reserves ?format= for content negotiation.
+    Callers may only export their own organization.
+    """
+    _, user = resolve_request_user(request)
+    if user is None:
+        return JsonResponse({'error': 'X-User-ID header required'}, status=status.HTTP_400_BAD_REQUEST)
+    if user.organization_id != org_id:
+        return JsonResponse({'error': 'You can only export your own organization'}, status=status.HTTP_403_FORBIDDEN)
+    
+    export_format = request.GET.get('format', 'ndjson')
+    if export_format not in exports.EXPORT_FORMATS:
+        return JsonResponse(
+            {'error': f"Unsupported format; choose one of {', '.join(exports.EXPORT_FORMATS)}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        start, end = exports.parse_date_range(request.GET.get('start'), request.GET.get('end'))
+    except ValueError as error:
+        return JsonResponse({'error': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    content_type, encode = exports.EXPORT_FORMATS[export_format]
+    response = StreamingHttpResponse(
+        encode(exports.export_rows(org_id, start, end, using=user.shard)),
+        content_type=f'{content_type}; charset=utf-8'
+    )
+    response['Content-Disposition'] = f'attachment; filename="kudos-org{org_id}.{export_format}"'
+    return response
+
+
+@api_view(['GET'])
+def instrumentation_stats(request):
+    """Rolling per-view latency and SQL statistics from RequestInstrumentationMiddleware (DEBUG only)"""
+    if not settings.DEBUG:
+        return Response({'error': 'Not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    return Response({
+        'enabled': getattr(settings, 'KUDOS_INSTRUMENTATION', False),
+        'views': instrumentation.stats.snapshot(),
+    })
@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -23,9 +24,12 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    'kudos_app.instrumentation.RequestInstrumentationMiddleware',
+    'kudos_app.profiling.RequestProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
+    'kudos_app.throttling.ThrottleMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
@@ -53,12 +57,71 @@ TEMPLATES = [
 WSGI_APPLICATION = 'kudos_backend.wsgi.application'
 
 
+# Organization sharding (see kudos_app/sharding.py). 'default' is also the directory database;
+# with only 'default' listed everything lives there. Each listed alias gets its own SQLite file,
+# e.g. KUDOS_SHARDS=default,shard_1 adds db_shard_1.sqlite3. Migrate each shard with `migrate --database`.
+KUDOS_SHARDS = os.environ.get('KUDOS_SHARDS', 'default').split(',')
+
 DATABASES = {
-    'default': {
+    alias: {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': BASE_DIR / ('db.sqlite3' if alias == 'default' else f'db_{alias}.sqlite3'),
     }
+    for alias in KUDOS_SHARDS
 }
+# With two shards this is:
+# DATABASES = {
+#     'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': BASE_DIR / 'db.sqlite3'},
+#     'shard_1': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': BASE_DIR / 'db_shard_1.sqlite3'},
+# }
+
+DATABASE_ROUTERS = ['kudos_app.routers.OrganizationShardRouter']
+KUDOS_SHARD_DIRECTORY_TTL = 30
+
+# PRAGMAs applied to each new SQLite connection (see kudos_app/sqlite.py); tuned in settings_production
+KUDOS_SQLITE_PRAGMAS = {}
+
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'kudos',
+    }
+}
+
+# Per-process identity cache in front of CACHES (see kudos_app/identity.py)
+KUDOS_IDENTITY_CACHE_SIZE = 1024
+KUDOS_IDENTITY_CACHE_TTL = 60
+# How long an id with no user is remembered as unknown
+KUDOS_IDENTITY_MISS_TTL = 5
+
+# Backstop expiry for versioned directory snapshots (see kudos_app/directory.py)
+KUDOS_DIRECTORY_CACHE_TTL = 300
+
+# Per-request SQL/timing instrumentation with Server-Timing headers (see kudos_app/instrumentation.py).
+# Off by default; stats are served at /api/debug/stats/ when DEBUG is on.
+KUDOS_INSTRUMENTATION = False
+KUDOS_INSTRUMENTATION_SLOWEST = 3
+KUDOS_INSTRUMENTATION_WINDOW = 1000
+
+# Serve the read endpoints with the native async views (kudos_app/async_views.py).
+# Enable when running under ASGI (kudos_backend.asgi); they are always reachable under /api/async/.
+KUDOS_ASYNC_READS = False
+
+# Server-Sent Events stream of received kudos (/api/kudos/stream/, ASGI only; see kudos_app/events.py).
+# Keepalive comments every KEEPALIVE seconds; connections are recycled after MAX_AGE seconds and
+# resume from Last-Event-ID; QUEUE_SIZE bounds the backlog buffered per connection.
+KUDOS_STREAM_KEEPALIVE = 15
+KUDOS_STREAM_MAX_AGE = 300
+KUDOS_STREAM_QUEUE_SIZE = 100
+
+# Group commit for POST /api/kudos/ (see kudos_app/group_commit.py): a writer thread inserts queued kudos
+# in one transaction every DELAY_MS milliseconds or MAX_BATCH kudos. Off by default. A request whose kudo
+# the writer has not picked up within TIMEOUT seconds writes it itself.
+KUDOS_GROUP_COMMIT = False
+KUDOS_GROUP_COMMIT_DELAY_MS = 2
+KUDOS_GROUP_COMMIT_MAX_BATCH = 100
+KUDOS_GROUP_COMMIT_TIMEOUT = 10
 
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -94,8 +157,11 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.AllowAny',
     ],
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        # orjson-backed, byte-identical to rest_framework.renderers.JSONRenderer (see kudos_app/renderers.py)
+        'kudos_app.renderers.OrJSONRenderer',
     ],
+    'DEFAULT_PAGINATION_CLASS': 'kudos_app.pagination.KudoCursorPagination',
+    'PAGE_SIZE': 20,
 }
 
 CORS_ALLOWED_ORIGINS = [
@@ -104,6 +170,10 @@ CORS_ALLOWED_ORIGINS = [
 
 CORS_ALLOW_CREDENTIALS = True
 
+CORS_EXPOSE_HEADERS = [
+    'server-timing',
+]
+
 CORS_ALLOW_HEADERS = [
     'accept',
     'accept-encoding',
@@ -116,3 +186,29 @@ CORS_ALLOW_HEADERS = [
     'x-requested-with',
     'x-user-id',  # Custom header for user authentication
 ]
+
+# Admin changelists count at most this many rows instead of running an exact COUNT(*) (see kudos_app/admin.py)
+KUDOS_ADMIN_COUNT_LIMIT = 10000
+
+# Token-bucket throttling of the API (see kudos_app/throttling.py). Off here, on in settings_production.
+# Rates are (requests per second, burst) per caller and per organization, per process.
+KUDOS_THROTTLE = False
+KUDOS_THROTTLE_RATES = {
+    'read': {'user': (10, 50), 'organization': (200, 1000)},
+    'create': {'user': (1, 10), 'organization': (20, 100)},
+}
+KUDOS_THROTTLE_MAX_BUCKETS = 10000
+
+# On-demand request profiling (see kudos_app/profiling.py). Off by default. When on, requests from
+# KUDOS_PROFILING_USERS are profiled if they send an X-Profile header (cprofile or sample),
+# or at random with probability KUDOS_PROFILING_SAMPLE_RATE. List profiles with manage.py list_profiles.
+KUDOS_PROFILING = False
+KUDOS_PROFILING_USERS = []
+KUDOS_PROFILING_SAMPLE_RATE = 0.0
+KUDOS_PROFILING_INTERVAL_MS = 1
+KUDOS_PROFILING_DIR = BASE_DIR / 'profiles'
+KUDOS_PROFILING_KEEP = 200
+
+# Seconds /organizations/<id>/graph-stats/ results are cached while their window includes the current
+# week; closed windows are cached for a day (see kudos_app/graph.py)
+KUDOS_GRAPH_STATS_TTL = 300
@@ -0,0 +1,42 @@
+"""
+Production profile: ``DJANGO_SETTINGS_MODULE=kudos_backend.settings_production``.
+
+Same as the development settings, but with DEBUG off, persistent database
+connections, SQLite tuned for concurrent readers and writers (see
+kudos_app/sqlite.py) and API throttling (see kudos_app/throttling.py).
+"""
+import os
+
+from .settings import *  # noqa: F401,F403
+from .settings import DATABASES
+
+DEBUG = False
+
+ALLOWED_HOSTS = os.environ.get('DJANGO_ALLOWED_HOSTS', 'localhost,127.0.0.1').split(',')
+
+# Every database (the directory and each shard) gets the same connection profile
+DATABASES = {
+    alias: {
+        **database,
+        # Reuse connections across requests; check them before reuse instead of failing mid-request
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # Seconds the sqlite3 module waits on a locked database before raising
+            'timeout': 20,
+        },
+    }
+    for alias, database in DATABASES.items()
+}
+
+# Applied to every new SQLite connection by kudos_app.sqlite.configure_sqlite
+KUDOS_SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'busy_timeout': 20000,  # ms, matches OPTIONS['timeout']
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,  # negative = KiB, i.e. 64 MiB
+    'temp_store': 'memory',
+}
+
+KUDOS_THROTTLE = True
@@ -9,6 +9,7 @@ import apiService from './api';
 function App() {
   const [currentUser, setCurrentUser] = useState(null);
   const [users, setUsers] = useState([]);
+  const [receivedKudos, setReceivedKudos] = useState(null);
   const [organizations, setOrganizations] = useState([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
@@ -45,12 +46,12 @@ function App() {
 
   const loadCurrentUser = async () => {
     try {
-      const userData = await apiService.getCurrentUser();
-      setCurrentUser(userData);
-      
-      // Load users from the same organization
-      const usersData = await apiService.getUsers();
-      setUsers(usersData);
+      // The user, the first page of their organization's directory and their first page of kudos in one request
+      const data = await apiService.getBootstrap();
+      setCurrentUser(data.user);
+      setReceivedKudos(data.kudos_received);
+      // The kudo form's dropdown lists everyone, so follow the directory's remaining pages
+      setUsers(await apiService.getAllUsers(data.users));
       
       setError(null);
     } catch (err) {
@@ -62,11 +63,13 @@ function App() {
         apiService.setCurrentUser(null);
         setCurrentUser(null);
         setUsers([]);
+        setReceivedKudos(null);
         setError(null); // Don't show error, just go back to user selection
       } else {
         setError('Failed to load user data: ' + err.message);
         setCurrentUser(null);
         setUsers([]);
+        setReceivedKudos(null);
         apiService.setCurrentUser(null);
       }
     }
@@ -126,6 +129,7 @@ function App() {
                   apiService.setCurrentUser(null);
                   setCurrentUser(null);
                   setUsers([]);
+                  setReceivedKudos(null);
                 }}
               >
                 Switch User
@@ -151,7 +155,7 @@ function App() {
 
               <div className="received-kudos-section">
                 <h2>Kudos You've Received</h2>
-                <KudosList userId={currentUser.id} />
+                <KudosList userId={currentUser.id} initialPage={receivedKudos} />
               </div>
             </div>
           </div>
@@ -1,5 +1,14 @@
 const API_BASE_URL = 'http://localhost:8000/api';
 
+// Extract the opaque cursor token from a paginated response's next/previous link
+export function cursorFromLink(link) {
+  return link ? new URL(link).searchParams.get('cursor') : null;
+}
+
+function withCursor(url, cursor) {
+  return cursor ? `${url}?cursor=${encodeURIComponent(cursor)}` : url;
+}
+
 class ApiService {
   constructor() {
     this.currentUserId = localStorage.getItem('currentUserId') || null;
@@ -35,7 +44,7 @@ class ApiService {
         const errorMessage = errorData.error || `HTTP error! status: ${response.status}`;
         
         // Handle specific error cases
-        if (response.status === 404 && url.includes('/users/me/')) {
+        if (response.status === 404 && (url.includes('/users/me/') || url.includes('/bootstrap/'))) {
           throw new Error('Invalid user ID');
         }
         
@@ -51,21 +60,38 @@ class ApiService {
     }
   }
 
+  // Initial load in one request: { user, users (first directory page), kudos_received (first page) }
+  async getBootstrap() {
+    return this.makeRequest('/bootstrap/');
+  }
+
   // User endpoints
   async getCurrentUser() {
     return this.makeRequest('/users/me/');
   }
 
-  async getUsers() {
-    return this.makeRequest('/users/');
+  async getUsers(cursor = null) {
+    return this.makeRequest(withCursor('/users/', cursor));
+  }
+
+  // Follow every page of the directory (used where the whole list is needed, e.g. the kudo form dropdown),
+  // starting from a page already loaded (e.g. the bootstrap's) when given one
+  async getAllUsers(firstPage = null) {
+    let page = firstPage || await this.getUsers();
+    const users = [...page.results];
+    while (page.next) {
+      page = await this.getUsers(cursorFromLink(page.next));
+      users.push(...page.results);
+    }
+    return users;
   }
 
   async getOrganizations() {
     return this.makeRequest('/organizations/');
   }
 
-  async getUsersByOrganization(orgId) {
-    return this.makeRequest(`/organizations/${orgId}/users/`);
+  async getUsersByOrganization(orgId, cursor = null) {
+    return this.makeRequest(withCursor(`/organizations/${orgId}/users/`, cursor));
   }
 
   // Kudo endpoints
@@ -79,8 +105,29 @@ class ApiService {
     });
   }
 
-  async getReceivedKudos() {
-    return this.makeRequest('/kudos/received/');
+  // items: [{ receiver, message }, ...]; returns per-item results
+  async giveKudos(items) {
+    return this.makeRequest('/kudos/batch/', {
+      method: 'POST',
+      body: JSON.stringify(items),
+    });
+  }
+
+  async getReceivedKudos(cursor = null) {
+    return this.makeRequest(withCursor('/kudos/received/', cursor));
+  }
+
+  // Subscribe to newly received kudos over Server-Sent Events (needs the ASGI server).
+  // EventSource cannot send headers, so the user id and resume position go in the query string;
+  // on reconnect the browser resumes from the last event id by itself.
+  openKudoStream(newestKudo, onKudo) {
+    const params = new URLSearchParams({ user_id: this.currentUserId });
+    if (newestKudo) {
+      params.set('last_event_id', `${newestKudo.created_at},${newestKudo.id}`);
+    }
+    const source = new EventSource(`${API_BASE_URL}/kudos/stream/?${params}`);
+    source.addEventListener('kudo', (event) => onKudo(JSON.parse(event.data)));
+    return source;
   }
 }
 
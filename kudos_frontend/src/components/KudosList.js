@@ -1,21 +1,54 @@
-import React, { useState, useEffect } from 'react';
-import apiService from '../api';
+import React, { useState, useEffect, useRef } from 'react';
+import apiService, { cursorFromLink } from '../api';
 
-function KudosList({ userId }) {
+// initialPage: the first page of received kudos when the caller already has it (from /bootstrap/)
+function KudosList({ userId, initialPage }) {
   const [kudos, setKudos] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [error, setError] = useState(null);
+  const sentinelRef = useRef(null);
 
   useEffect(() => {
     loadKudos();
   }, [userId]);
 
+  // Once the first page is in, prepend new kudos as the server pushes them
+  useEffect(() => {
+    if (loading || error) {
+      return undefined;
+    }
+
+    const source = apiService.openKudoStream(kudos[0], (kudo) => {
+      setKudos(prev => (prev.some(existing => existing.id === kudo.id) ? prev : [kudo, ...prev]));
+    });
+    return () => source.close();
+  }, [userId, loading, error]);
+
+  // Fetch the next page when the bottom of the list scrolls into view
+  useEffect(() => {
+    const sentinel = sentinelRef.current;
+    if (!sentinel || !nextCursor) {
+      return undefined;
+    }
+
+    const observer = new IntersectionObserver((entries) => {
+      if (entries[0].isIntersecting) {
+        loadMoreKudos();
+      }
+    });
+    observer.observe(sentinel);
+    return () => observer.disconnect();
+  }, [nextCursor, loadingMore]);
+
   const loadKudos = async () => {
     try {
       setLoading(true);
       setError(null);
-      const kudosData = await apiService.getReceivedKudos();
-      setKudos(kudosData);
+      const page = initialPage || await apiService.getReceivedKudos();
+      setKudos(page.results);
+      setNextCursor(cursorFromLink(page.next));
     } catch (err) {
       setError('Failed to load kudos: ' + err.message);
     } finally {
@@ -23,6 +56,23 @@ function KudosList({ userId }) {
     }
   };
 
+  const loadMoreKudos = async () => {
+    if (loadingMore || !nextCursor) {
+      return;
+    }
+
+    try {
+      setLoadingMore(true);
+      const page = await apiService.getReceivedKudos(nextCursor);
+      setKudos(prev => [...prev, ...page.results]);
+      setNextCursor(cursorFromLink(page.next));
+    } catch (err) {
+      setError('Failed to load more kudos: ' + err.message);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const formatDate = (dateString) => {
     const date = new Date(dateString);
     return date.toLocaleDateString('en-US', {
@@ -66,7 +116,7 @@ function KudosList({ userId }) {
   return (
     <div className="kudos-list">
       <div className="kudos-count">
-        You've received <strong>{kudos.length}</strong> {kudos.length === 1 ? 'kudo' : 'kudos'}!
+        You've received <strong>{kudos.length}{nextCursor ? '+' : ''}</strong> {kudos.length === 1 && !nextCursor ? 'kudo' : 'kudos'}!
       </div>
       
       <div className="kudos-items">
@@ -91,6 +141,12 @@ function KudosList({ userId }) {
           </div>
         ))}
       </div>
+
+      {nextCursor && (
+        <div ref={sentinelRef} className="loading">
+          {loadingMore ? 'Loading more kudos...' : ''}
+        </div>
+      )}
     </div>
   );
 }
@@ -1,29 +1,54 @@
-import React, { useState, useEffect } from 'react';
-import apiService from '../api';
+import React, { useState, useEffect, useRef } from 'react';
+import apiService, { cursorFromLink } from '../api';
 
 function UserSelector({ organizations, onUserSelect }) {
   const [selectedOrg, setSelectedOrg] = useState('');
   const [users, setUsers] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState(null);
+  const sentinelRef = useRef(null);
 
   useEffect(() => {
     if (selectedOrg) {
       loadUsers(selectedOrg);
     } else {
       setUsers([]);
+      setNextCursor(null);
     }
   }, [selectedOrg]);
 
-  const loadUsers = async (orgId) => {
+  // Fetch the next page of the directory when the end of the grid scrolls into view
+  useEffect(() => {
+    const sentinel = sentinelRef.current;
+    if (!sentinel || !nextCursor) {
+      return undefined;
+    }
+
+    const observer = new IntersectionObserver((entries) => {
+      if (entries[0].isIntersecting) {
+        loadUsers(selectedOrg, nextCursor);
+      }
+    });
+    observer.observe(sentinel);
+    return () => observer.disconnect();
+  }, [selectedOrg, nextCursor, loading]);
+
+  const loadUsers = async (orgId, cursor = null) => {
+    if (cursor && loading) {
+      return;
+    }
+
     try {
       setLoading(true);
       setError(null);
-      const usersData = await apiService.getUsersByOrganization(orgId);
-      setUsers(usersData);
+      const page = await apiService.getUsersByOrganization(orgId, cursor);
+      setUsers(prev => (cursor ? [...prev, ...page.results] : page.results));
+      setNextCursor(cursorFromLink(page.next));
     } catch (err) {
       setError('Failed to load users: ' + err.message);
       setUsers([]);
+      setNextCursor(null);
     } finally {
       setLoading(false);
     }
@@ -68,6 +93,7 @@ function UserSelector({ organizations, onUserSelect }) {
                   <div className="org-name">{user.organization_name}</div>
                 </button>
               ))}
+              {nextCursor && <div ref={sentinelRef} className="loading" />}
             </div>
           )}
           {!loading && users.length === 0 && selectedOrg && (